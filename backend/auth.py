@@ -0,0 +1,68 @@
+"""
+Auth Module
+
+Bearer tokens for users who signed up or logged in. A token carries the user
+id and an expiry, signed with HMAC-SHA256 under AUTH_SECRET_KEY, so every
+worker sharing the key verifies it without a session lookup.
+
+Without AUTH_SECRET_KEY each process signs with a random key of its own:
+tokens then stop working on restart and are only accepted by the worker
+that issued them.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from typing import Optional
+
+TOKEN_TTL = float(os.getenv("AUTH_TOKEN_TTL", str(7 * 24 * 3600)))
+
+class InvalidToken(Exception):
+    pass
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+class TokenSigner:
+    def __init__(self, secret: bytes, ttl: float = TOKEN_TTL):
+        self._secret = secret
+        self.ttl = ttl
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, user_id: str, now: Optional[float] = None) -> str:
+        expires = int((time.time() if now is None else now) + self.ttl)
+        payload = _b64encode(f"{user_id}|{expires}".encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str, now: Optional[float] = None) -> str:
+        """
+        The user id the token was issued to; raises InvalidToken if it is forged or expired
+        """
+        payload, _, signature = token.partition(".")
+        try:
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                raise InvalidToken("Invalid token signature")
+            user_id, expires = _b64decode(payload).decode("utf-8").rsplit("|", 1)
+            expired = int(expires) < (time.time() if now is None else now)
+        except (ValueError, TypeError) as e:
+            raise InvalidToken("Malformed token") from e
+        if expired:
+            raise InvalidToken("Token expired")
+        return user_id
+
+def create_signer() -> TokenSigner:
+    secret = os.getenv("AUTH_SECRET_KEY")
+    if not secret:
+        print("AUTH_SECRET_KEY is not set; tokens are signed with a per-process key")
+        return TokenSigner(secrets.token_bytes(32))
+    return TokenSigner(secret.encode("utf-8"))
+
+token_signer = create_signer()
@@ -0,0 +1,126 @@
+"""
+Card Sync Module
+
+Keeps a worker's in-process card state (feed, search, hot ranking and
+eligibility indexes, response cache versions) in step with the card writes
+of other workers sharing the same database.
+
+Every card write is logged to card_changes with the origin of the process
+that made it. CardSync polls the log every CARD_SYNC_INTERVAL seconds and
+hands the changes made elsewhere to a callback, so another worker's cards,
+swipes and mints show up here within COUNTER_FLUSH_INTERVAL +
+CARD_SYNC_INTERVAL seconds. Until then this worker may serve the older
+values (and answer 304s for them).
+
+Log ids are assigned when a change is inserted but may become visible out of
+order, so the cursor only moves past changes older than SETTLE_SECONDS and
+the newer ones are read again and skipped by id. Changes are pruned after
+CARD_CHANGE_RETENTION seconds.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from storage import Repository
+
+SYNC_INTERVAL = float(os.getenv("CARD_SYNC_INTERVAL", "1.0"))
+RETENTION_SECONDS = float(os.getenv("CARD_CHANGE_RETENTION", "3600"))
+SETTLE_SECONDS = 5.0
+PAGE_SIZE = 1000
+
+ApplyFn = Callable[[List[dict]], Awaitable[None]]
+
+class CardSync:
+    def __init__(
+        self,
+        repository: Repository,
+        apply: ApplyFn,
+        interval: float = SYNC_INTERVAL,
+        retention_seconds: float = RETENTION_SECONDS
+    ):
+        self.repository = repository
+        self._apply = apply
+        self.interval = interval
+        self.retention_seconds = retention_seconds
+        self._cursor = 0
+        # Ids above the cursor that were already read, with their creation time
+        self._seen: Dict[int, datetime] = {}
+        self._last_prune: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"polls": 0, "failed_polls": 0, "applied_changes": 0, "skipped_own_changes": 0}
+
+    async def reset(self) -> None:
+        """
+        Starts following the log from its current end; call before loading cards
+        """
+        self._cursor = await self.repository.last_card_change_id()
+        self._seen.clear()
+
+    async def poll(self) -> int:
+        """
+        Applies the changes other workers made since the last poll; returns how many
+        """
+        changes = []
+        after = self._cursor
+        while True:
+            page = await self.repository.list_card_changes(after, PAGE_SIZE)
+            changes.extend(change for change in page if change["id"] not in self._seen)
+            if len(page) < PAGE_SIZE:
+                break
+            after = page[-1]["id"]
+
+        foreign = []
+        for change in changes:
+            self._seen[change["id"]] = change["created_at"]
+            if change["origin"] == self.repository.origin:
+                self._stats["skipped_own_changes"] += 1
+            else:
+                foreign.append(change)
+        if foreign:
+            await self._apply(foreign)
+            self._stats["applied_changes"] += len(foreign)
+
+        settled = datetime.now() - timedelta(seconds=SETTLE_SECONDS)
+        for change_id, created_at in list(self._seen.items()):
+            if created_at < settled:
+                self._cursor = max(self._cursor, change_id)
+        self._seen = {
+            change_id: created_at for change_id, created_at in self._seen.items() if change_id > self._cursor
+        }
+        self._stats["polls"] += 1
+        return len(foreign)
+
+    async def _prune(self) -> None:
+        now = datetime.now()
+        if self._last_prune is not None and (now - self._last_prune).total_seconds() < self.retention_seconds / 10:
+            return
+        self._last_prune = now
+        await self.repository.prune_card_changes(now - timedelta(seconds=self.retention_seconds))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+                await self._prune()
+            except Exception as e:
+                print(f"Card sync failed: {e}")
+                self._stats["failed_polls"] += 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {**self._stats, "cursor": self._cursor, "unsettled_changes": len(self._seen)}
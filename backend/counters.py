@@ -0,0 +1,126 @@
+"""
+Counter Aggregation Module
+
+Write-behind buffering for hot per-card counters such as correct_count.
+Each worker process owns its own shard: an increment only touches a local
+dict, and the accumulated deltas are flushed to storage as one batch.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+FlushFn = Callable[[Dict[str, int]], Awaitable[None]]
+
+class CounterAggregator:
+    def __init__(self, flush: FlushFn, interval: float = 1.0, max_pending: int = 10000):
+        self._flush_fn = flush
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: Dict[str, int] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._oldest_pending: Optional[float] = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "flushes": 0,
+            "failed_flushes": 0,
+            "flushed_increments": 0,
+            "last_flush_size": 0,
+            "last_flush_lag_seconds": 0.0,
+            "max_flush_lag_seconds": 0.0,
+        }
+
+    def increment(self, key: str, delta: int = 1) -> None:
+        if not self._pending:
+            self._oldest_pending = time.monotonic()
+        self._pending[key] = self._pending.get(key, 0) + delta
+        if len(self._pending) >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self, key: str) -> int:
+        """
+        Increments not yet visible in storage, including a batch being written
+        """
+        return self._pending.get(key, 0) + self._in_flight.get(key, 0)
+
+    def apply(self, card: dict, field: str = "correct_count") -> dict:
+        """
+        Returns the card with its counted-so-far value; the stored dict is not modified
+        """
+        delta = self.pending(card["id"])
+        if not delta:
+            return card
+        return {**card, field: card[field] + delta}
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            oldest, self._oldest_pending = self._oldest_pending, None
+            self._in_flight = batch
+            try:
+                await self._flush_fn(batch)
+            except asyncio.CancelledError:
+                # Kept for the next flush rather than dropped with the task
+                self._requeue(batch, oldest)
+                raise
+            except Exception as e:
+                print(f"Counter flush failed: {e}")
+                self._stats["failed_flushes"] += 1
+                self._requeue(batch, oldest)
+                return 0
+            finally:
+                self._in_flight = {}
+
+            lag = time.monotonic() - oldest if oldest is not None else 0.0
+            self._stats["flushes"] += 1
+            self._stats["flushed_increments"] += sum(batch.values())
+            self._stats["last_flush_size"] = len(batch)
+            self._stats["last_flush_lag_seconds"] = lag
+            self._stats["max_flush_lag_seconds"] = max(self._stats["max_flush_lag_seconds"], lag)
+            return len(batch)
+
+    def _requeue(self, batch: Dict[str, int], oldest: Optional[float]) -> None:
+        for key, delta in batch.items():
+            self._pending[key] = self._pending.get(key, 0) + delta
+        if self._oldest_pending is None or (oldest is not None and oldest < self._oldest_pending):
+            self._oldest_pending = oldest
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Lets a flush in progress finish, then writes whatever is still pending
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+
+    def metrics(self) -> dict:
+        pending_since = self._oldest_pending
+        return {
+            **self._stats,
+            "pending_keys": len(self._pending),
+            "pending_increments": sum(self._pending.values()),
+            "pending_lag_seconds": time.monotonic() - pending_since if pending_since else 0.0,
+        }
@@ -0,0 +1,187 @@
+"""
+NFT Eligibility Module
+
+Maintains the indexes needed to decide NFT eligibility for a card without
+scanning every card.
+
+EligibilityTracker is fed card creation and interaction events and keeps
+each card's eligibility up to date as they arrive, so checks are lookups and
+the mint candidates can be paged from an ordered eligible set.
+"""
+
+import bisect
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from feed import DEFAULT_PAGE_SIZE, FeedKey, decode_cursor, encode_cursor
+
+HIGH_ENGAGEMENT_THRESHOLD = 100
+
+class FirstCardOfDayIndex:
+    """
+    Earliest card per calendar day, updated as cards are created
+    """
+
+    def __init__(self):
+        self._first: Dict[date, Tuple[datetime, str]] = {}
+
+    def clear(self) -> None:
+        self._first.clear()
+
+    def add(self, card: dict) -> None:
+        key = (card["created_at"], card["id"])
+        day = key[0].date()
+        current = self._first.get(day)
+        if current is None or key < current:
+            self._first[day] = key
+
+    def first_card_id(self, day: date) -> Optional[str]:
+        entry = self._first.get(day)
+        return entry[1] if entry else None
+
+    def is_first_of_day(self, card: dict) -> bool:
+        return self.first_card_id(card["created_at"].date()) == card["id"]
+
+class CardState:
+    __slots__ = ("created_at", "correct_count", "minted")
+
+    def __init__(self, created_at: datetime, correct_count: int, minted: bool):
+        self.created_at = created_at
+        self.correct_count = correct_count
+        self.minted = minted
+
+class EligibilityTracker:
+    """
+    Per-card eligibility maintained from card events
+    A card is eligible with 100+ correct swipes (high_engagement) or as the
+    first card created today (first_card_of_day). Eligible cards that have
+    not been minted are kept in (created_at, id) order for paging.
+    """
+
+    def __init__(self, threshold: int = HIGH_ENGAGEMENT_THRESHOLD):
+        self.threshold = threshold
+        self.first_cards = FirstCardOfDayIndex()
+        self._cards: Dict[str, CardState] = {}
+        self._candidates: List[FeedKey] = []
+        self._candidate_ids: Set[str] = set()
+        # Today's first card; the claim lapses at midnight
+        self._first_today: Optional[Tuple[date, str]] = None
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self._cards
+
+    def clear(self) -> None:
+        self.first_cards.clear()
+        self._cards.clear()
+        self._candidates.clear()
+        self._candidate_ids.clear()
+        self._first_today = None
+
+    def card_created(self, card: dict) -> None:
+        if card["id"] in self._cards:
+            return
+        self._cards[card["id"]] = CardState(
+            card["created_at"], card["correct_count"], bool(card.get("nft_status"))
+        )
+        self.first_cards.add(card)
+        today = date.today()
+        if card["created_at"].date() == today and self.first_cards.first_card_id(today) == card["id"]:
+            previous = self._first_today
+            self._first_today = (today, card["id"])
+            if previous is not None:
+                self._update(previous[1])
+        self._update(card["id"])
+
+    def interaction(self, card_id: str, correct: int = 1) -> None:
+        state = self._cards.get(card_id)
+        if state is None:
+            return
+        before = state.correct_count
+        state.correct_count += correct
+        if before < self.threshold <= state.correct_count:
+            self._update(card_id)
+
+    def minted(self, card_id: str) -> None:
+        state = self._cards.get(card_id)
+        if state is not None and not state.minted:
+            state.minted = True
+            self._update(card_id)
+
+    def _expire_first_of_day(self) -> None:
+        if self._first_today is not None and self._first_today[0] != date.today():
+            card_id = self._first_today[1]
+            self._first_today = None
+            self._update(card_id)
+
+    def reasons(self, card_id: str) -> List[str]:
+        state = self._cards[card_id]
+        reasons = []
+        if state.correct_count >= self.threshold:
+            reasons.append("high_engagement")
+        if self._first_today is not None and self._first_today[1] == card_id:
+            reasons.append("first_card_of_day")
+        return reasons
+
+    def _update(self, card_id: str) -> None:
+        state = self._cards[card_id]
+        key = (state.created_at, card_id)
+        candidate = not state.minted and bool(self.reasons(card_id))
+        if candidate and card_id not in self._candidate_ids:
+            self._candidate_ids.add(card_id)
+            bisect.insort(self._candidates, key)
+        elif not candidate and card_id in self._candidate_ids:
+            self._candidate_ids.discard(card_id)
+            del self._candidates[bisect.bisect_left(self._candidates, key)]
+
+    def evaluate(self, card_id: str) -> Optional[dict]:
+        """
+        Eligibility of a tracked card, or None if the card is unknown
+        A minted card is never eligible again; its reasons are still reported
+        """
+        state = self._cards.get(card_id)
+        if state is None:
+            return None
+        self._expire_first_of_day()
+        reasons = self.reasons(card_id)
+        return {
+            "eligible": not state.minted and bool(reasons),
+            "minted": state.minted,
+            "reasons": reasons,
+            "requirements": {
+                "correct_count": {
+                    "current": state.correct_count,
+                    "required": self.threshold
+                }
+            }
+        }
+
+    def page(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Returns one page of unminted eligible cards, newest first, and the
+        cursor for the next page
+        """
+        self._expire_first_of_day()
+        keys = self._candidates
+        end = len(keys) if cursor is None else bisect.bisect_left(keys, decode_cursor(cursor))
+        start = max(0, end - limit)
+        page = keys[start:end][::-1]
+        next_cursor = encode_cursor(page[-1]) if page and start > 0 else None
+        return [
+            {
+                "card_id": card_id,
+                "created_at": created_at,
+                "correct_count": self._cards[card_id].correct_count,
+                "reasons": self.reasons(card_id)
+            }
+            for created_at, card_id in page
+        ], next_cursor
+
+    def metrics(self) -> dict:
+        return {"tracked_cards": len(self._cards), "candidates": len(self._candidates)}
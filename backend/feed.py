@@ -0,0 +1,91 @@
+"""
+Card Feed Module
+
+Keeps knowledge cards in a (created_at, id) ordered index, plus an inverted
+tag index, so the feed can be served one page at a time with opaque cursors
+instead of materializing every card on every request.
+"""
+
+import base64
+import bisect
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+FeedKey = Tuple[datetime, str]
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(key: FeedKey) -> str:
+    raw = f"{key[0].isoformat()}|{key[1]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> FeedKey:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, card_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), card_id
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+def _insert(keys: List[FeedKey], key: FeedKey) -> None:
+    # Cards almost always arrive in creation order, so appending is the fast path
+    if not keys or key > keys[-1]:
+        keys.append(key)
+    else:
+        bisect.insort(keys, key)
+
+class FeedIndex:
+    """
+    Ordered index of card keys, newest first when paged
+    A page costs O(log n) to locate the cursor plus O(limit) to slice
+    """
+
+    def __init__(self):
+        self._keys: List[FeedKey] = []
+        self._tags: Dict[str, List[FeedKey]] = {}
+        # Card id -> author id
+        self._authors: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self._authors
+
+    def author(self, card_id: str) -> Optional[str]:
+        return self._authors.get(card_id)
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._tags.clear()
+        self._authors.clear()
+
+    def add(self, card: dict) -> None:
+        if card["id"] in self._authors:
+            return
+        self._authors[card["id"]] = card["author_id"]
+        key = (card["created_at"], card["id"])
+        _insert(self._keys, key)
+        for tag in set(card.get("tags") or []):
+            _insert(self._tags.setdefault(tag, []), key)
+
+    def page(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        tag: Optional[str] = None
+    ) -> Tuple[List[str], Optional[str]]:
+        """
+        Returns the card ids of one page and the cursor for the next page
+        The cursor is None once the end of the feed has been reached
+        """
+        keys = self._keys if tag is None else self._tags.get(tag, [])
+        end = len(keys) if cursor is None else bisect.bisect_left(keys, decode_cursor(cursor))
+        start = max(0, end - limit)
+        page = keys[start:end][::-1]
+        next_cursor = encode_cursor(page[-1]) if page and start > 0 else None
+        return [card_id for _, card_id in page], next_cursor
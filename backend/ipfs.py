@@ -0,0 +1,329 @@
+"""
+IPFS Module
+
+Publishes NFT metadata and card media to IPFS through an IPFS HTTP API
+(Kubo's /api/v0/add).
+
+Metadata is serialized canonically (sorted keys, no insignificant
+whitespace, UTF-8), so the same card always produces the same bytes, and its
+CID is computed locally: a CIDv1 with the raw codec over a sha2-256
+multihash, which is what the node assigns with raw-leaves to content that
+fits in one block. Content whose CID is already in the local pin cache is
+not uploaded again. Media files from media_urls are uploaded concurrently
+with bounded parallelism through one pooled httpx client, streamed from disk
+in chunks read on worker threads, and keyed in the pin cache by their
+content hash. The pin cache is written to disk at most once every
+IPFS_PIN_CACHE_FLUSH_DELAY seconds; pins added since the last write are only
+lost on a crash, which costs a repeated (idempotent) upload.
+
+With IPFS_MOCK_NODE=1 (the default) uploads go in-process to the stub in
+mock_ipfs_node; set it to 0 to use IPFS_API_URL.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import uuid
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from media import MEDIA_NAME, media_store
+
+IPFS_API_URL = os.getenv("IPFS_API_URL", "http://localhost:5001")
+USE_MOCK_NODE = os.getenv("IPFS_MOCK_NODE", "1") == "1"
+IPFS_TIMEOUT = float(os.getenv("IPFS_TIMEOUT", "60"))
+MAX_PARALLEL_UPLOADS = int(os.getenv("IPFS_MAX_PARALLEL_UPLOADS", "4"))
+PIN_CACHE_PATH = os.getenv("IPFS_PIN_CACHE_PATH", "ipfs_pins.json")
+PIN_CACHE_FLUSH_DELAY = float(os.getenv("IPFS_PIN_CACHE_FLUSH_DELAY", "1.0"))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Files stored before the content-addressed media store
+LEGACY_UPLOAD_ROOT = "uploads"
+
+# CIDv1 header: version 1, raw codec (0x55), sha2-256 multihash of 32 bytes
+RAW_CID_PREFIX = bytes([0x01, 0x55, 0x12, 0x20])
+
+def canonical_json(data: dict) -> bytes:
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def raw_cid(data: bytes) -> str:
+    """
+    Base32 CIDv1 of data stored as a single raw block
+    """
+    cid = RAW_CID_PREFIX + hashlib.sha256(data).digest()
+    return "b" + base64.b32encode(cid).decode("ascii").lower().rstrip("=")
+
+class PinCache:
+    """
+    Content key (a CID or sha256:<hex>) to the CID the node pinned it under,
+    persisted to a JSON file so restarts do not upload everything again
+    """
+
+    def __init__(self, path: Optional[str] = PIN_CACHE_PATH, flush_delay: float = PIN_CACHE_FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._pins: Dict[str, str] = {}
+        self._loaded = False
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._save_lock = asyncio.Lock()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._pins = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable IPFS pin cache {self.path}: {e}")
+
+    def get(self, key: str) -> Optional[str]:
+        self._load()
+        return self._pins.get(key)
+
+    async def add(self, key: str, cid: str) -> None:
+        self._load()
+        self._pins[key] = cid
+        if not self.path:
+            return
+        self._dirty = True
+        # Pins added before the delay runs out go into the same write
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        self._dirty = False
+        async with self._save_lock:
+            try:
+                await asyncio.to_thread(self._write, dict(self._pins))
+            except OSError as e:
+                print(f"Failed to write IPFS pin cache {self.path}: {e}")
+                self._dirty = True
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def _write(self, pins: Dict[str, str]) -> None:
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pins, f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._pins)
+
+ADD_PARAMS = {"cid-version": 1, "raw-leaves": "true", "pin": "true"}
+
+class IPFSClient:
+    def __init__(self, api_url: str = IPFS_API_URL, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.api_url = api_url
+        self.transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.api_url,
+                timeout=IPFS_TIMEOUT,
+                limits=httpx.Limits(max_connections=MAX_PARALLEL_UPLOADS * 2),
+                transport=self.transport
+            )
+        return self._http
+
+    async def add(self, filename: str, content: bytes) -> str:
+        """
+        Uploads and pins content; returns its CID
+        """
+        response = await self.http.post(
+            "/api/v0/add",
+            params=ADD_PARAMS,
+            files={"file": (filename, content)}
+        )
+        response.raise_for_status()
+        return response.json()["Hash"]
+
+    async def add_file(self, path: str, size: int) -> str:
+        """
+        Uploads and pins a file, streaming it from disk without blocking the event loop
+        """
+        boundary = uuid.uuid4().hex
+        filename = os.path.basename(path).replace('"', "%22")
+        head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+
+        async def body():
+            yield head
+            f = await asyncio.to_thread(open, path, "rb")
+            try:
+                while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+                    yield chunk
+            finally:
+                await asyncio.to_thread(f.close)
+            yield tail
+
+        response = await self.http.post(
+            "/api/v0/add",
+            params=ADD_PARAMS,
+            content=body(),
+            headers={
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+                "Content-Length": str(len(head) + size + len(tail)),
+            }
+        )
+        response.raise_for_status()
+        return response.json()["Hash"]
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+class MetadataPublisher:
+    def __init__(
+        self,
+        client: IPFSClient,
+        pins: PinCache,
+        max_parallel_uploads: int = MAX_PARALLEL_UPLOADS
+    ):
+        self.client = client
+        self.pins = pins
+        self._upload_slots = asyncio.Semaphore(max_parallel_uploads)
+        self._uploads: Dict[str, asyncio.Future] = {}
+        self.stats = {"uploads": 0, "skipped": 0, "bytes_uploaded": 0, "cid_mismatches": 0}
+
+    async def publish(self, metadata: dict) -> Tuple[str, dict]:
+        """
+        Uploads the media and then the metadata; returns the metadata's ipfs://
+        URI and the metadata as published, with media URLs rewritten to IPFS
+        """
+        media_urls = metadata.get("mediaUrls") or []
+        published_urls = await asyncio.gather(*(self._publish_media(url) for url in media_urls))
+        published = {**metadata, "mediaUrls": list(published_urls)}
+
+        data = canonical_json(published)
+        local_cid = raw_cid(data)
+        cid = await self._single_flight(local_cid, lambda: self._upload_bytes(local_cid, "metadata.json", data))
+        return f"ipfs://{cid}", published
+
+    async def _publish_media(self, url: str) -> str:
+        path, key = self._local_media(url)
+        if path is None:
+            # Hosted elsewhere; referenced as-is
+            return url
+        cid = await self._single_flight(key, lambda: self._upload_file(key, path))
+        return f"ipfs://{cid}"
+
+    def _local_media(self, url: str) -> Tuple[Optional[str], Optional[str]]:
+        match = re.fullmatch(r"/media/([0-9a-f]{64}\.[a-z0-9]{1,10})", url)
+        if match and MEDIA_NAME.fullmatch(match.group(1)):
+            name = match.group(1)
+            path = media_store.path_for(name)
+            if os.path.exists(path):
+                return path, f"sha256:{name.split('.', 1)[0]}"
+        match = re.fullmatch(r"/static/([^/]+)", url)
+        if match:
+            # Legacy uploads are not content addressed, so hash them to get a key
+            path = os.path.join(LEGACY_UPLOAD_ROOT, match.group(1))
+            if os.path.exists(path):
+                return path, None
+        return None, None
+
+    async def _single_flight(self, key: Optional[str], upload) -> str:
+        if key is not None:
+            cid = self.pins.get(key)
+            if cid is not None:
+                self.stats["skipped"] += 1
+                return cid
+            job = self._uploads.get(key)
+            if job is not None:
+                return await asyncio.shield(job)
+        job = asyncio.ensure_future(upload())
+        if key is not None:
+            self._uploads[key] = job
+            job.add_done_callback(lambda _: self._uploads.pop(key, None))
+        return await asyncio.shield(job)
+
+    async def _upload_bytes(self, expected_cid: str, filename: str, data: bytes) -> str:
+        async with self._upload_slots:
+            cid = await self.client.add(filename, data)
+        self.stats["uploads"] += 1
+        self.stats["bytes_uploaded"] += len(data)
+        if cid != expected_cid:
+            # The node chunked it or uses other defaults; its CID is the one that resolves
+            print(f"IPFS node returned {cid}, expected {expected_cid}")
+            self.stats["cid_mismatches"] += 1
+        await self.pins.add(expected_cid, cid)
+        return cid
+
+    async def _upload_file(self, key: Optional[str], path: str) -> str:
+        if key is None:
+            key = f"sha256:{await asyncio.to_thread(_file_sha256, path)}"
+            cid = self.pins.get(key)
+            if cid is not None:
+                self.stats["skipped"] += 1
+                return cid
+        size = await asyncio.to_thread(os.path.getsize, path)
+        async with self._upload_slots:
+            cid = await self.client.add_file(path, size)
+        self.stats["uploads"] += 1
+        self.stats["bytes_uploaded"] += size
+        await self.pins.add(key, cid)
+        return cid
+
+    def metrics(self) -> dict:
+        return {**self.stats, "pinned": len(self.pins), "uploads_in_flight": len(self._uploads)}
+
+def _file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+_publisher: Optional[MetadataPublisher] = None
+
+def get_publisher() -> MetadataPublisher:
+    """
+    Returns the process-wide publisher, created from the environment on first use
+    """
+    global _publisher
+    if _publisher is None:
+        if USE_MOCK_NODE:
+            from mock_ipfs_node import app as mock_app
+
+            client = IPFSClient("http://mock-ipfs-node", transport=httpx.ASGITransport(app=mock_app))
+        else:
+            client = IPFSClient(IPFS_API_URL)
+        _publisher = MetadataPublisher(client, PinCache())
+    return _publisher
+
+async def close_publisher() -> None:
+    global _publisher
+    if _publisher is not None:
+        await _publisher.client.close()
+        await _publisher.pins.close()
+        _publisher = None
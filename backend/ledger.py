@@ -0,0 +1,258 @@
+"""
+Token Ledger Module
+
+Platform token balances kept as an append-only transaction log plus
+materialized balances.
+
+Every change is a transaction appended to storage (token_transactions)
+with a per-account sequence number; the balance in memory is only updated
+(and an account only cached) once the append has succeeded, so the log is
+always the source of truth. Changes to one account are serialized by a lock
+striped over account ids, which keeps the overdraft check and the append
+atomic without a global lock or a hot database row. Balances are read from
+memory in O(1).
+
+Accounts are opened at signup with the initial grant; reading an account
+that was never opened returns a zero balance and stores nothing.
+
+Dirty balances are snapshotted to token_balances every
+LEDGER_SNAPSHOT_INTERVAL seconds together with the seq they include. After a
+restart an account is loaded from its snapshot plus the transactions logged
+after it, so recovery never replays the whole log.
+
+Several processes may write the same account: an append whose seq another
+process has taken fails on the unique (user_id, seq) index, and the account
+is reloaded from storage and the change checked and appended again. A
+process's cached balance can lag other processes' writes until it next
+writes to that account.
+"""
+
+import asyncio
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from storage import ConflictError, Repository
+
+INITIAL_BALANCE = int(os.getenv("INITIAL_TOKEN_BALANCE", "15"))
+SNAPSHOT_INTERVAL = float(os.getenv("LEDGER_SNAPSHOT_INTERVAL", "30"))
+LOCK_STRIPES = int(os.getenv("LEDGER_LOCK_STRIPES", "1024"))
+MAX_CACHED_ACCOUNTS = int(os.getenv("LEDGER_MAX_CACHED_ACCOUNTS", "100000"))
+# Reloads of an account after losing an append to another process
+MAX_APPEND_ATTEMPTS = 5
+
+class InsufficientTokens(Exception):
+    def __init__(self, balance: int, required: int):
+        super().__init__(f"Balance {balance} is below the {required} tokens required")
+        self.balance = balance
+        self.required = required
+
+class Account:
+    __slots__ = ("balance", "seq", "snapshot_seq")
+
+    def __init__(self, balance: int, seq: int, snapshot_seq: int):
+        self.balance = balance
+        self.seq = seq
+        self.snapshot_seq = snapshot_seq
+
+class TokenLedger:
+    def __init__(
+        self,
+        repository: Repository,
+        snapshot_interval: float = SNAPSHOT_INTERVAL,
+        initial_balance: int = INITIAL_BALANCE,
+        lock_stripes: int = LOCK_STRIPES,
+        max_cached_accounts: int = MAX_CACHED_ACCOUNTS
+    ):
+        self.repository = repository
+        self.snapshot_interval = snapshot_interval
+        self.initial_balance = initial_balance
+        self.max_cached_accounts = max_cached_accounts
+        self._locks = [asyncio.Lock() for _ in range(lock_stripes)]
+        self._accounts: Dict[str, Account] = {}
+        self._snapshot_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "transactions": 0,
+            "rejected": 0,
+            "conflicts": 0,
+            "snapshots": 0,
+            "snapshotted_accounts": 0,
+            "replayed_transactions": 0,
+        }
+
+    def _lock(self, user_id: str) -> asyncio.Lock:
+        return self._locks[zlib.crc32(user_id.encode("utf-8")) % len(self._locks)]
+
+    async def _account(self, user_id: str) -> Account:
+        """
+        The account from the cache, or from its snapshot and the log tail; caller holds its lock
+        An account with no transactions (seq 0) does not exist yet and is not cached
+        """
+        account = self._accounts.get(user_id)
+        if account is not None:
+            return account
+        snapshot = await self.repository.get_balance_snapshot(user_id)
+        balance, seq = snapshot if snapshot is not None else (0, 0)
+        snapshot_seq = seq
+        for transaction in await self.repository.list_transactions(user_id, after_seq=seq):
+            balance += transaction["amount"]
+            seq = transaction["seq"]
+            self._stats["replayed_transactions"] += 1
+        account = Account(balance, seq, snapshot_seq)
+        if seq > 0:
+            self._accounts[user_id] = account
+        return account
+
+    async def _append(
+        self,
+        user_id: str,
+        amount: int,
+        kind: str,
+        card_id: Optional[str],
+        expected_seq: Optional[int] = None
+    ) -> Tuple[Optional[dict], Account]:
+        """
+        Checks and appends a change to the account; caller holds its lock
+        With expected_seq, nothing is appended (and None returned) unless the
+        account is still at that seq
+        """
+        for _ in range(MAX_APPEND_ATTEMPTS):
+            account = await self._account(user_id)
+            if expected_seq is not None and account.seq != expected_seq:
+                return None, account
+            if account.balance + amount < 0:
+                self._stats["rejected"] += 1
+                raise InsufficientTokens(account.balance, -amount)
+            transaction = {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "amount": amount,
+                "kind": kind,
+                "card_id": card_id,
+                "created_at": datetime.now(),
+                "seq": account.seq + 1,
+            }
+            try:
+                await self.repository.add_transactions([transaction])
+            except ConflictError:
+                # Another process appended to the account first; reload it and check again
+                self._accounts.pop(user_id, None)
+                self._stats["conflicts"] += 1
+                continue
+            account.balance += amount
+            account.seq = transaction["seq"]
+            self._accounts[user_id] = account
+            self._stats["transactions"] += 1
+            return transaction, account
+        raise ConflictError(f"Gave up appending to {user_id} after {MAX_APPEND_ATTEMPTS} conflicts")
+
+    async def balance(self, user_id: str) -> int:
+        """
+        The account's balance; 0 for an account that was never opened
+        """
+        account = self._accounts.get(user_id)
+        if account is not None:
+            return account.balance
+        async with self._lock(user_id):
+            return (await self._account(user_id)).balance
+
+    async def exists(self, user_id: str) -> bool:
+        if user_id in self._accounts:
+            return True
+        async with self._lock(user_id):
+            return (await self._account(user_id)).seq > 0
+
+    async def open_account(self, user_id: str) -> int:
+        """
+        Creates the account with its starting balance if it does not exist yet
+        and returns its balance; the only place the initial grant is made
+        """
+        async with self._lock(user_id):
+            # Another process may open it at the same time; only one grant is appended
+            _, account = await self._append(user_id, self.initial_balance, "initial_grant", None, expected_seq=0)
+            return account.balance
+
+    async def apply(
+        self,
+        user_id: str,
+        amount: int,
+        kind: str,
+        card_id: Optional[str] = None
+    ) -> Tuple[dict, int]:
+        """
+        Appends a credit (amount > 0) or debit (amount < 0) and returns the
+        transaction and the new balance; debits never take the balance below zero
+        """
+        async with self._lock(user_id):
+            transaction, account = await self._append(user_id, amount, kind, card_id)
+            return transaction, account.balance
+
+    async def history(self, user_id: str) -> List[dict]:
+        return await self.repository.list_transactions(user_id)
+
+    async def snapshot(self) -> int:
+        """
+        Writes the balances changed since the last snapshot; returns how many
+        """
+        async with self._snapshot_lock:
+            # Copied without awaiting, so every (balance, seq) pair is consistent
+            dirty = [
+                (user_id, account.balance, account.seq)
+                for user_id, account in self._accounts.items()
+                if account.seq != account.snapshot_seq
+            ]
+            if dirty:
+                try:
+                    await self.repository.save_balance_snapshots(dirty)
+                except Exception as e:
+                    print(f"Ledger snapshot failed: {e}")
+                    return 0
+                for user_id, _, seq in dirty:
+                    account = self._accounts.get(user_id)
+                    if account is not None:
+                        account.snapshot_seq = max(account.snapshot_seq, seq)
+                self._stats["snapshots"] += 1
+                self._stats["snapshotted_accounts"] += len(dirty)
+            self._evict_clean_accounts()
+            return len(dirty)
+
+    def _evict_clean_accounts(self) -> None:
+        excess = len(self._accounts) - self.max_cached_accounts
+        if excess <= 0:
+            return
+        for user_id in list(self._accounts):
+            account = self._accounts[user_id]
+            if account.seq == account.snapshot_seq and not self._lock(user_id).locked():
+                del self._accounts[user_id]
+                excess -= 1
+                if excess <= 0:
+                    break
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            await self.snapshot()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.snapshot()
+
+    def metrics(self) -> dict:
+        return {
+            **self._stats,
+            "cached_accounts": len(self._accounts),
+            "dirty_accounts": sum(1 for a in self._accounts.values() if a.seq != a.snapshot_seq),
+        }
@@ -1,11 +1,11 @@
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List, Optional
-import openai
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
+import hmac
 import uuid
 import os
 from datetime import datetime
@@ -13,37 +13,72 @@ from web3 import Web3
 from eth_account import Account
 from eth_utils import to_checksum_address
 import json
-from redis import asyncio as aioredis
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-from symbol_integration import router as symbol_router
 
+# Loaded before the local modules, which read their settings at import time
 load_dotenv()
 
-app = FastAPI(title="CardNote API")
+from ratelimit import RateLimiter, rate_limits, rate_limit_headers
+from cardnote_shared.metrics import MetricsMiddleware, registry, llm_collector, dict_collector, metrics_response, span
+from symbol_integration import router as symbol_router, symbol_indexer
+from symbol_client import symbol_client
+from feed import FeedIndex, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from eligibility import EligibilityTracker
+from search import SearchIndex
+from ranking import HotRanking
+from response_cache import response_cache, dumps, join_array
+from storage import create_repository
+from cardnote_shared.llm_gateway import get_gateway, close_gateway
+from counters import CounterAggregator
+from card_sync import CardSync
+from minting import mint_queue, MintJob
+from ledger import TokenLedger, InsufficientTokens
+from auth import InvalidToken, token_signer
+from ipfs import get_publisher, close_publisher
+from media import (
+    router as media_router, media_store, media_url, thumbnail_url,
+    UploadBudget, UploadTooLarge, UploadLimitMiddleware
+)
 
-# Configure OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+app = FastAPI(title="CardNote API")
 
-# Configure Redis and rate limiting
+# Configure Redis and rate limiting (in-process buckets if Redis is unavailable)
 @app.on_event("startup")
 async def startup():
-    try:
-        redis = await aioredis.from_url("redis://localhost", encoding="utf-8", decode_responses=True)
-        await FastAPILimiter.init(redis)
-        print("Redis connected successfully")
-    except Exception as e:
-        print(f"Redis connection failed: {e}")
-        print("Rate limiting disabled")
-        class DummyLimiter:
-            async def redis_request(self, *args, **kwargs):
-                return True
-        FastAPILimiter._redis = DummyLimiter()
-
-# Create uploads directory if it doesn't exist
-os.makedirs("uploads", exist_ok=True)
+    await rate_limits.connect(os.getenv("REDIS_URL", "redis://localhost"))
 
-# Mount static files directory
+# Connect storage and rebuild the in-process card indexes from it
+@app.on_event("startup")
+async def startup_storage():
+    await repository.connect()
+    feed_index.clear()
+    eligibility.clear()
+    search_index.clear()
+    hot_ranking.clear()
+    await card_sync.reset()
+    for card in await repository.list_cards():
+        index_card(card)
+    correct_counts.start()
+    card_sync.start()
+    token_ledger.start()
+    await symbol_indexer.start()
+    await mint_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_storage():
+    await mint_queue.stop()
+    await close_publisher()
+    await symbol_indexer.stop()
+    await card_sync.stop()
+    await correct_counts.stop()
+    await token_ledger.stop()
+    await repository.close()
+    await close_gateway()
+    await rate_limits.close()
+    await symbol_client.close()
+
+# Mount static files directory (serves files uploaded before the content-addressed store)
+# Created here too, since MEDIA_ROOT may point the media store elsewhere
+os.makedirs("uploads", exist_ok=True)
 app.mount("/static", StaticFiles(directory="uploads"), name="static")
 
 # Enable CORS
@@ -55,13 +90,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.middleware("http")(rate_limit_headers)
+# Rejects oversized uploads before the multipart body is parsed
+app.add_middleware(UploadLimitMiddleware, paths=("/api/upload/media",))
+# Outermost, so the latency covers the other middleware too
+app.add_middleware(MetricsMiddleware)
+registry.add_collector(llm_collector(get_gateway))
+registry.add_collector(dict_collector(
+    "ratelimit_rejections_total", "Requests rejected by rate limits", "scope",
+    lambda: rate_limits.metrics()["rejections"]
+))
+
 app.include_router(symbol_router)
+app.include_router(media_router)
 
-# Mock database (will be replaced with PostgreSQL)
-users = {}
-cards = {}
-token_transactions = {}
-nft_cards = {}  # Track NFT status of cards
+# Users, cards, token transactions and NFT records (backend chosen by DATABASE_URL)
+repository = create_repository(os.getenv("DATABASE_URL"))
+# "correct" swipes are buffered per worker and written to storage in batches
+correct_counts = CounterAggregator(
+    repository.increment_correct_counts,
+    interval=float(os.getenv("COUNTER_FLUSH_INTERVAL", "1.0"))
+)
+feed_index = FeedIndex()
+search_index = SearchIndex()
+hot_ranking = HotRanking()
+# Updated from card and interaction events instead of re-reading cards
+eligibility = EligibilityTracker()
+# Token balances, backed by the token_transactions log
+token_ledger = TokenLedger(repository)
+
+def index_card(card: dict) -> None:
+    feed_index.add(card)
+    eligibility.card_created(card)
+    search_index.add(card)
+    hot_ranking.add(card)
+
+async def apply_card_changes(changes: List[dict]) -> None:
+    """
+    Applies card writes made by other workers to this worker's indexes
+    """
+    saved = [change["card_id"] for change in changes if change["kind"] == "card"]
+    fresh = set()
+    for card in await repository.get_cards(saved):
+        if card["id"] not in feed_index:
+            fresh.add(card["id"])
+        index_card(card)
+    for change in changes:
+        card_id = change["card_id"]
+        # A card loaded above already counts the swipes logged with it
+        if change["kind"] == "correct" and card_id not in fresh:
+            eligibility.interaction(card_id, change["delta"])
+            hot_ranking.interaction(card_id, change["delta"], change["created_at"].timestamp())
+        elif change["kind"] == "nft":
+            eligibility.minted(card_id)
+        response_cache.invalidate(f"card:{card_id}")
+
+# Other workers' card writes, followed through the card_changes log
+card_sync = CardSync(repository, apply_card_changes)
+
+# Token economics: a new account's grant (INITIAL_TOKEN_BALANCE, 15) covers one
+# mint, each correct swipe costs the swiper and pays the card's author
+INTERACTION_TOKEN_COST = int(os.getenv("INTERACTION_TOKEN_COST", "2"))
+AUTHOR_TOKEN_REWARD = int(os.getenv("AUTHOR_TOKEN_REWARD", "1"))
+MINT_TOKEN_COST = int(os.getenv("MINT_TOKEN_COST", "15"))
+
+# Author of cards created without signing in
+ANONYMOUS_AUTHOR_ID = "mock_user_id"
+
+def authenticated_user_id(authorization: Optional[str] = Header(None)) -> Optional[str]:
+    """
+    The user the request's bearer token was issued to; None without a token
+    """
+    if authorization is None:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    try:
+        if scheme.lower() != "bearer":
+            raise InvalidToken("Not a bearer token")
+        return token_signer.verify(token.strip())
+    except InvalidToken:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+def require_user_id(user_id: Optional[str] = Depends(authenticated_user_id)) -> str:
+    if user_id is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Authentication required",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return user_id
 
 class User(BaseModel):
     email: str
@@ -74,6 +195,11 @@ class UserResponse(BaseModel):
     username: str
     token_balance: int
     created_at: datetime
+    access_token: str
+
+class LoginRequest(BaseModel):
+    email: str
+    password: str
 
 class KnowledgeCard(BaseModel):
     title: str
@@ -91,11 +217,27 @@ class CardResponse(BaseModel):
     correct_count: int
     created_at: datetime
     nft_status: Optional[dict] = None
+    thumbnail_urls: Optional[List[str]] = None
+    hot_score: Optional[float] = None
+
+class CardFeedPage(BaseModel):
+    cards: List[CardResponse]
+    next_cursor: Optional[str] = None
+
+class CardSearchResult(CardResponse):
+    score: float
+
+class CardSearchPage(BaseModel):
+    cards: List[CardSearchResult]
+    next_cursor: Optional[str] = None
 
 class NFTMintRequest(BaseModel):
     card_id: str
     user_address: str
 
+class BulkEligibilityRequest(BaseModel):
+    card_ids: List[str] = Field(..., max_length=500)
+
 class CardInteraction(BaseModel):
     interaction_type: str
 
@@ -117,15 +259,17 @@ async def chat_stream(
         messages = [{"role": "system", "content": f"あなたは{request.persona}として回答してください。"}]
         messages.extend([{"role": m.role, "content": m.content} for m in request.messages])
 
+        stream = get_gateway().stream(
+            messages,
+            model="gpt-3.5-turbo",
+            label=request.persona,
+            temperature=0.7,
+            max_tokens=150
+        )
         try:
-            response = await openai.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                stream=True,
-                temperature=0.7,
-                max_tokens=150
-            )
-            return StreamingResponse(process_stream(response))
+            # Wait for the first delta so upstream failures still surface as a 500
+            first = await anext(stream, "")
+            return StreamingResponse(process_stream(first, stream))
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -137,134 +281,328 @@ async def chat_stream(
             detail=f"エラーが発生しました: {str(e)}"
         )
 
-async def process_stream(response):
-    async for chunk in response:
-        if chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+async def process_stream(first, stream):
+    if first:
+        yield first
+    async for delta in stream:
+        yield delta
 
 @app.post("/api/auth/signup", response_model=UserResponse)
 async def signup(user: User):
     user_id = str(uuid.uuid4())
-    users[user_id] = {
+    new_user = {
         "id": user_id,
         "email": user.email,
         "username": user.username,
         "password": user.password,  # Would be hashed in production
-        "token_balance": 15,  # Initial balance
+        "token_balance": token_ledger.initial_balance,
         "created_at": datetime.now()
     }
-    return users[user_id]
+    await repository.save_user(new_user)
+    new_user["token_balance"] = await token_ledger.open_account(user_id)
+    new_user["access_token"] = token_signer.issue(user_id)
+    return new_user
+
+@app.post("/api/auth/login", response_model=UserResponse)
+async def login(credentials: LoginRequest):
+    user = await repository.find_user_by_email(credentials.email)
+    if user is None or not hmac.compare_digest(
+        user["password"].encode("utf-8"), credentials.password.encode("utf-8")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    user["token_balance"] = await token_ledger.balance(user["id"])
+    user["access_token"] = token_signer.issue(user["id"])
+    return user
 
 @app.post("/api/upload/media")
 async def upload_media(files: List[UploadFile] = File(...)):
+    budget = UploadBudget()
     saved_paths = []
     for file in files:
-        # Save file to /uploads
-        file_extension = file.filename.split(".")[-1]
-        unique_id = str(uuid.uuid4())
-        new_filename = f"{unique_id}.{file_extension}"
-        file_path = os.path.join("uploads", new_filename)
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        saved_paths.append(f"/static/{new_filename}")
+        # Stream file into the content-addressed media store
+        try:
+            name = await media_store.save(file, budget)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        saved_paths.append(media_url(name))
     return {"media_urls": saved_paths}
 
 @app.post("/api/cards", response_model=CardResponse)
-async def create_card(card: KnowledgeCard):
+async def create_card(card: KnowledgeCard, user_id: Optional[str] = Depends(authenticated_user_id)):
     card_id = str(uuid.uuid4())
-    cards[card_id] = {
+    new_card = {
         "id": card_id,
         "title": card.title,
         "content": card.content,
-        "author_id": "mock_user_id",  # Would come from auth in production
+        "author_id": user_id or ANONYMOUS_AUTHOR_ID,
         "media_urls": card.media_urls or [],
         "tags": card.tags or [],
         "correct_count": 0,
         "created_at": datetime.now()
     }
-    return cards[card_id]
+    await repository.save_card(new_card)
+    response_cache.invalidate(f"card:{card_id}")
+    index_card(new_card)
+    return new_card
+
+# Fields of a cached card; hot_score differs per response and is appended
+CARD_FIELDS = [name for name in CardResponse.model_fields if name != "hot_score"]
+
+async def card_fragments(card_ids: List[str]) -> Dict[str, bytes]:
+    """
+    Serialized cards, from the response cache where they are unchanged
+    """
+    fragments = {}
+    missing = {}
+    for card_id in card_ids:
+        data = response_cache.get(f"card:{card_id}")
+        if data is None:
+            missing[card_id] = response_cache.version(f"card:{card_id}")
+        else:
+            fragments[card_id] = data
+    if missing:
+        for card in await repository.get_cards(list(missing)):
+            card = correct_counts.apply(card)
+            card["thumbnail_urls"] = [thumbnail_url(url) for url in card["media_urls"]]
+            data = dumps({name: card.get(name) for name in CARD_FIELDS})
+            response_cache.put(f"card:{card['id']}", missing[card["id"]], data)
+            fragments[card["id"]] = data
+    return fragments
+
+@app.get("/api/cards/feed", response_model=CardFeedPage)
+async def get_card_feed(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    tag: Optional[str] = None,
+    sort: str = Query("new", pattern="^(new|hot)$")
+):
+    hot_scores = {}
+    try:
+        if sort == "hot":
+            if tag is not None:
+                raise HTTPException(status_code=400, detail="tag cannot be combined with sort=hot")
+            hits, next_cursor = hot_ranking.page(limit, cursor=cursor)
+            hot_scores = dict(hits)
+            card_ids = [card_id for card_id, _ in hits]
+        else:
+            card_ids, next_cursor = feed_index.page(limit, cursor=cursor, tag=tag)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Served from pre-serialized cards; unchanged pages are answered with a 304
+    etag = response_cache.entity_etag([f"card:{card_id}" for card_id in card_ids], next_cursor, hot_scores)
+    not_modified = response_cache.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    with span("feed.cards"):
+        fragments = await card_fragments(card_ids)
+    cards = [
+        fragments[card_id][:-1] + b',"hot_score":' + dumps(hot_scores.get(card_id)) + b"}"
+        for card_id in card_ids if card_id in fragments
+    ]
+    body = b'{"cards":' + join_array(cards) + b',"next_cursor":' + dumps(next_cursor) + b"}"
+    return response_cache.respond(body, etag)
+
+@app.get("/api/cards/search", response_model=CardSearchPage)
+async def search_cards(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    tag: Optional[str] = None,
+    prefix: bool = False
+):
+    try:
+        with span("search.index"):
+            hits, next_cursor = search_index.search(q, limit, cursor=cursor, tag=tag, prefix=prefix)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    scores = dict(hits)
+    page = []
+    with span("search.cards"):
+        cards = await repository.get_cards([card_id for card_id, _ in hits])
+    for card in cards:
+        card = correct_counts.apply(card)
+        page.append({
+            **card,
+            "thumbnail_urls": [thumbnail_url(url) for url in card["media_urls"]],
+            "score": scores[card["id"]]
+        })
+    return {"cards": page, "next_cursor": next_cursor}
+
+@app.get("/api/metrics/response-cache")
+async def get_response_cache_metrics():
+    return response_cache.metrics()
 
-@app.get("/api/cards/feed", response_model=List[CardResponse])
-async def get_card_feed():
-    return list(cards.values())
+@app.get("/api/metrics/ranking")
+async def get_ranking_metrics():
+    return hot_ranking.metrics()
+
+@app.get("/api/metrics/search")
+async def get_search_metrics():
+    return search_index.metrics()
 
 @app.post("/api/cards/{card_id}/interact")
 async def interact_with_card(
     card_id: str,
-    interaction: CardInteraction
+    interaction: CardInteraction,
+    user_id: Optional[str] = Depends(authenticated_user_id)
 ):
-    if card_id not in cards:
+    if card_id not in feed_index and await repository.get_card(card_id) is None:
         raise HTTPException(status_code=404, detail="Card not found")
     
     if interaction.interaction_type == "correct":
-        cards[card_id]["correct_count"] += 1
-        return {"message": "Card marked as correct", "token_change": -2}
+        result = {"message": "Card marked as correct", "token_change": 0}
+        # Only signed-in users are charged; anonymous swipes are counted for free
+        if user_id is not None:
+            try:
+                with span("ledger.apply"):
+                    _, balance = await token_ledger.apply(user_id, -INTERACTION_TOKEN_COST, "interaction", card_id)
+            except InsufficientTokens:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Insufficient tokens. {INTERACTION_TOKEN_COST} tokens required."
+                )
+            result.update(token_change=-INTERACTION_TOKEN_COST, balance=balance)
+        correct_counts.increment(card_id)
+        response_cache.invalidate(f"card:{card_id}")
+        eligibility.interaction(card_id)
+        hot_ranking.interaction(card_id)
+        if user_id is not None:
+            await reward_author(card_id, user_id)
+        return result
     raise HTTPException(status_code=400, detail="Invalid interaction type")
 
+async def reward_author(card_id: str, swiper_id: str) -> None:
+    """
+    Pays the card's author for a correct swipe; authors without an account get nothing
+    """
+    if not AUTHOR_TOKEN_REWARD:
+        return
+    author_id = feed_index.author(card_id)
+    if author_id is None:
+        card = await repository.get_card(card_id)
+        author_id = card["author_id"] if card else None
+    if author_id is None or author_id == swiper_id or not await token_ledger.exists(author_id):
+        return
+    try:
+        await token_ledger.apply(author_id, AUTHOR_TOKEN_REWARD, "author_reward", card_id)
+    except Exception as e:
+        print(f"Author reward for card {card_id} failed: {e}")
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return metrics_response()
+
+@app.get("/api/metrics/counters")
+async def get_counter_metrics():
+    return correct_counts.metrics()
+
+@app.get("/api/metrics/card-sync")
+async def get_card_sync_metrics():
+    return card_sync.metrics()
+
+@app.get("/api/metrics/llm")
+async def get_llm_metrics():
+    return get_gateway().metrics()
+
+@app.get("/api/metrics/ratelimit")
+async def get_rate_limit_metrics():
+    return rate_limits.metrics()
+
+@app.get("/api/metrics/ledger")
+async def get_ledger_metrics():
+    return token_ledger.metrics()
+
 @app.get("/api/tokens/balance")
-async def get_token_balance():
-    return {"balance": 15}  # Mock balance
+async def get_token_balance(user_id: str = Depends(require_user_id)):
+    return {"balance": await token_ledger.balance(user_id)}
+
+@app.get("/api/tokens/transactions")
+async def get_token_transactions(user_id: str = Depends(require_user_id)):
+    return {"transactions": await token_ledger.history(user_id)}
+
+async def track_cards(card_ids: List[str]) -> None:
+    # Cards another worker created are read once and tracked from then on
+    missing = [card_id for card_id in card_ids if card_id not in eligibility]
+    if missing:
+        for card in await repository.get_cards(missing):
+            eligibility.card_created(correct_counts.apply(card))
 
 @app.get("/api/cards/{card_id}/nft-eligibility")
 async def check_nft_eligibility(card_id: str):
-    if card_id not in cards:
+    await track_cards([card_id])
+    result = eligibility.evaluate(card_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Card not found")
     
-    card = cards[card_id]
-    
-    # Check eligibility criteria
-    is_eligible = False
-    reasons = []
-    
-    # High engagement check (100+ correct swipes)
-    if card["correct_count"] >= 100:
-        is_eligible = True
-        reasons.append("high_engagement")
-    
-    # First card of the day check
-    today = datetime.now().date()
-    card_date = card["created_at"].date()
-    if card_date == today:
-        first_card_today = all(
-            c["created_at"].date() != today or c["id"] == card_id
-            for c in cards.values()
-        )
-        if first_card_today:
-            is_eligible = True
-            reasons.append("first_card_of_day")
-    
-    return {
-        "eligible": is_eligible,
-        "reasons": reasons,
-        "requirements": {
-            "correct_count": {
-                "current": card["correct_count"],
-                "required": 100
-            }
-        }
-    }
+    return result
+
+@app.post("/api/cards/nft-eligibility")
+async def check_nft_eligibility_bulk(request: BulkEligibilityRequest):
+    await track_cards(request.card_ids)
+    results = {}
+    not_found = []
+    for card_id in request.card_ids:
+        result = eligibility.evaluate(card_id)
+        if result is not None:
+            results[card_id] = result
+        else:
+            not_found.append(card_id)
+    return {"results": results, "not_found": not_found}
+
+@app.get("/api/nft/eligible")
+async def list_eligible_cards(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    try:
+        cards, next_cursor = eligibility.page(limit, cursor=cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"cards": cards, "next_cursor": next_cursor}
 
-@app.post("/api/nft/mint")
-async def mint_nft(request: NFTMintRequest):
-    if request.card_id not in cards:
+@app.get("/api/metrics/eligibility")
+async def get_eligibility_metrics():
+    return eligibility.metrics()
+
+@app.post("/api/nft/mint", status_code=202)
+async def mint_nft(request: NFTMintRequest, user_id: str = Depends(require_user_id)):
+    if not Web3.is_address(request.user_address):
+        raise HTTPException(status_code=400, detail="Invalid Ethereum address")
+    card = await repository.get_card(request.card_id)
+    if card is None:
         raise HTTPException(status_code=404, detail="Card not found")
+    card = correct_counts.apply(card)
+    nft_status = card.get("nft_status")
+    if nft_status:
+        pending = nft_status.get("status") == "pending"
+        raise HTTPException(
+            status_code=409,
+            detail="Card is already being minted" if pending else "Card is already minted"
+        )
     
     # Check eligibility
-    eligibility = await check_nft_eligibility(request.card_id)
-    if not eligibility["eligible"]:
+    await track_cards([request.card_id])
+    if not eligibility.evaluate(request.card_id)["eligible"]:
         raise HTTPException(
             status_code=400,
             detail="Card is not eligible for NFT minting"
         )
     
-    card = cards[request.card_id]
+    key = f"card:{request.card_id}"
+    job = await mint_queue.find(key)
+    if job is not None:
+        # Already being minted; nothing is charged twice
+        return {"success": True, "job_id": job.id, "status": job.status, "token_change": 0}
     
-    # Check if user has enough tokens (15 required)
-    user_balance = 15  # Mock balance, replace with actual balance check
-    if user_balance < 15:
+    # Charge the minting fee; refunded if the mint fails
+    try:
+        await token_ledger.apply(user_id, -MINT_TOKEN_COST, "mint", request.card_id)
+    except InsufficientTokens:
         raise HTTPException(
             status_code=400,
-            detail="Insufficient tokens. 15 tokens required for minting."
+            detail=f"Insufficient tokens. {MINT_TOKEN_COST} tokens required for minting."
         )
     
     try:
@@ -278,36 +616,75 @@ async def mint_nft(request: NFTMintRequest):
             "createdAt": card["created_at"].isoformat()
         }
         
-        # TODO: Upload to IPFS and get URI (will be implemented in step 004)
-        ipfs_uri = f"ipfs://mock/{request.card_id}"
-        
-        # TODO: Interact with smart contract to mint NFT
-        # This is a mock response for now
-        nft_data = {
-            "token_id": str(uuid.uuid4()),
-            "contract_address": "0x1234...5678",
-            "owner_address": request.user_address,
-            "ipfs_uri": ipfs_uri
-        }
-        
-        # Update card with NFT status
-        cards[request.card_id]["nft_status"] = nft_data
-        nft_cards[request.card_id] = nft_data
-        
-        # Deduct tokens (mock implementation)
+        # Published to IPFS and minted in the background; the job id is
+        # polled at /api/nft/jobs/{job_id}
+        job, created = await mint_queue.submit(
+            key,
+            request.user_address,
+            metadata,
+            context={"user_id": user_id, "fee": MINT_TOKEN_COST},
+            publish=True
+        )
+        if not created:
+            # Another request or worker queued it while the fee was being charged
+            await refund_mint(user_id, request.card_id, MINT_TOKEN_COST)
+            return {"success": True, "job_id": job.id, "status": job.status, "token_change": 0}
+        await repository.set_nft_status(request.card_id, {"status": "pending", "job_id": job.id})
+        response_cache.invalidate(f"card:{request.card_id}")
         
         return {
             "success": True,
-            "nft_data": nft_data,
-            "token_change": -50
+            "job_id": job.id,
+            "status": job.status,
+            "token_change": -MINT_TOKEN_COST
         }
         
     except Exception as e:
+        await refund_mint(user_id, request.card_id, MINT_TOKEN_COST)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to mint NFT: {str(e)}"
         )
 
+async def refund_mint(user_id: str, card_id: str, fee: int) -> None:
+    await token_ledger.apply(user_id, fee, "mint_refund", card_id)
+
+async def release_failed_mint(job: MintJob) -> None:
+    """
+    Refunds the fee of a failed card mint and lets the card be minted again
+    """
+    card_id = job.key.split(":", 1)[1]
+    await refund_mint(job.context["user_id"], card_id, job.context["fee"])
+    await repository.set_nft_status(card_id, None)
+    response_cache.invalidate(f"card:{card_id}")
+
+async def record_minted_card(job: MintJob) -> None:
+    card_id = job.key.split(":", 1)[1]
+    eligibility.minted(card_id)
+    await repository.save_nft(card_id, {
+        "token_id": job.token_id,
+        "contract_address": mint_queue.provider.contract_address,
+        "owner_address": job.recipient,
+        "ipfs_uri": job.token_uri,
+        "tx_hash": job.tx_hash
+    })
+    response_cache.invalidate(f"card:{card_id}")
+
+# Jobs are stored with the other records, so they and their handlers survive restarts
+mint_queue.repository = repository
+mint_queue.on_result("card", confirmed=record_minted_card, failed=release_failed_mint)
+
+@app.get("/api/nft/jobs/{job_id}")
+async def get_mint_job(job_id: str):
+    job = await mint_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Mint job not found")
+    return job.to_dict()
+
+@app.get("/api/metrics/mint")
+async def get_mint_metrics():
+    return {**mint_queue.metrics(), "ipfs": get_publisher().metrics()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,338 @@
+"""
+Media Module
+
+Content-addressed media storage and serving.
+
+Uploads are streamed to disk in fixed-size chunks, with the hashing and
+writing done on worker threads so large uploads never block the event loop.
+Identical uploads are stored once under their SHA-256 content hash in a
+sharded layout (uploads/ab/cd/<sha256>.<ext>).
+
+The multipart body is parsed before the handler runs, so the request limit
+is enforced by UploadLimitMiddleware while the body arrives: a declared
+Content-Length over the limit is answered with 413 before anything is read,
+and a body that grows past it is cut off. The per-file limit is checked as
+each file is copied into the store.
+
+Objects are served from /media/<sha256>.<ext> with strong ETags, HTTP Range
+support and immutable cache headers. Images can be requested at a reduced
+width (?w=320); the resized variants are generated lazily with Pillow and
+cached next to the originals.
+"""
+
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+
+from cardnote_shared.metrics import registry
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are served as originals without Pillow
+    Image = None
+
+upload_bytes = registry.counter("upload_bytes_total", "Bytes of media uploads stored")
+upload_seconds = registry.histogram("upload_duration_seconds", "Time to receive and store one uploaded file")
+variant_failures = registry.counter(
+    "media_variant_failures_total", "Resized variants served as originals because resizing failed", ("reason",)
+)
+
+CHUNK_SIZE = 1024 * 1024
+MAX_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(300 * 1024 * 1024)))
+MAX_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+THUMBNAIL_WIDTHS = (160, 320, 640, 1280)
+FEED_THUMBNAIL_WIDTH = 640
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp"}
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MEDIA_NAME = re.compile(r"([0-9a-f]{64})\.([a-z0-9]{1,10})")
+
+class UploadTooLarge(Exception):
+    pass
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+class UploadBudget:
+    """
+    Bytes remaining for all files of a single request
+    """
+
+    def __init__(self, max_bytes: int = MAX_REQUEST_BYTES):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def consume(self, size: int) -> None:
+        self.used += size
+        if self.used > self.max_bytes:
+            raise UploadTooLarge(f"Request exceeds the {self.max_bytes} byte upload limit")
+
+def file_extension(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    return ext if re.fullmatch(r"[a-z0-9]{1,10}", ext) else "bin"
+
+def media_url(name: str, width: Optional[int] = None) -> str:
+    return f"/media/{name}" if width is None else f"/media/{name}?w={width}"
+
+def thumbnail_url(url: str, width: int = FEED_THUMBNAIL_WIDTH) -> str:
+    """
+    Maps a stored image URL to its resized variant; other URLs are returned as-is
+    """
+    match = re.fullmatch(r"/media/([0-9a-f]{64}\.([a-z0-9]{1,10}))", url)
+    if not match or match.group(2) not in IMAGE_EXTENSIONS:
+        return url
+    return media_url(match.group(1), width)
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range Range header into inclusive byte offsets
+    Returns None when the header should be ignored and the whole object served
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    else:
+        suffix = int(match.group(2))
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        start, end = max(0, size - suffix), size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+def _write_chunk(buffer, hasher, chunk: bytes) -> None:
+    # hashlib releases the GIL for large buffers, so both steps run off the loop
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+def _resize_image(source: str, target: str, width: int) -> None:
+    with Image.open(source) as image:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        tmp_target = f"{target}.{uuid.uuid4().hex}.tmp"
+        resized.save(tmp_target, format=image.format)
+    os.replace(tmp_target, target)
+
+async def _iter_file(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    buffer = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(buffer.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(buffer.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(buffer.close)
+
+class MediaStore:
+    def __init__(self, root: str = "uploads", max_file_bytes: int = MAX_FILE_BYTES):
+        self.root = root
+        self.max_file_bytes = max_file_bytes
+        # Kept outside root so partial uploads are never served
+        self.tmp_dir = f"{root}.tmp"
+        self._variant_jobs: Dict[str, asyncio.Future] = {}
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def variant_path_for(self, name: str, width: int) -> str:
+        digest, ext = name.split(".", 1)
+        return os.path.join(self.root, "variants", name[:2], name[2:4], f"{digest}-w{width}.{ext}")
+
+    async def save(self, file: UploadFile, budget: Optional[UploadBudget] = None) -> str:
+        """
+        Stores the upload and returns its content-addressed name
+        """
+        started = time.perf_counter()
+        hasher = hashlib.sha256()
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        size = 0
+        buffer = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_file_bytes:
+                    raise UploadTooLarge(
+                        f"{file.filename} exceeds the {self.max_file_bytes} byte file limit"
+                    )
+                if budget is not None:
+                    budget.consume(len(chunk))
+                await asyncio.to_thread(_write_chunk, buffer, hasher, chunk)
+        except BaseException:
+            await asyncio.to_thread(buffer.close)
+            await asyncio.to_thread(os.remove, tmp_path)
+            raise
+        await asyncio.to_thread(buffer.close)
+
+        name = f"{hasher.hexdigest()}.{file_extension(file.filename)}"
+        await asyncio.to_thread(self._commit, tmp_path, self.path_for(name))
+        upload_bytes.inc(size)
+        upload_seconds.observe(time.perf_counter() - started)
+        return name
+
+    @staticmethod
+    def _commit(tmp_path: str, final_path: str) -> None:
+        if os.path.exists(final_path):
+            # Identical content is already stored
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+
+    async def variant(self, name: str, width: int) -> str:
+        """
+        Returns the path of the image resized to width, generating it on first use
+        Concurrent requests for the same variant share a single resize
+        """
+        source = self.path_for(name)
+        if Image is None or name.split(".", 1)[1] not in IMAGE_EXTENSIONS:
+            return source
+        target = self.variant_path_for(name, width)
+        if os.path.exists(target):
+            return target
+
+        job = self._variant_jobs.get(target)
+        if job is None:
+            job = asyncio.ensure_future(self._generate_variant(source, target, width))
+            self._variant_jobs[target] = job
+            job.add_done_callback(lambda _: self._variant_jobs.pop(target, None))
+        return await asyncio.shield(job)
+
+    async def _generate_variant(self, source: str, target: str, width: int) -> str:
+        def generate() -> str:
+            with Image.open(source) as image:
+                if image.width <= width:
+                    return source
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _resize_image(source, target, width)
+            return target
+
+        try:
+            return await asyncio.to_thread(generate)
+        except (Image.DecompressionBombError, OSError) as e:
+            reason = "decompression_bomb" if isinstance(e, Image.DecompressionBombError) else "unreadable"
+            print(f"Thumbnail generation failed for {source} ({reason}): {e}")
+            variant_failures.labels(reason).inc()
+            return source
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware capping the body size of upload requests
+    """
+
+    def __init__(self, app, paths: Tuple[str, ...], max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while the form is parsed, so it becomes the response
+                    raise HTTPException(status_code=413, detail=self.detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def detail(self) -> str:
+        return f"Request exceeds the {self.max_bytes} byte upload limit"
+
+    async def _reject(self, send) -> None:
+        body = json.dumps({"detail": self.detail()}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+media_store = MediaStore(os.getenv("MEDIA_ROOT", "uploads"))
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+@router.get("/{name}")
+async def get_media(
+    name: str,
+    request: Request,
+    w: Optional[int] = Query(None, description="Width of a resized image variant")
+):
+    match = MEDIA_NAME.fullmatch(name)
+    if not match:
+        raise HTTPException(status_code=404, detail="Media not found")
+    if w is not None and w not in THUMBNAIL_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"Width must be one of {THUMBNAIL_WIDTHS}")
+
+    path = media_store.path_for(name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Media not found")
+    if w is not None:
+        path = await media_store.variant(name, w)
+
+    etag = f'"{match.group(1)}"' if w is None else f'"{match.group(1)}-w{w}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    size = os.path.getsize(path)
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    byte_range = None
+    if "range" in request.headers:
+        try:
+            byte_range = parse_range(request.headers["range"], size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file(path, start, end - start + 1),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
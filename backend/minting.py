@@ -0,0 +1,773 @@
+"""
+Minting Module
+
+Asynchronous NFT minting through KnowledgeCardNFT.mintCard.
+
+Mint requests only enqueue a job and return its id. A job can first run a
+publishing step (uploading its metadata) that supplies the token URI; it
+joins the mint queue once that finishes. A background worker
+drains the queue in batches: each batch looks up the gas price once, takes
+consecutive nonces from a local nonce manager and submits its transactions
+back to back without waiting for confirmations. Every submitted transaction
+then gets its own receipt watcher, so confirmations are polled concurrently
+(with a cap on RPC calls in flight) and one slow transaction never holds up
+the rest. The contract mints one token per call, so a batch is a burst of
+pipelined transactions rather than a single multi-mint transaction.
+
+Jobs are stored through the repository, leased to the process working on
+them. A key (e.g. card:<id>) has at most one job that has not failed, so
+concurrent requests and workers cannot mint a card twice. Each transaction is
+signed and written to the job before it is broadcast; after a restart or
+crash the unfinished jobs are claimed again (right away after a clean stop,
+after MINT_JOB_LEASE seconds otherwise), their last transaction is
+rebroadcast and watched, and nothing is sent under a second nonce. A
+transaction without a receipt after MINT_RECEIPT_TIMEOUT is never given up
+on: it is replaced by one with the same nonce and a bumped gas price, and
+every transaction sent for the job is watched until one of them is mined.
+A job only fails when its transaction reverts, or when it cannot be sent.
+
+MINT_PROVIDER selects the chain: "stub" (default) simulates one in-process,
+"web3" signs with MINTER_PRIVATE_KEY and sends to NFT_CONTRACT_ADDRESS on
+ETH_RPC_URL (a local dev chain such as anvil or hardhat works as well).
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from storage import InMemoryRepository, Repository
+
+MINT_PROVIDER = os.getenv("MINT_PROVIDER", "stub")
+BATCH_SIZE = int(os.getenv("MINT_BATCH_SIZE", "20"))
+BATCH_INTERVAL = float(os.getenv("MINT_BATCH_INTERVAL", "1.0"))
+RECEIPT_POLL_INTERVAL = float(os.getenv("MINT_RECEIPT_POLL_INTERVAL", "2.0"))
+# Seconds without a receipt before a transaction is replaced with more gas
+RECEIPT_TIMEOUT = float(os.getenv("MINT_RECEIPT_TIMEOUT", "600"))
+MAX_RECEIPT_POLLS = int(os.getenv("MINT_MAX_RECEIPT_POLLS", "16"))
+GAS_PRICE_MULTIPLIER = float(os.getenv("MINT_GAS_PRICE_MULTIPLIER", "1.2"))
+# Nodes only accept a replacement priced at least 10% above the transaction it replaces
+GAS_BUMP = max(1.125, float(os.getenv("MINT_GAS_BUMP", "1.125")))
+# Batches wait while the network gas price is above this (unset = no cap)
+MAX_GAS_PRICE_GWEI = float(os.getenv("MINT_MAX_GAS_PRICE_GWEI", "0")) or None
+MAX_SEND_ATTEMPTS = int(os.getenv("MINT_MAX_SEND_ATTEMPTS", "3"))
+MAX_RETAINED_JOBS = int(os.getenv("MINT_MAX_RETAINED_JOBS", "10000"))
+JOB_LEASE = float(os.getenv("MINT_JOB_LEASE", "60"))
+
+PUBLISHING = "publishing"
+QUEUED = "queued"
+SUBMITTED = "submitted"
+CONFIRMED = "confirmed"
+FAILED = "failed"
+
+KNOWLEDGE_CARD_NFT_ABI = [
+    {
+        "type": "function",
+        "name": "mintCard",
+        "stateMutability": "nonpayable",
+        "inputs": [
+            {"name": "recipient", "type": "address"},
+            {
+                "name": "metadata",
+                "type": "tuple",
+                "components": [
+                    {"name": "title", "type": "string"},
+                    {"name": "content", "type": "string"},
+                    {"name": "author", "type": "address"},
+                    {"name": "correctCount", "type": "uint256"},
+                    {"name": "mediaUrls", "type": "string[]"},
+                    {"name": "createdAt", "type": "uint256"},
+                ],
+            },
+            {"name": "tokenURI", "type": "string"},
+        ],
+        "outputs": [{"name": "", "type": "uint256"}],
+    },
+    {
+        "type": "event",
+        "name": "CardMinted",
+        "anonymous": False,
+        "inputs": [
+            {"name": "tokenId", "type": "uint256", "indexed": True},
+            {"name": "author", "type": "address", "indexed": True},
+            {"name": "title", "type": "string", "indexed": False},
+            {"name": "correctCount", "type": "uint256", "indexed": False},
+        ],
+    },
+]
+
+class NonceError(Exception):
+    """
+    The node rejected a transaction because of its nonce
+    """
+
+JobHandler = Callable[["MintJob"], Awaitable[None]]
+PublishFn = Callable[[dict], Awaitable[Tuple[str, dict]]]
+
+def _dump_datetime(value: datetime) -> str:
+    return value.isoformat()
+
+class MintJob:
+    __slots__ = (
+        "id", "key", "recipient", "metadata", "token_uri", "publish", "context", "status",
+        "attempts", "nonce", "transactions", "tx_hash", "token_id", "error", "created_at", "updated_at"
+    )
+
+    def __init__(
+        self,
+        key: str,
+        recipient: str,
+        metadata: dict,
+        token_uri: Optional[str],
+        publish: bool = False,
+        context: Optional[dict] = None
+    ):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.recipient = recipient
+        self.metadata = metadata
+        self.token_uri = token_uri
+        # Whether the metadata still has to be published for the token URI
+        self.publish = publish
+        # JSON-serializable data for the result handlers (e.g. who paid the fee)
+        self.context = context or {}
+        self.status = PUBLISHING if publish else QUEUED
+        self.attempts = 0
+        self.nonce: Optional[int] = None
+        # Transactions sent under the nonce, oldest first: {"hash", "raw", "gas_price"}
+        self.transactions: List[dict] = []
+        self.tx_hash: Optional[str] = None
+        self.token_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.updated_at = self.created_at
+
+    def update(self, status: str, **fields) -> None:
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated_at = datetime.now()
+
+    def to_record(self) -> dict:
+        record = {name: getattr(self, name) for name in self.__slots__}
+        record["created_at"] = _dump_datetime(self.created_at)
+        record["updated_at"] = _dump_datetime(self.updated_at)
+        return record
+
+    @classmethod
+    def from_record(cls, record: dict) -> "MintJob":
+        job = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(job, name, record.get(name))
+        job.context = job.context or {}
+        job.transactions = job.transactions or []
+        job.created_at = datetime.fromisoformat(record["created_at"])
+        job.updated_at = datetime.fromisoformat(record["updated_at"])
+        return job
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "recipient": self.recipient,
+            "token_uri": self.token_uri,
+            "nonce": self.nonce,
+            "tx_hash": self.tx_hash,
+            "token_id": self.token_id,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+class StubMintProvider:
+    """
+    In-process chain: transactions must arrive in nonce order and are mined
+    block_time seconds after they are sent, unless priced below
+    min_gas_price_wei. A pending transaction can be replaced by one with the
+    same nonce and a gas price at least 10% higher. Jobs whose id is in
+    reverting_jobs are mined as reverted.
+    """
+
+    contract_address = "0x000000000000000000000000000000000000c0de"
+
+    def __init__(self, block_time: float = 0.5, gas_price_wei: int = 10 ** 9):
+        self.block_time = block_time
+        self.gas_price_wei = gas_price_wei
+        self.min_gas_price_wei = 0
+        self.reverting_jobs: set = set()
+        self.next_nonce = 0
+        self.next_token_id = 1
+        self.transactions: Dict[str, dict] = {}
+        # Hash of the transaction currently holding each nonce
+        self._by_nonce: Dict[int, str] = {}
+
+    async def get_nonce(self) -> int:
+        return self.next_nonce
+
+    async def gas_price(self) -> int:
+        return self.gas_price_wei
+
+    async def prepare_mint(self, job: MintJob, nonce: int, gas_price: int) -> Tuple[str, Any]:
+        # Deterministic, like signing the same transaction twice
+        digest = hashlib.sha256(f"{job.id}:{nonce}:{gas_price}".encode("utf-8")).hexdigest()
+        tx_hash = "0x" + digest
+        return tx_hash, {"hash": tx_hash, "job_id": job.id, "nonce": nonce, "gas_price": gas_price}
+
+    async def broadcast(self, raw: Any) -> None:
+        if raw["hash"] in self.transactions:
+            return
+        nonce = raw["nonce"]
+        if nonce > self.next_nonce:
+            raise NonceError(f"nonce {nonce} is ahead of the account nonce {self.next_nonce}")
+        if nonce < self.next_nonce:
+            current = self.transactions.get(self._by_nonce.get(nonce))
+            if current is None or current["receipt"] is not None:
+                raise NonceError(f"nonce {nonce} too low")
+            if raw["gas_price"] < current["gas_price"] * 1.1:
+                raise ValueError("replacement transaction underpriced")
+        else:
+            self.next_nonce += 1
+        self._by_nonce[nonce] = raw["hash"]
+        self.transactions[raw["hash"]] = {
+            **raw, "mined_at": time.monotonic() + self.block_time, "receipt": None
+        }
+
+    async def get_receipt(self, tx_hash: str) -> Optional[dict]:
+        tx = self.transactions.get(tx_hash)
+        if tx is None:
+            return None
+        if tx["receipt"] is None:
+            replaced = self._by_nonce[tx["nonce"]] != tx_hash
+            if replaced or time.monotonic() < tx["mined_at"] or tx["gas_price"] < self.min_gas_price_wei:
+                return None
+            if tx["job_id"] in self.reverting_jobs:
+                tx["receipt"] = {"status": 0, "token_id": None}
+            else:
+                tx["receipt"] = {"status": 1, "token_id": str(self.next_token_id)}
+                self.next_token_id += 1
+        return tx["receipt"]
+
+    async def close(self) -> None:
+        pass
+
+class Web3MintProvider:
+    def __init__(self, rpc_url: str, contract_address: str, private_key: str):
+        from eth_account import Account
+        from web3 import AsyncWeb3
+
+        self.w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(rpc_url))
+        self.account = Account.from_key(private_key)
+        self.contract_address = AsyncWeb3.to_checksum_address(contract_address)
+        self.contract = self.w3.eth.contract(address=self.contract_address, abi=KNOWLEDGE_CARD_NFT_ABI)
+        self._chain_id: Optional[int] = None
+
+    async def get_nonce(self) -> int:
+        return await self.w3.eth.get_transaction_count(self.account.address, "pending")
+
+    async def gas_price(self) -> int:
+        return await self.w3.eth.gas_price
+
+    async def prepare_mint(self, job: MintJob, nonce: int, gas_price: int) -> Tuple[str, Any]:
+        if self._chain_id is None:
+            self._chain_id = await self.w3.eth.chain_id
+        metadata = job.metadata
+        call = self.contract.functions.mintCard(
+            self.w3.to_checksum_address(job.recipient),
+            (
+                metadata["title"],
+                metadata["content"],
+                self.w3.to_checksum_address(job.recipient),
+                int(metadata.get("correctCount", 0)),
+                list(metadata.get("mediaUrls") or []),
+                int(datetime.fromisoformat(metadata["createdAt"]).timestamp()),
+            ),
+            job.token_uri
+        )
+        # build_transaction estimates the gas limit against the pending state
+        tx = await call.build_transaction({
+            "from": self.account.address,
+            "nonce": nonce,
+            "gasPrice": gas_price,
+            "chainId": self._chain_id,
+        })
+        signed = self.account.sign_transaction(tx)
+        return signed.hash.hex(), signed.rawTransaction.hex()
+
+    async def broadcast(self, raw: Any) -> None:
+        try:
+            await self.w3.eth.send_raw_transaction(raw)
+        except ValueError as e:
+            message = str(e).lower()
+            if "already known" in message:
+                return
+            if "nonce" in message:
+                raise NonceError(str(e)) from e
+            raise
+
+    async def get_receipt(self, tx_hash: str) -> Optional[dict]:
+        from web3.exceptions import TransactionNotFound
+        from web3.logs import DISCARD
+
+        try:
+            receipt = await self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+        if receipt["status"] != 1:
+            return {"status": 0, "token_id": None}
+        events = self.contract.events.CardMinted().process_receipt(receipt, errors=DISCARD)
+        return {"status": 1, "token_id": str(events[0]["args"]["tokenId"]) if events else None}
+
+    async def close(self) -> None:
+        pass
+
+class NonceManager:
+    """
+    Hands out consecutive nonces locally, syncing with the node only on first
+    use and after a rejected transaction
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self._next: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    async def allocate(self) -> int:
+        async with self._lock:
+            if self._next is None:
+                self._next = await self.provider.get_nonce()
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def reset(self) -> None:
+        self._next = None
+
+class MintQueue:
+    def __init__(
+        self,
+        provider,
+        repository: Optional[Repository] = None,
+        publish: Optional[PublishFn] = None,
+        batch_size: int = BATCH_SIZE,
+        batch_interval: float = BATCH_INTERVAL,
+        poll_interval: float = RECEIPT_POLL_INTERVAL,
+        receipt_timeout: float = RECEIPT_TIMEOUT,
+        max_retained_jobs: int = MAX_RETAINED_JOBS,
+        lease_seconds: float = JOB_LEASE
+    ):
+        self.provider = provider
+        # Without a shared repository jobs only live as long as the process
+        self.repository = repository or InMemoryRepository()
+        # Publishes a job's metadata and returns its token URI and final metadata
+        self.publish = publish
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.max_retained_jobs = max_retained_jobs
+        self.lease_seconds = lease_seconds
+        self.nonces = NonceManager(provider)
+        self._handlers: Dict[str, Tuple[Optional[JobHandler], Optional[JobHandler]]] = {}
+        self._jobs: "OrderedDict[str, MintJob]" = OrderedDict()
+        self._by_key: Dict[str, MintJob] = {}
+        self._pending: List[MintJob] = []
+        self._watchers: set = set()
+        self._poll_slots = asyncio.Semaphore(MAX_RECEIPT_POLLS)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_lease = 0.0
+        self._stats = {
+            "batches": 0,
+            "submitted": 0,
+            "confirmed": 0,
+            "failed": 0,
+            "replacements": 0,
+            "recovered": 0,
+            "nonce_resyncs": 0,
+            "last_batch_size": 0,
+            "last_gas_price_wei": None,
+        }
+
+    @property
+    def owner(self) -> str:
+        return self.repository.origin
+
+    def on_result(
+        self,
+        prefix: str,
+        confirmed: Optional[JobHandler] = None,
+        failed: Optional[JobHandler] = None
+    ) -> None:
+        """
+        Registers the handlers awaited when a job whose key starts with
+        "<prefix>:" is confirmed or fails, including jobs recovered after a restart
+        """
+        self._handlers[prefix] = (confirmed, failed)
+
+    async def submit(
+        self,
+        key: str,
+        recipient: str,
+        metadata: dict,
+        token_uri: Optional[str] = None,
+        context: Optional[dict] = None,
+        publish: bool = False
+    ) -> Tuple[MintJob, bool]:
+        """
+        Queues a mint and returns its job right away, and whether it was created
+        With publish, the job first waits for the queue's publish function to
+        return the token URI and final metadata; it is queued for minting after that
+        A key that already has a live or confirmed job returns that job instead
+        """
+        while True:
+            existing = await self.find(key)
+            if existing is not None:
+                return existing, False
+            job = MintJob(key, recipient, metadata, token_uri, publish, context)
+            # Fails if another request or worker stored a job for the key first
+            if await self.repository.create_mint_job(job.to_record(), self.owner):
+                break
+        self._track(job)
+        self._resume(job)
+        return job, True
+
+    def _track(self, job: MintJob) -> None:
+        self._jobs[job.id] = job
+        self._by_key[job.key] = job
+        self._forget_old_jobs()
+
+    def _resume(self, job: MintJob) -> None:
+        if job.status == PUBLISHING:
+            self._spawn(self._publish(job))
+        elif job.status == QUEUED:
+            self._enqueue(job)
+        elif job.status == SUBMITTED:
+            self._spawn(self._watch(job))
+
+    def _spawn(self, coroutine: Awaitable[None]) -> None:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._watchers.add(task)
+        task.add_done_callback(self._watchers.discard)
+
+    def _enqueue(self, job: MintJob) -> None:
+        self._pending.append(job)
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _save(self, job: MintJob) -> bool:
+        """
+        Persists the job; False (and the job is dropped here) if another worker took it over
+        """
+        if await self.repository.save_mint_job(job.to_record(), self.owner):
+            return True
+        print(f"Mint job {job.id} was taken over by another worker")
+        self._jobs.pop(job.id, None)
+        if self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+        return False
+
+    async def _save_quietly(self, job: MintJob) -> bool:
+        try:
+            return await self._save(job)
+        except Exception as e:
+            print(f"Failed to persist mint job {job.id}: {e}")
+            return True
+
+    async def _publish(self, job: MintJob) -> None:
+        try:
+            if self.publish is None:
+                raise RuntimeError("no metadata publisher configured")
+            token_uri, metadata = await self.publish(job.metadata)
+        except Exception as e:
+            await self._fail(job, f"Failed to publish metadata: {e}")
+            return
+        job.update(QUEUED, token_uri=token_uri, metadata=metadata, publish=False)
+        if await self._save_quietly(job):
+            self._enqueue(job)
+
+    async def get(self, job_id: str) -> Optional[MintJob]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            record = await self.repository.get_mint_job(job_id)
+            job = MintJob.from_record(record) if record else None
+        return job
+
+    async def find(self, key: str) -> Optional[MintJob]:
+        """
+        The live or confirmed job for key, if there is one
+        """
+        job = self._by_key.get(key)
+        if job is not None and job.status != FAILED:
+            return job
+        # Possibly started by another worker
+        record = await self.repository.find_mint_job(key)
+        return MintJob.from_record(record) if record else None
+
+    def _forget_old_jobs(self) -> None:
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_retained_jobs:
+                break
+            job = self._jobs[job_id]
+            if job.status in (CONFIRMED, FAILED):
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+    async def process_batch(self) -> int:
+        if not self._pending:
+            return 0
+        gas_price = int(await self.provider.gas_price() * GAS_PRICE_MULTIPLIER)
+        self._stats["last_gas_price_wei"] = gas_price
+        if MAX_GAS_PRICE_GWEI is not None and gas_price > MAX_GAS_PRICE_GWEI * 10 ** 9:
+            print(f"Gas price {gas_price} wei is above the cap, holding {len(self._pending)} mints")
+            return 0
+
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        retry: List[MintJob] = []
+        for position, job in enumerate(batch):
+            try:
+                nonce = await self.nonces.allocate()
+            except Exception:
+                # Node unreachable; the rest of the batch goes back to the queue
+                self._pending[:0] = retry + batch[position:]
+                raise
+            job.attempts += 1
+            try:
+                if not await self._send(job, nonce, gas_price):
+                    continue
+            except Exception as e:
+                # Not taken by the node, so the nonce is free again; resync so the next send reuses it
+                self.nonces.reset()
+                if isinstance(e, NonceError):
+                    self._stats["nonce_resyncs"] += 1
+                job.update(QUEUED, nonce=None, tx_hash=None, transactions=[])
+                if job.attempts < MAX_SEND_ATTEMPTS:
+                    print(f"Mint job {job.id} send failed, retrying: {e}")
+                    if await self._save_quietly(job):
+                        retry.append(job)
+                else:
+                    await self._fail(job, f"Failed to submit transaction: {e}")
+                continue
+            self._stats["submitted"] += 1
+            self._spawn(self._watch(job))
+        self._pending[:0] = retry
+        self._stats["batches"] += 1
+        self._stats["last_batch_size"] = len(batch)
+        return len(batch)
+
+    async def _send(self, job: MintJob, nonce: int, gas_price: int) -> bool:
+        """
+        Signs and broadcasts a transaction for the job under nonce
+        Raises NonceError if the node refused the nonce; returns False if the job was taken over
+        """
+        tx_hash, raw = await self.provider.prepare_mint(job, nonce, gas_price)
+        transaction = {"hash": tx_hash, "raw": raw, "gas_price": gas_price}
+        job.update(SUBMITTED, nonce=nonce, tx_hash=tx_hash, transactions=job.transactions + [transaction])
+        # Stored before it is broadcast, so a restart rebroadcasts it instead of minting under a new nonce
+        if not await self._save(job):
+            return False
+        try:
+            await self.provider.broadcast(raw)
+        except NonceError:
+            raise
+        except Exception as e:
+            # The node may have taken it anyway; it is watched and replaced like any other
+            print(f"Broadcast of {tx_hash} for mint job {job.id} failed: {e}")
+        return True
+
+    async def _find_receipt(self, job: MintJob) -> Optional[Tuple[str, dict]]:
+        # Any of the job's transactions may be the one that gets mined
+        for transaction in reversed(job.transactions):
+            try:
+                async with self._poll_slots:
+                    receipt = await self.provider.get_receipt(transaction["hash"])
+            except Exception as e:
+                print(f"Receipt lookup for mint job {job.id} failed: {e}")
+                continue
+            if receipt is not None:
+                return transaction["hash"], receipt
+        return None
+
+    async def _replace(self, job: MintJob) -> bool:
+        """
+        Sends the job's transaction again with a bumped gas price
+        Returns False only if the nonce has been used by a transaction that is not the job's
+        """
+        try:
+            network_price = int(await self.provider.gas_price() * GAS_PRICE_MULTIPLIER)
+            gas_price = max(network_price, int(job.transactions[-1]["gas_price"] * GAS_BUMP))
+            if MAX_GAS_PRICE_GWEI is not None and gas_price > MAX_GAS_PRICE_GWEI * 10 ** 9:
+                print(f"Mint job {job.id} needs {gas_price} wei to be replaced, above the cap; still waiting")
+                return True
+            print(f"No receipt for {job.tx_hash} after {self.receipt_timeout:.0f}s, replacing it at {gas_price} wei")
+            if not await self._send(job, job.nonce, gas_price):
+                return True
+        except NonceError:
+            # Either one of the job's transactions was mined or the nonce went to something else
+            if await self._find_receipt(job) is None:
+                return False
+        except Exception as e:
+            print(f"Replacing the transaction of mint job {job.id} failed: {e}")
+            return True
+        self._stats["replacements"] += 1
+        return True
+
+    async def _watch(self, job: MintJob) -> None:
+        sent_at = time.monotonic()
+        nonce_lost = False
+        while True:
+            found = await self._find_receipt(job)
+            if found is not None:
+                break
+            if job.id not in self._jobs:
+                # Taken over by another worker
+                return
+            if time.monotonic() - sent_at >= self.receipt_timeout:
+                if await self._replace(job):
+                    nonce_lost = False
+                elif nonce_lost:
+                    # Twice in a row: none of the job's transactions can be mined any more
+                    print(f"Nonce {job.nonce} of mint job {job.id} was used elsewhere, requeueing it")
+                    job.update(QUEUED, nonce=None, tx_hash=None, transactions=[])
+                    if await self._save_quietly(job):
+                        self._enqueue(job)
+                    return
+                else:
+                    nonce_lost = True
+                sent_at = time.monotonic()
+            await asyncio.sleep(self.poll_interval)
+
+        tx_hash, receipt = found
+        if receipt["status"] != 1:
+            await self._fail(job, f"Transaction {tx_hash} reverted")
+            return
+        job.update(CONFIRMED, tx_hash=tx_hash, token_id=receipt["token_id"])
+        self._stats["confirmed"] += 1
+        await self._save_quietly(job)
+        confirmed, _ = self._handlers.get(job.key.split(":", 1)[0], (None, None))
+        if confirmed is not None:
+            try:
+                await confirmed(job)
+            except Exception as e:
+                print(f"Mint job {job.id} confirmation handler failed: {e}")
+
+    async def _fail(self, job: MintJob, error: str) -> None:
+        print(f"Mint job {job.id} failed: {error}")
+        job.update(FAILED, error=error)
+        self._stats["failed"] += 1
+        if not await self._save_quietly(job):
+            return
+        _, failed = self._handlers.get(job.key.split(":", 1)[0], (None, None))
+        if failed is not None:
+            try:
+                await failed(job)
+            except Exception as e:
+                print(f"Mint job {job.id} failure handler failed: {e}")
+
+    async def recover(self) -> int:
+        """
+        Claims the unfinished jobs whose lease has run out and resumes them
+        Submitted ones are rebroadcast first, in nonce order, so no new
+        transaction can take their nonces
+        """
+        stale_before = datetime.now() - timedelta(seconds=self.lease_seconds)
+        records = await self.repository.claim_mint_jobs(self.owner, stale_before)
+        jobs = [MintJob.from_record(record) for record in records]
+        for job in sorted((job for job in jobs if job.status == SUBMITTED), key=lambda job: job.nonce):
+            try:
+                await self.provider.broadcast(job.transactions[-1]["raw"])
+            except Exception as e:
+                # Usually mined already; the watcher finds out
+                print(f"Rebroadcast of {job.tx_hash} for mint job {job.id} failed: {e}")
+        if jobs:
+            self.nonces.reset()
+        for job in jobs:
+            self._track(job)
+            self._resume(job)
+        self._stats["recovered"] += len(jobs)
+        return len(jobs)
+
+    async def _renew_lease(self) -> None:
+        if time.monotonic() - self._last_lease < self.lease_seconds / 3:
+            return
+        self._last_lease = time.monotonic()
+        await self.repository.touch_mint_jobs(self.owner)
+        await self.recover()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.batch_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._renew_lease()
+            except Exception as e:
+                print(f"Mint job lease renewal failed: {e}")
+            try:
+                while await self.process_batch() == self.batch_size:
+                    pass
+            except Exception as e:
+                # Gas price or nonce lookups failed; the jobs stay queued
+                print(f"Mint batch failed: {e}")
+                self.nonces.reset()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._last_lease = time.monotonic()
+            try:
+                await self.recover()
+            except Exception as e:
+                print(f"Mint job recovery failed: {e}")
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for watcher in list(self._watchers):
+            watcher.cancel()
+        if self._watchers:
+            await asyncio.gather(*self._watchers, return_exceptions=True)
+        # Unfinished jobs stay stored; the next process to start claims them right away
+        try:
+            await self.repository.release_mint_jobs(self.owner)
+        except Exception as e:
+            print(f"Failed to release mint jobs: {e}")
+        await self.provider.close()
+
+    def metrics(self) -> dict:
+        return {
+            **self._stats,
+            "queued": len(self._pending),
+            "publishing": sum(1 for job in self._by_key.values() if job.status == PUBLISHING),
+            "awaiting_receipt": sum(1 for job in self._by_key.values() if job.status == SUBMITTED),
+        }
+
+async def publish_metadata(metadata: dict) -> Tuple[str, dict]:
+    from ipfs import get_publisher
+
+    return await get_publisher().publish(metadata)
+
+def create_mint_queue() -> MintQueue:
+    if MINT_PROVIDER == "web3":
+        provider = Web3MintProvider(
+            os.getenv("ETH_RPC_URL", "http://localhost:8545"),
+            os.environ["NFT_CONTRACT_ADDRESS"],
+            os.environ["MINTER_PRIVATE_KEY"]
+        )
+    else:
+        provider = StubMintProvider(float(os.getenv("MINT_STUB_BLOCK_TIME", "0.5")))
+    return MintQueue(provider, publish=publish_metadata)
+
+mint_queue = create_mint_queue()
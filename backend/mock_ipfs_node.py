@@ -0,0 +1,35 @@
+"""
+Mock IPFS Node
+
+Stand-in for the Kubo HTTP API used by ipfs, for local development and tests.
+Objects are kept in memory and every object gets the single-block raw CID,
+whatever its size. Run it standalone with
+
+    uvicorn mock_ipfs_node:app --port 5001
+
+or let the publisher reach it in-process (IPFS_MOCK_NODE=1, the default).
+"""
+
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.responses import Response
+
+from ipfs import raw_cid
+
+OBJECTS = {}
+
+app = FastAPI(title="Mock IPFS Node")
+app.state.add_count = 0
+
+@app.post("/api/v0/add")
+async def add(file: UploadFile):
+    data = await file.read()
+    cid = raw_cid(data)
+    OBJECTS[cid] = data
+    app.state.add_count += 1
+    return {"Name": file.filename, "Hash": cid, "Size": str(len(data))}
+
+@app.get("/ipfs/{cid}")
+async def cat(cid: str):
+    if cid not in OBJECTS:
+        raise HTTPException(status_code=404, detail="Object not found")
+    return Response(OBJECTS[cid], media_type="application/octet-stream")
@@ -0,0 +1,139 @@
+"""
+Mock Symbol Node
+
+Stand-in for the Symbol API (SYMBOL_API_URL) serving fixed sample data, for
+local development and tests. Run it standalone with
+
+    uvicorn mock_symbol_node:app --port 3000
+
+or let SymbolClient reach it in-process (SYMBOL_MOCK_NODE=1, the default).
+MOCK_SYMBOL_LATENCY adds an artificial delay to every response.
+
+Besides the entity lookups it serves the metadata transaction stream the
+indexer tails: every sample card is published once as a Caesar-encrypted
+JSON value under SYMBOL_METADATA_KEY, and POST /metadata/transactions
+appends a new one in the next block.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+
+from fastapi import FastAPI, HTTPException, Query
+
+from symbol_cipher import encrypt_caesar_cipher
+
+LATENCY = float(os.getenv("MOCK_SYMBOL_LATENCY", "0"))
+METADATA_KEY = os.getenv("SYMBOL_METADATA_KEY", "knowledge_card")
+GENESIS_HEIGHT = 1000
+
+SYMBOL_CARDS = {
+    "1": {
+        "id": "1",
+        "title": "Introduction to Blockchain",
+        "content": "Blockchain is a distributed ledger technology that enables secure, transparent transactions without central authorities.",
+        "author": "satoshi",
+        "symbolAddress": "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY",
+        "createdAt": "2025-05-01T12:00:00Z",
+        "imageUrl": "https://images.unsplash.com/photo-1639762681057-408e52192e55?q=80&w=2832&auto=format&fit=crop",
+        "details": "ブロックチェーンは、中央集権的な管理者なしで安全かつ透明性の高い取引を可能にする分散型台帳技術です。各ブロックには複数の取引記録が含まれ、暗号化されたハッシュによって前のブロックと連結されています。この技術は、仮想通貨、スマートコントラクト、サプライチェーン管理など、様々な分野で革新をもたらしています。"
+    },
+    "2": {
+        "id": "2",
+        "title": "Symbol Blockchain Overview",
+        "content": "Symbol is a secure and business-ready blockchain platform with advanced features for enterprise use.",
+        "author": "nemtech",
+        "symbolAddress": "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY",
+        "createdAt": "2025-05-02T14:30:00Z",
+        "imageUrl": "https://images.unsplash.com/photo-1642052502780-8ee67c2c714c?q=80&w=2787&auto=format&fit=crop",
+        "videoUrl": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "details": "Symbolは、エンタープライズ向けの高度な機能を備えた安全なブロックチェーンプラットフォームです。高速なトランザクション処理、プラグイン可能なスマートコントラクト、マルチレベルのマルチシグ機能を提供します。また、エネルギー効率の高いPoS+アルゴリズムを採用し、環境に優しい設計となっています。"
+    },
+    "3": {
+        "id": "3",
+        "title": "NFTs and Digital Ownership",
+        "content": "Non-Fungible Tokens represent unique digital assets and enable verifiable ownership on blockchain.",
+        "author": "cryptoart",
+        "symbolAddress": "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY",
+        "createdAt": "2025-05-03T09:15:00Z",
+        "imageUrl": "https://images.unsplash.com/photo-1620641788421-7a1c342ea42e?q=80&w=2874&auto=format&fit=crop",
+        "details": "NFT（非代替性トークン）は、デジタルアートやコレクティブル、ゲーム内アイテムなどのユニークなデジタル資産を表現し、ブロックチェーン上で検証可能な所有権を可能にします。各NFTは固有の識別子を持ち、その真正性と希少性を保証します。"
+    }
+}
+
+SYMBOL_USERS = {
+    "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY": {
+        "username": "satoshi",
+        "symbolAddress": "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY"
+    }
+}
+
+METADATA_TRANSACTIONS = []
+
+def publish_card(card: dict, key: str = METADATA_KEY) -> dict:
+    height = METADATA_TRANSACTIONS[-1]["height"] + 1 if METADATA_TRANSACTIONS else GENESIS_HEIGHT
+    value = encrypt_caesar_cipher(json.dumps(card, ensure_ascii=False))
+    transaction = {
+        "height": height,
+        "hash": hashlib.sha256(f"{height}:{value}".encode("utf-8")).hexdigest().upper(),
+        "signerAddress": card.get("symbolAddress", ""),
+        "key": key,
+        "value": value,
+    }
+    METADATA_TRANSACTIONS.append(transaction)
+    return transaction
+
+for _card in SYMBOL_CARDS.values():
+    publish_card(_card)
+
+app = FastAPI(title="Mock Symbol Node")
+app.state.request_count = 0
+
+@app.middleware("http")
+async def simulate_node(request, call_next):
+    app.state.request_count += 1
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    return await call_next(request)
+
+@app.get("/cards")
+async def list_cards():
+    return {"cards": list(SYMBOL_CARDS.values())}
+
+@app.get("/cards/{card_id}")
+async def get_card(card_id: str):
+    if card_id not in SYMBOL_CARDS:
+        raise HTTPException(status_code=404, detail="Card not found")
+    return SYMBOL_CARDS[card_id]
+
+@app.get("/users/{address}")
+async def get_user(address: str):
+    if address not in SYMBOL_USERS:
+        raise HTTPException(status_code=404, detail="User not found")
+    return SYMBOL_USERS[address]
+
+@app.get("/chain/height")
+async def get_chain_height():
+    return {"height": METADATA_TRANSACTIONS[-1]["height"] if METADATA_TRANSACTIONS else GENESIS_HEIGHT}
+
+@app.get("/metadata/transactions")
+async def list_metadata_transactions(
+    key: str,
+    fromHeight: int = 0,
+    pageSize: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Metadata transactions under key at or above fromHeight, oldest first,
+    from the offset-th on; like a real node, pages hold at most 100
+    """
+    matching = [tx for tx in METADATA_TRANSACTIONS if tx["key"] == key and tx["height"] >= fromHeight]
+    return {"transactions": matching[offset:offset + min(pageSize, 100)]}
+
+@app.post("/metadata/transactions")
+async def create_metadata_transaction(card: dict):
+    if "id" not in card:
+        raise HTTPException(status_code=400, detail="Card id is required")
+    SYMBOL_CARDS[card["id"]] = card
+    return publish_card(card)
@@ -0,0 +1,131 @@
+"""
+Hot Ranking Module
+
+Ranks cards by time-decayed correct swipes: each swipe is worth 1 when it
+happens and halves every HOT_HALF_LIFE_HOURS, and every card starts with one
+swipe at its creation time so new cards rank by recency.
+
+Decay multiplies every card's score by the same factor, so the order only
+changes when a card is swiped. Scores are therefore stored undecayed,
+relative to a fixed epoch and in log2 space so they never overflow:
+
+    log_score = log2(sum(2 ** ((t - HOT_EPOCH) / half_life)))
+
+and decayed to the current time only when they are read. The best
+HOT_FEED_SIZE cards are kept in a sorted list that is updated per swipe, so a
+page of the hot feed costs O(log K + limit).
+"""
+
+import base64
+import bisect
+import math
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from feed import DEFAULT_PAGE_SIZE, InvalidCursor
+
+HALF_LIFE_HOURS = float(os.getenv("HOT_HALF_LIFE_HOURS", "12"))
+HOT_FEED_SIZE = int(os.getenv("HOT_FEED_SIZE", "1000"))
+HOT_EPOCH = datetime(2024, 1, 1).timestamp()
+
+# Sorted best first: (-log_score, card id)
+HotKey = Tuple[float, str]
+
+def _log2_add(a: float, b: float) -> float:
+    """
+    log2(2 ** a + 2 ** b) without leaving log space
+    """
+    if a < b:
+        a, b = b, a
+    return a + math.log2(1 + 2 ** (b - a))
+
+def encode_cursor(key: HotKey) -> str:
+    raw = f"{key[0]!r}|{key[1]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> HotKey:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, card_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return float(score), card_id
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+class HotRanking:
+    def __init__(self, size: int = HOT_FEED_SIZE, half_life_hours: float = HALF_LIFE_HOURS):
+        self.size = size
+        self.half_life = half_life_hours * 3600
+        self._scores: Dict[str, float] = {}
+        self._top: List[HotKey] = []
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def clear(self) -> None:
+        self._scores.clear()
+        self._top.clear()
+
+    def _exponent(self, timestamp: float) -> float:
+        return (timestamp - HOT_EPOCH) / self.half_life
+
+    def add(self, card: dict) -> None:
+        """
+        Ranks a card; swipes already counted are placed at its creation time
+        """
+        if card["id"] in self._scores:
+            return
+        log_score = math.log2(1 + card["correct_count"]) + self._exponent(card["created_at"].timestamp())
+        self._scores[card["id"]] = log_score
+        self._place(card["id"], None, log_score)
+
+    def interaction(self, card_id: str, count: int = 1, timestamp: Optional[float] = None) -> None:
+        previous = self._scores.get(card_id)
+        if previous is None:
+            return
+        swipe = math.log2(count) + self._exponent(time.time() if timestamp is None else timestamp)
+        log_score = _log2_add(previous, swipe)
+        self._scores[card_id] = log_score
+        self._place(card_id, previous, log_score)
+
+    def _place(self, card_id: str, previous: Optional[float], log_score: float) -> None:
+        top = self._top
+        if previous is not None:
+            old_key = (-previous, card_id)
+            position = bisect.bisect_left(top, old_key)
+            if position < len(top) and top[position] == old_key:
+                del top[position]
+        key = (-log_score, card_id)
+        if len(top) < self.size or key < top[-1]:
+            bisect.insort(top, key)
+            if len(top) > self.size:
+                # Scores only grow, so a card pushed out comes back through _place
+                top.pop()
+
+    def score(self, card_id: str, now: Optional[float] = None) -> Optional[float]:
+        """
+        The card's decayed score at now
+        """
+        log_score = self._scores.get(card_id)
+        if log_score is None:
+            return None
+        return 2 ** (log_score - self._exponent(time.time() if now is None else now))
+
+    def page(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Tuple[str, float]], Optional[str]]:
+        """
+        Returns (card id, decayed score) for one page of the hot feed and the
+        cursor for the next page; the feed ends after the best HOT_FEED_SIZE cards
+        """
+        start = 0 if cursor is None else bisect.bisect_right(self._top, decode_cursor(cursor))
+        page = self._top[start:start + limit]
+        decay = self._exponent(time.time())
+        next_cursor = encode_cursor(page[-1]) if page and start + limit < len(self._top) else None
+        return [(card_id, 2 ** (-negative - decay)) for negative, card_id in page], next_cursor
+
+    def metrics(self) -> dict:
+        return {"ranked_cards": len(self._scores), "top_size": len(self._top)}
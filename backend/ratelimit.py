@@ -0,0 +1,235 @@
+"""
+Rate Limiting Module
+
+Token-bucket rate limiting shared by all workers through Redis: each check
+is a single EVALSHA round trip running a Lua script that refills and takes
+from the bucket atomically. When Redis is unavailable, or fails mid-request,
+checks fall back to an in-process bucket table with a bounded number of keys,
+so limits keep being enforced per worker instead of being switched off.
+
+Usage stays the same as fastapi-limiter:
+
+    @app.post("/chat")
+    async def chat(..., rate_limit: bool = Depends(RateLimiter(times=10, seconds=60))):
+
+Quotas are per route and per client address, and every limited response
+carries X-RateLimit-Limit/Remaining/Reset headers. The address is the socket
+peer; X-Forwarded-For is only followed through the proxies listed in
+RATE_LIMIT_TRUSTED_PROXIES (comma-separated addresses or networks), since any
+client can send the header or an X-User-Id of its choosing.
+"""
+
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request
+
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float
+    retry_after: float
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+class InMemoryBackend:
+    """
+    Per-process token buckets; the least recently used keys are dropped past max_keys
+    A dropped bucket comes back full, which only ever errs on the side of allowing
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, ts = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens
+
+class RedisBackend:
+    def __init__(self, redis):
+        self.redis = redis
+        # register_script sends EVALSHA and only falls back to EVAL on a script cache miss
+        self._script = redis.register_script(TOKEN_BUCKET_LUA)
+
+    async def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        allowed, tokens = await self._script(keys=[key], args=[capacity, rate, time.time(), cost])
+        return int(allowed) == 1, float(tokens)
+
+class RateLimitService:
+    def __init__(self, fallback_max_keys: int = 100000):
+        self.fallback = InMemoryBackend(fallback_max_keys)
+        self.backend = self.fallback
+        self.redis = None
+        self.rejections: Dict[str, int] = {}
+        self.backend_errors = 0
+
+    async def connect(self, url: str) -> bool:
+        from redis import asyncio as aioredis
+
+        try:
+            redis = aioredis.from_url(url, encoding="utf-8", decode_responses=True)
+            await redis.ping()
+        except Exception as e:
+            print(f"Redis connection failed: {e}")
+            print("Rate limiting falls back to in-process buckets")
+            self.backend = self.fallback
+            return False
+        self.redis = redis
+        self.backend = RedisBackend(redis)
+        print("Redis connected successfully")
+        return True
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+        self.backend = self.fallback
+
+    async def take(self, scope: str, key: str, capacity: int, rate: float) -> RateLimitResult:
+        try:
+            allowed, tokens = await self.backend.take(key, capacity, rate)
+        except Exception as e:
+            if self.backend is self.fallback:
+                raise
+            print(f"Rate limit backend error, using in-process buckets: {e}")
+            self.backend_errors += 1
+            allowed, tokens = await self.fallback.take(key, capacity, rate)
+
+        if not allowed:
+            self.rejections[scope] = self.rejections.get(scope, 0) + 1
+        return RateLimitResult(
+            allowed=allowed,
+            limit=capacity,
+            remaining=max(0, int(tokens)),
+            reset_after=(capacity - tokens) / rate,
+            retry_after=0.0 if allowed else (1 - tokens) / rate
+        )
+
+    def metrics(self) -> dict:
+        return {
+            "backend": "redis" if self.backend is not self.fallback else "memory",
+            "backend_errors": self.backend_errors,
+            "rejections": dict(self.rejections),
+        }
+
+rate_limits = RateLimitService()
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+def parse_networks(value: str) -> List[Network]:
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in value.split(",") if part.strip()]
+
+TRUSTED_PROXIES = parse_networks(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", ""))
+
+def is_trusted(host: str, proxies: List[Network]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in proxies)
+
+def client_address(request: Request, proxies: Optional[List[Network]] = None) -> str:
+    """
+    The caller's address: the socket peer, or the nearest X-Forwarded-For hop
+    that was not added by one of the trusted proxies
+    """
+    proxies = TRUSTED_PROXIES if proxies is None else proxies
+    host = request.client.host if request.client else "unknown"
+    if not is_trusted(host, proxies):
+        return host
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    # Each proxy appends the address it received from, so walk back from the right
+    for hop in reversed(hops):
+        if not is_trusted(hop, proxies):
+            return hop
+        host = hop
+    return host
+
+def default_identifier(request: Request) -> str:
+    return f"ip:{client_address(request)}"
+
+class RateLimiter:
+    """
+    FastAPI dependency allowing `times` requests per `seconds` per caller and route
+    """
+
+    def __init__(
+        self,
+        times: int,
+        seconds: int = 0,
+        minutes: int = 0,
+        identifier: Callable[[Request], str] = default_identifier,
+        scope: Optional[str] = None
+    ):
+        period = seconds + 60 * minutes
+        if times <= 0 or period <= 0:
+            raise ValueError("RateLimiter needs a positive number of requests and period")
+        self.capacity = times
+        self.rate = times / period
+        self.identifier = identifier
+        self.scope = scope
+
+    async def __call__(self, request: Request) -> bool:
+        route = request.scope.get("route")
+        scope = self.scope or (route.path if route else request.url.path)
+        key = f"ratelimit:{scope}:{self.identifier(request)}"
+        result = await rate_limits.take(scope, key, self.capacity, self.rate)
+        request.state.rate_limit = result
+        if not result.allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="リクエストが多すぎます。しばらくしてから再度お試しください。",
+                headers=result.headers()
+            )
+        return True
+
+async def rate_limit_headers(request: Request, call_next):
+    """
+    HTTP middleware copying the remaining budget onto successful responses
+    """
+    response = await call_next(request)
+    result = getattr(request.state, "rate_limit", None)
+    if result is not None:
+        response.headers.update(result.headers())
+    return response
@@ -0,0 +1,116 @@
+"""
+Response Cache Module
+
+Keeps the JSON of read-heavy entities (feed cards, Symbol cards) already
+serialized, so list and detail responses are assembled from cached bytes
+instead of being validated by a response_model and encoded again.
+
+Each entity key ("card:<id>", "symbol:<id>") has a version that is bumped
+whenever the entity changes; cached bytes are only served for the version
+they were built from. Response ETags are derived from the versions alone, so
+a request with a matching If-None-Match gets a 304 before any entity is
+loaded or serialized.
+
+Encoding uses orjson when it is installed and the standard library otherwise.
+Versions live in process memory, like the card indexes they accompany.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # The standard library encoder is used without orjson
+    orjson = None
+
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "50000"))
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def join_array(items: Iterable[bytes]) -> bytes:
+    return b"[" + b",".join(items) + b"]"
+
+class ResponseCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._versions: Dict[str, int] = {}
+        # Versions restart with the process, so ETags from another run must not match
+        self._instance = uuid.uuid4().hex
+        self._entries: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+    def version(self, key: str) -> int:
+        return self._versions.get(key, 0)
+
+    def invalidate(self, key: str) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._entries.pop(key, None)
+        self._stats["invalidations"] += 1
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != self.version(key):
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry[1]
+
+    def put(self, key: str, version: int, data: bytes) -> None:
+        """
+        Stores data built from the entity at version; dropped if it changed since
+        """
+        if self.max_entries <= 0 or version != self.version(key):
+            return
+        self._entries[key] = (version, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def etag(self, *parts) -> str:
+        digest = hashlib.blake2b(repr((self._instance, parts)).encode("utf-8"), digest_size=12).hexdigest()
+        return f'"{digest}"'
+
+    def entity_etag(self, keys: List[str], *parts) -> str:
+        return self.etag([(key, self.version(key)) for key in keys], *parts)
+
+    def not_modified(self, request: Request, etag: str) -> Optional[Response]:
+        """
+        A 304 response if the client already has etag
+        """
+        header = request.headers.get("if-none-match")
+        if header is None:
+            return None
+        tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+        if etag in tags or "*" in tags:
+            self._stats["not_modified"] += 1
+            return Response(status_code=304, headers={"ETag": etag})
+        return None
+
+    def respond(self, body: bytes, etag: str) -> Response:
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    def metrics(self) -> dict:
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "encoder": "orjson" if orjson is not None else "json",
+        }
+
+response_cache = ResponseCache()
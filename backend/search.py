@@ -0,0 +1,229 @@
+"""
+Card Search Module
+
+Incrementally maintained inverted index over card titles, contents and tags.
+
+Text is NFKC-normalized and lowercased. Japanese (kana and kanji) runs are
+indexed as character bigrams, since they have no spaces to split on; a one
+character run is indexed as-is. Everything else is split into words. Each
+card has one weighted posting per term (title and tags count more than the
+content), and results are ranked with BM25 over those weighted frequencies.
+
+Every query term must match. A term ending in * (and the last term when the
+query is a prefix query) matches every indexed term it starts, capped at
+MAX_PREFIX_TERMS of the most frequent. Scoring is bounded: when the rarest
+query term matches more than MAX_CANDIDATES cards, only the newest
+MAX_CANDIDATES of them are ranked, so latency does not grow with the corpus.
+"""
+
+import base64
+import bisect
+import heapq
+import itertools
+import math
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from feed import DEFAULT_PAGE_SIZE, InvalidCursor
+
+MAX_CANDIDATES = 10000
+MAX_PREFIX_TERMS = 64
+# Prefix expansions look at this many vocabulary terms to pick the most frequent
+MAX_PREFIX_SCAN = 4096
+
+FIELD_WEIGHTS = {"title": 2.0, "tags": 2.0, "content": 1.0}
+K1 = 1.2
+B = 0.75
+
+# Hiragana, katakana and CJK ideographs
+CJK_RUN = re.compile(r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)")
+WORD = re.compile(r"[^\W_]+")
+# Exact tag terms cannot collide with text terms
+TAG_PREFIX = "\x00"
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).lower()
+
+def tokenize(text: str) -> List[str]:
+    """
+    Words for alphabetic text, character bigrams for Japanese runs
+    """
+    tokens = []
+    for i, part in enumerate(CJK_RUN.split(normalize(text))):
+        if i % 2:
+            if len(part) == 1:
+                tokens.append(part)
+            else:
+                tokens.extend(part[j:j + 2] for j in range(len(part) - 1))
+        else:
+            tokens.extend(WORD.findall(part))
+    return tokens
+
+def _is_cjk(term: str) -> bool:
+    return CJK_RUN.fullmatch(term) is not None
+
+def encode_cursor(key: Tuple[float, str]) -> str:
+    raw = f"{key[0]!r}|{key[1]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, card_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return float(score), card_id
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+class SearchIndex:
+    def __init__(self):
+        # Documents are numbered in the order they are added
+        self._card_ids: List[str] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._lengths: List[float] = []
+        self._total_length = 0.0
+        self._posting_count = 0
+        self._postings: Dict[str, Dict[int, float]] = {}
+        # Sorted vocabulary for prefix expansion
+        self._vocabulary: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._card_ids)
+
+    def clear(self) -> None:
+        self._card_ids.clear()
+        self._doc_ids.clear()
+        self._lengths.clear()
+        self._total_length = 0.0
+        self._posting_count = 0
+        self._postings.clear()
+        self._vocabulary.clear()
+
+    def add(self, card: dict) -> None:
+        if card["id"] in self._doc_ids:
+            return
+        doc = len(self._card_ids)
+        self._card_ids.append(card["id"])
+        self._doc_ids[card["id"]] = doc
+
+        frequencies: Dict[str, float] = {}
+        length = 0.0
+        tags = card.get("tags") or []
+        fields = {"title": card["title"], "content": card["content"], "tags": " ".join(tags)}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+                length += weight
+        for tag in tags:
+            frequencies[TAG_PREFIX + normalize(tag)] = 0.0
+
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if not term.startswith(TAG_PREFIX):
+                    bisect.insort(self._vocabulary, term)
+            postings[doc] = frequency
+        self._posting_count += len(frequencies)
+        self._lengths.append(length)
+        self._total_length += length
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in itertools.islice(self._vocabulary, start, start + MAX_PREFIX_SCAN):
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        if len(terms) > MAX_PREFIX_TERMS:
+            terms = heapq.nlargest(MAX_PREFIX_TERMS, terms, key=lambda t: len(self._postings[t]))
+        return terms
+
+    def _parse(self, query: str, prefix: bool) -> List[List[str]]:
+        """
+        Query slots; each slot is the list of terms that can satisfy it
+        """
+        words = query.split()
+        slots = []
+        for i, word in enumerate(words):
+            is_prefix = word.endswith("*") or (prefix and i == len(words) - 1)
+            tokens = tokenize(word.rstrip("*"))
+            for j, token in enumerate(tokens):
+                if (is_prefix and j == len(tokens) - 1) or (len(token) == 1 and _is_cjk(token)):
+                    # A lone kanji or kana only appears inside indexed bigrams
+                    slots.append(sorted(set(self._expand(token)) | {token}))
+                else:
+                    slots.append([token])
+        return slots
+
+    def search(
+        self,
+        query: str,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        tag: Optional[str] = None,
+        prefix: bool = False
+    ) -> Tuple[List[Tuple[str, float]], Optional[str]]:
+        """
+        Returns one page of (card id, score), best first, and the cursor for
+        the next page; the cursor is None after the last page
+        """
+        after = decode_cursor(cursor) if cursor is not None else None
+        slots = [
+            [self._postings[term] for term in terms if term in self._postings]
+            for terms in self._parse(query, prefix)
+        ]
+        if tag is not None:
+            slots.append([self._postings.get(TAG_PREFIX + normalize(tag), {})])
+        if not slots or any(not postings for postings in slots):
+            return [], None
+
+        # Candidates come from the slot matching the fewest cards, newest first;
+        # documents are numbered in insertion order, so reversed postings are newest first
+        sizes = [sum(len(p) for p in postings) for postings in slots]
+        smallest = slots[sizes.index(min(sizes))]
+        if len(smallest) == 1:
+            newest = reversed(smallest[0])
+        else:
+            merged = heapq.merge(*(reversed(p) for p in smallest), reverse=True)
+            newest = (doc for doc, _ in itertools.groupby(merged))
+        candidates = itertools.islice(newest, MAX_CANDIDATES)
+
+        count = len(self._card_ids)
+        average_length = self._total_length / count if count else 0.0
+        idf = [
+            [math.log(1 + (count - len(p) + 0.5) / (len(p) + 0.5)) for p in postings]
+            for postings in slots
+        ]
+        ranked = []
+        for doc in candidates:
+            score = 0.0
+            norm = K1 * (1 - B + B * self._lengths[doc] / average_length) if average_length else K1
+            for postings, weights in zip(slots, idf):
+                matched = False
+                for p, weight in zip(postings, weights):
+                    frequency = p.get(doc)
+                    if frequency is not None:
+                        matched = True
+                        score += weight * frequency * (K1 + 1) / (frequency + norm)
+                if not matched:
+                    break
+            else:
+                key = (-score, self._card_ids[doc])
+                if after is None or key > (-after[0], after[1]):
+                    ranked.append(key)
+
+        page = heapq.nsmallest(limit + 1, ranked)
+        more = len(page) > limit
+        results = [(card_id, -negative) for negative, card_id in page[:limit]]
+        next_cursor = encode_cursor(results[-1][::-1]) if more else None
+        return results, next_cursor
+
+    def metrics(self) -> dict:
+        return {
+            "documents": len(self._card_ids),
+            "terms": len(self._postings),
+            "vocabulary": len(self._vocabulary),
+            "postings": self._posting_count,
+        }
@@ -0,0 +1,925 @@
+"""
+Storage Module
+
+Repository abstraction over users, cards, token transactions and NFT records.
+The backend is selected from DATABASE_URL:
+
+- unset or memory://        in-process dicts (data is lost on restart)
+- sqlite:///path/to/file.db SQLite, pooled connections driven from worker threads
+- postgresql://...          PostgreSQL through psycopg's async connection pool
+
+Records are plain dicts shaped like the API responses in main.py.
+token_transactions is an append-only log numbered per user (seq);
+token_balances holds periodic per-user balance snapshots taken at a seq.
+card_changes logs card writes (saved cards, correct_count deltas, NFTs)
+tagged with the writing process's origin, so workers sharing the database
+can follow each other's writes (see card_sync.py).
+mint_jobs holds the mint queue's jobs as JSON, each leased to the process
+(owner) working on it; a key has at most one job that has not failed.
+"""
+
+import asyncio
+import json
+import sqlite3
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+class ConflictError(Exception):
+    """
+    A write collided with a unique key another writer got to first
+    """
+
+class Repository(ABC):
+    """
+    Storage backends implement every abstract method; instantiating one that
+    misses any fails right away
+    """
+
+    def __init__(self):
+        # Identifies this process's writes in card_changes
+        self.origin = uuid.uuid4().hex
+
+    async def connect(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def get_user(self, user_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def save_user(self, user: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def find_user_by_email(self, email: str) -> Optional[dict]:
+        """
+        The earliest user signed up with the email
+        """
+
+    async def get_card(self, card_id: str) -> Optional[dict]:
+        cards = await self.get_cards([card_id])
+        return cards[0] if cards else None
+
+    @abstractmethod
+    async def get_cards(self, card_ids: List[str]) -> List[dict]:
+        """
+        Fetches cards in the order of card_ids, skipping unknown ids
+        """
+
+    @abstractmethod
+    async def list_cards(self) -> List[dict]:
+        ...
+
+    async def save_card(self, card: dict) -> None:
+        await self.save_cards([card])
+
+    @abstractmethod
+    async def save_cards(self, cards: List[dict]) -> None:
+        ...
+
+    @abstractmethod
+    async def increment_correct_counts(self, deltas: Dict[str, int]) -> None:
+        ...
+
+    @abstractmethod
+    async def add_transactions(self, transactions: List[dict]) -> None:
+        """
+        Appends token transactions; raises ConflictError if a (user_id, seq) is taken
+        """
+
+    @abstractmethod
+    async def list_transactions(self, user_id: str, after_seq: int = 0) -> List[dict]:
+        """
+        Transactions of a user with seq above after_seq, in seq order
+        """
+
+    @abstractmethod
+    async def get_balance_snapshot(self, user_id: str) -> Optional[Tuple[int, int]]:
+        """
+        Returns (balance, seq) of the user's last snapshot
+        """
+
+    @abstractmethod
+    async def save_balance_snapshots(self, snapshots: List[Tuple[str, int, int]]) -> None:
+        """
+        Stores (user_id, balance, seq) snapshots
+        """
+
+    @abstractmethod
+    async def save_nft(self, card_id: str, nft_data: dict) -> None:
+        """
+        Records the NFT and stores it as the card's nft_status
+        """
+
+    async def last_card_change_id(self) -> int:
+        return 0
+
+    async def list_card_changes(self, after_id: int, limit: int = 1000) -> List[dict]:
+        """
+        Card changes with id above after_id, in id order
+        """
+        return []
+
+    async def prune_card_changes(self, before: datetime) -> None:
+        pass
+
+    @abstractmethod
+    async def set_nft_status(self, card_id: str, nft_status: Optional[dict]) -> None:
+        """
+        Replaces the card's nft_status without recording an NFT (e.g. a pending mint)
+        """
+
+    @abstractmethod
+    async def create_mint_job(self, job: dict, owner: str) -> bool:
+        """
+        Stores a new mint job leased to owner
+        Returns False if its key already has a job that has not failed
+        """
+
+    @abstractmethod
+    async def save_mint_job(self, job: dict, owner: str) -> bool:
+        """
+        Updates a job and renews its lease; False if owner no longer holds it
+        """
+
+    @abstractmethod
+    async def get_mint_job(self, job_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def find_mint_job(self, key: str) -> Optional[dict]:
+        """
+        The job for key that has not failed, if there is one
+        """
+
+    @abstractmethod
+    async def claim_mint_jobs(self, owner: str, stale_before: datetime) -> List[dict]:
+        """
+        Takes over the unfinished jobs whose lease was last renewed before stale_before
+        """
+
+    @abstractmethod
+    async def touch_mint_jobs(self, owner: str) -> None:
+        """
+        Renews the lease on every unfinished job held by owner
+        """
+
+    @abstractmethod
+    async def release_mint_jobs(self, owner: str) -> None:
+        """
+        Gives up owner's unfinished jobs so the next claim takes them right away
+        """
+
+# Statuses of mint jobs that are still being worked on
+LIVE_MINT_STATUSES = ("publishing", "queued", "submitted")
+FAILED_MINT_STATUS = "failed"
+
+class InMemoryRepository(Repository):
+    """
+    Dict-backed repository; returned records are the stored dicts themselves
+    It cannot be shared between processes, so no card changes are logged
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.users: Dict[str, dict] = {}
+        self.cards: Dict[str, dict] = {}
+        self.token_transactions: Dict[str, dict] = {}
+        # (user_id, seq) pairs in token_transactions, unique like the SQL index
+        self.transaction_seqs: Set[Tuple[str, int]] = set()
+        self.token_balances: Dict[str, Tuple[int, int]] = {}
+        self.nft_cards: Dict[str, dict] = {}
+        # job id -> (job, owner, lease renewed at)
+        self.mint_jobs: Dict[str, Tuple[dict, str, datetime]] = {}
+
+    async def get_user(self, user_id: str) -> Optional[dict]:
+        return self.users.get(user_id)
+
+    async def save_user(self, user: dict) -> None:
+        self.users[user["id"]] = user
+
+    async def find_user_by_email(self, email: str) -> Optional[dict]:
+        matches = [user for user in self.users.values() if user["email"] == email]
+        return min(matches, key=lambda user: user["created_at"]) if matches else None
+
+    async def get_cards(self, card_ids: List[str]) -> List[dict]:
+        return [self.cards[card_id] for card_id in card_ids if card_id in self.cards]
+
+    async def list_cards(self) -> List[dict]:
+        return list(self.cards.values())
+
+    async def save_cards(self, cards: List[dict]) -> None:
+        for card in cards:
+            self.cards[card["id"]] = card
+
+    async def increment_correct_counts(self, deltas: Dict[str, int]) -> None:
+        for card_id, delta in deltas.items():
+            if card_id in self.cards:
+                self.cards[card_id]["correct_count"] += delta
+
+    async def add_transactions(self, transactions: List[dict]) -> None:
+        seqs = [(t["user_id"], t["seq"]) for t in transactions]
+        if len(set(seqs)) < len(seqs) or any(seq in self.transaction_seqs for seq in seqs):
+            raise ConflictError("token transaction seq already taken")
+        for transaction in transactions:
+            self.token_transactions[transaction["id"]] = transaction
+        self.transaction_seqs.update(seqs)
+
+    async def list_transactions(self, user_id: str, after_seq: int = 0) -> List[dict]:
+        return sorted(
+            (t for t in self.token_transactions.values() if t["user_id"] == user_id and t["seq"] > after_seq),
+            key=lambda t: t["seq"]
+        )
+
+    async def get_balance_snapshot(self, user_id: str) -> Optional[Tuple[int, int]]:
+        return self.token_balances.get(user_id)
+
+    async def save_balance_snapshots(self, snapshots: List[Tuple[str, int, int]]) -> None:
+        for user_id, balance, seq in snapshots:
+            self.token_balances[user_id] = (balance, seq)
+
+    async def save_nft(self, card_id: str, nft_data: dict) -> None:
+        self.nft_cards[card_id] = nft_data
+        if card_id in self.cards:
+            self.cards[card_id]["nft_status"] = nft_data
+
+    async def set_nft_status(self, card_id: str, nft_status: Optional[dict]) -> None:
+        if card_id in self.cards:
+            self.cards[card_id]["nft_status"] = nft_status
+
+    async def create_mint_job(self, job: dict, owner: str) -> bool:
+        if await self.find_mint_job(job["key"]) is not None:
+            return False
+        self.mint_jobs[job["id"]] = (dict(job), owner, datetime.now())
+        return True
+
+    async def save_mint_job(self, job: dict, owner: str) -> bool:
+        entry = self.mint_jobs.get(job["id"])
+        if entry is None or entry[1] != owner:
+            return False
+        self.mint_jobs[job["id"]] = (dict(job), owner, datetime.now())
+        return True
+
+    async def get_mint_job(self, job_id: str) -> Optional[dict]:
+        entry = self.mint_jobs.get(job_id)
+        return dict(entry[0]) if entry else None
+
+    async def find_mint_job(self, key: str) -> Optional[dict]:
+        for job, _, _ in self.mint_jobs.values():
+            if job["key"] == key and job["status"] != FAILED_MINT_STATUS:
+                return dict(job)
+        return None
+
+    async def claim_mint_jobs(self, owner: str, stale_before: datetime) -> List[dict]:
+        claimed = []
+        now = datetime.now()
+        for job_id, (job, holder, renewed_at) in list(self.mint_jobs.items()):
+            if job["status"] in LIVE_MINT_STATUSES and holder != owner and renewed_at < stale_before:
+                self.mint_jobs[job_id] = (job, owner, now)
+                claimed.append(dict(job))
+        return claimed
+
+    async def touch_mint_jobs(self, owner: str) -> None:
+        now = datetime.now()
+        for job_id, (job, holder, _) in list(self.mint_jobs.items()):
+            if holder == owner and job["status"] in LIVE_MINT_STATUSES:
+                self.mint_jobs[job_id] = (job, owner, now)
+
+    async def release_mint_jobs(self, owner: str) -> None:
+        for job_id, (job, holder, _) in list(self.mint_jobs.items()):
+            if holder == owner and job["status"] in LIVE_MINT_STATUSES:
+                self.mint_jobs[job_id] = (job, "", datetime.min)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        email TEXT NOT NULL,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        token_balance INTEGER NOT NULL,
+        created_at {timestamp} NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS users_email ON users (email)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cards (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        author_id TEXT NOT NULL,
+        media_urls TEXT NOT NULL,
+        tags TEXT NOT NULL,
+        correct_count INTEGER NOT NULL DEFAULT 0,
+        created_at {timestamp} NOT NULL,
+        nft_status TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS token_transactions (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        card_id TEXT,
+        created_at {timestamp} NOT NULL,
+        seq INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS token_transactions_user_seq ON token_transactions (user_id, seq)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS token_balances (
+        user_id TEXT PRIMARY KEY,
+        balance INTEGER NOT NULL,
+        seq INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS nft_cards (
+        card_id TEXT PRIMARY KEY,
+        nft_data TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS card_changes (
+        id {serial},
+        card_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        delta INTEGER NOT NULL,
+        origin TEXT NOT NULL,
+        created_at {timestamp} NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS card_changes_created_at ON card_changes (created_at)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS mint_jobs (
+        id TEXT PRIMARY KEY,
+        key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        data TEXT NOT NULL,
+        renewed_at {timestamp} NOT NULL
+    )
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS mint_jobs_key ON mint_jobs (key) WHERE status <> 'failed'
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS mint_jobs_status ON mint_jobs (status, renewed_at)
+    """,
+]
+
+USER_COLUMNS = ["id", "email", "username", "password", "token_balance", "created_at"]
+CARD_COLUMNS = ["id", "title", "content", "author_id", "media_urls", "tags",
+                "correct_count", "created_at", "nft_status"]
+TRANSACTION_COLUMNS = ["id", "user_id", "amount", "kind", "card_id", "created_at", "seq"]
+CHANGE_COLUMNS = ["id", "card_id", "kind", "delta", "origin", "created_at"]
+MINT_JOB_COLUMNS = ["id", "key", "status", "owner", "data", "renewed_at"]
+
+def _upsert(table: str, columns: List[str], placeholder: str) -> str:
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns[1:])
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join([placeholder] * len(columns))}) "
+        f"ON CONFLICT ({columns[0]}) DO UPDATE SET {updates}"
+    )
+
+class SQLRepository(Repository):
+    """
+    Shared row mapping and SQL for the SQLite and PostgreSQL backends
+    Statements are built once so the drivers can reuse their prepared forms
+    """
+
+    placeholder = "?"
+    timestamp_type = "TEXT"
+    serial_type = "INTEGER PRIMARY KEY AUTOINCREMENT"
+
+    def __init__(self):
+        super().__init__()
+        p = self.placeholder
+        self.sql_save_user = _upsert("users", USER_COLUMNS, p)
+        self.sql_save_card = _upsert("cards", CARD_COLUMNS, p)
+        self.sql_add_transaction = _upsert("token_transactions", TRANSACTION_COLUMNS, p)
+        self.sql_save_nft = _upsert("nft_cards", ["card_id", "nft_data"], p)
+        self.sql_save_balance = _upsert("token_balances", ["user_id", "balance", "seq"], p)
+        self.sql_get_balance = f"SELECT balance, seq FROM token_balances WHERE user_id = {p}"
+        self.sql_list_transactions = (
+            f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM token_transactions "
+            f"WHERE user_id = {p} AND seq > {p} ORDER BY seq"
+        )
+        self.sql_get_user = f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE id = {p}"
+        self.sql_find_user_by_email = (
+            f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE email = {p} ORDER BY created_at LIMIT 1"
+        )
+        self.sql_list_cards = f"SELECT {', '.join(CARD_COLUMNS)} FROM cards"
+        self.sql_increment = f"UPDATE cards SET correct_count = correct_count + {p} WHERE id = {p}"
+        self.sql_set_nft_status = f"UPDATE cards SET nft_status = {p} WHERE id = {p}"
+        self.sql_add_change = (
+            f"INSERT INTO card_changes ({', '.join(CHANGE_COLUMNS[1:])}) "
+            f"VALUES ({', '.join([p] * (len(CHANGE_COLUMNS) - 1))})"
+        )
+        self.sql_last_change = "SELECT COALESCE(MAX(id), 0) FROM card_changes"
+        self.sql_list_changes = (
+            f"SELECT {', '.join(CHANGE_COLUMNS)} FROM card_changes "
+            f"WHERE id > {p} ORDER BY id LIMIT {p}"
+        )
+        self.sql_prune_changes = f"DELETE FROM card_changes WHERE created_at < {p}"
+        live = ", ".join(f"'{status}'" for status in LIVE_MINT_STATUSES)
+        self.sql_create_mint_job = (
+            f"INSERT INTO mint_jobs ({', '.join(MINT_JOB_COLUMNS)}) "
+            f"VALUES ({', '.join([p] * len(MINT_JOB_COLUMNS))})"
+        )
+        self.sql_save_mint_job = (
+            f"UPDATE mint_jobs SET status = {p}, data = {p}, renewed_at = {p} WHERE id = {p} AND owner = {p}"
+        )
+        self.sql_get_mint_job = f"SELECT data FROM mint_jobs WHERE id = {p}"
+        self.sql_find_mint_job = f"SELECT data FROM mint_jobs WHERE key = {p} AND status <> 'failed'"
+        self.sql_claim_mint_jobs = (
+            f"UPDATE mint_jobs SET owner = {p}, renewed_at = {p} "
+            f"WHERE status IN ({live}) AND owner <> {p} AND renewed_at < {p} RETURNING data"
+        )
+        self.sql_touch_mint_jobs = (
+            f"UPDATE mint_jobs SET renewed_at = {p} WHERE owner = {p} AND status IN ({live})"
+        )
+        self.sql_release_mint_jobs = (
+            f"UPDATE mint_jobs SET owner = '', renewed_at = {p} WHERE owner = {p} AND status IN ({live})"
+        )
+
+    def schema(self) -> List[str]:
+        return [
+            statement.format(timestamp=self.timestamp_type, serial=self.serial_type)
+            for statement in SCHEMA
+        ]
+
+    def dump_datetime(self, value: datetime) -> Any:
+        return value
+
+    def load_datetime(self, value: Any) -> datetime:
+        return value
+
+    def user_to_row(self, user: dict) -> tuple:
+        return tuple(
+            self.dump_datetime(user[c]) if c == "created_at" else user[c]
+            for c in USER_COLUMNS
+        )
+
+    def row_to_user(self, row: Iterable) -> dict:
+        user = dict(zip(USER_COLUMNS, row))
+        user["created_at"] = self.load_datetime(user["created_at"])
+        return user
+
+    def card_to_row(self, card: dict) -> tuple:
+        nft_status = card.get("nft_status")
+        return (
+            card["id"],
+            card["title"],
+            card["content"],
+            card["author_id"],
+            json.dumps(card.get("media_urls") or []),
+            json.dumps(card.get("tags") or []),
+            card.get("correct_count", 0),
+            self.dump_datetime(card["created_at"]),
+            json.dumps(nft_status) if nft_status is not None else None,
+        )
+
+    def row_to_card(self, row: Iterable) -> dict:
+        card = dict(zip(CARD_COLUMNS, row))
+        card["media_urls"] = json.loads(card["media_urls"])
+        card["tags"] = json.loads(card["tags"])
+        card["created_at"] = self.load_datetime(card["created_at"])
+        if card["nft_status"] is not None:
+            card["nft_status"] = json.loads(card["nft_status"])
+        return card
+
+    def transaction_to_row(self, transaction: dict) -> tuple:
+        return tuple(
+            self.dump_datetime(transaction[c]) if c == "created_at" else transaction.get(c)
+            for c in TRANSACTION_COLUMNS
+        )
+
+    def row_to_transaction(self, row: Iterable) -> dict:
+        transaction = dict(zip(TRANSACTION_COLUMNS, row))
+        transaction["created_at"] = self.load_datetime(transaction["created_at"])
+        return transaction
+
+    def mint_job_row(self, job: dict, owner: str) -> tuple:
+        return (job["id"], job["key"], job["status"], owner, json.dumps(job), self.dump_datetime(datetime.now()))
+
+    def change_rows(self, kind: str, deltas: Dict[str, int]) -> List[tuple]:
+        now = self.dump_datetime(datetime.now())
+        return [(card_id, kind, delta, self.origin, now) for card_id, delta in deltas.items()]
+
+    def row_to_change(self, row: Iterable) -> dict:
+        change = dict(zip(CHANGE_COLUMNS, row))
+        change["created_at"] = self.load_datetime(change["created_at"])
+        return change
+
+    @staticmethod
+    def order_cards(card_ids: List[str], cards: List[dict]) -> List[dict]:
+        by_id = {card["id"]: card for card in cards}
+        return [by_id[card_id] for card_id in card_ids if card_id in by_id]
+
+class SQLiteRepository(SQLRepository):
+    """
+    SQLite backend for local use and tests
+    sqlite3 is blocking, so each statement runs on a worker thread with a
+    connection checked out of a fixed-size pool; WAL mode lets readers proceed
+    while a batch is being written
+    """
+
+    # SQLite's default limit on host parameters per statement is 999
+    max_parameters = 900
+
+    def __init__(self, path: str, pool_size: int = 4):
+        super().__init__()
+        self.path = path
+        # Every connection to :memory: would open a separate database
+        self.pool_size = 1 if path == ":memory:" else pool_size
+        self._pool: Optional[asyncio.Queue] = None
+
+    def dump_datetime(self, value: datetime) -> str:
+        return value.isoformat()
+
+    def load_datetime(self, value: str) -> datetime:
+        return datetime.fromisoformat(value)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    async def connect(self) -> None:
+        if self._pool is not None:
+            return
+        connections = [await asyncio.to_thread(self._open) for _ in range(self.pool_size)]
+
+        def create_schema(conn: sqlite3.Connection) -> None:
+            with conn:
+                for statement in self.schema():
+                    conn.execute(statement)
+
+        await asyncio.to_thread(create_schema, connections[0])
+        self._pool = asyncio.Queue()
+        for conn in connections:
+            self._pool.put_nowait(conn)
+
+    async def close(self) -> None:
+        if self._pool is None:
+            return
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        self._pool = None
+
+    async def _run(self, fn, *args):
+        await self.connect()
+        conn = await self._pool.get()
+        try:
+            return await asyncio.to_thread(fn, conn, *args)
+        finally:
+            self._pool.put_nowait(conn)
+
+    async def _write_many(self, sql: str, rows: List[tuple], *more: Tuple[str, List[tuple]]) -> None:
+        """
+        Runs each (sql, rows) batch with executemany in one transaction
+        """
+        if not rows:
+            return
+
+        def write(conn: sqlite3.Connection) -> None:
+            with conn:
+                for statement, batch in ((sql, rows),) + more:
+                    conn.executemany(statement, batch)
+
+        await self._run(write)
+
+    async def get_user(self, user_id: str) -> Optional[dict]:
+        row = await self._run(lambda conn: conn.execute(self.sql_get_user, (user_id,)).fetchone())
+        return self.row_to_user(row) if row else None
+
+    async def save_user(self, user: dict) -> None:
+        await self._write_many(self.sql_save_user, [self.user_to_row(user)])
+
+    async def find_user_by_email(self, email: str) -> Optional[dict]:
+        row = await self._run(lambda conn: conn.execute(self.sql_find_user_by_email, (email,)).fetchone())
+        return self.row_to_user(row) if row else None
+
+    async def get_cards(self, card_ids: List[str]) -> List[dict]:
+        def fetch(conn: sqlite3.Connection) -> List[tuple]:
+            rows = []
+            for i in range(0, len(card_ids), self.max_parameters):
+                chunk = card_ids[i:i + self.max_parameters]
+                sql = f"{self.sql_list_cards} WHERE id IN ({', '.join('?' * len(chunk))})"
+                rows.extend(conn.execute(sql, chunk).fetchall())
+            return rows
+
+        if not card_ids:
+            return []
+        rows = await self._run(fetch)
+        return self.order_cards(card_ids, [self.row_to_card(row) for row in rows])
+
+    async def list_cards(self) -> List[dict]:
+        rows = await self._run(lambda conn: conn.execute(self.sql_list_cards).fetchall())
+        return [self.row_to_card(row) for row in rows]
+
+    async def save_cards(self, cards: List[dict]) -> None:
+        await self._write_many(
+            self.sql_save_card, [self.card_to_row(card) for card in cards],
+            (self.sql_add_change, self.change_rows("card", {card["id"]: 0 for card in cards}))
+        )
+
+    async def increment_correct_counts(self, deltas: Dict[str, int]) -> None:
+        await self._write_many(
+            self.sql_increment, [(delta, card_id) for card_id, delta in deltas.items()],
+            (self.sql_add_change, self.change_rows("correct", deltas))
+        )
+
+    async def add_transactions(self, transactions: List[dict]) -> None:
+        try:
+            await self._write_many(
+                self.sql_add_transaction, [self.transaction_to_row(t) for t in transactions]
+            )
+        except sqlite3.IntegrityError as e:
+            raise ConflictError(str(e)) from e
+
+    async def list_transactions(self, user_id: str, after_seq: int = 0) -> List[dict]:
+        rows = await self._run(
+            lambda conn: conn.execute(self.sql_list_transactions, (user_id, after_seq)).fetchall()
+        )
+        return [self.row_to_transaction(row) for row in rows]
+
+    async def get_balance_snapshot(self, user_id: str) -> Optional[Tuple[int, int]]:
+        row = await self._run(lambda conn: conn.execute(self.sql_get_balance, (user_id,)).fetchone())
+        return (row[0], row[1]) if row else None
+
+    async def save_balance_snapshots(self, snapshots: List[Tuple[str, int, int]]) -> None:
+        await self._write_many(self.sql_save_balance, list(snapshots))
+
+    async def save_nft(self, card_id: str, nft_data: dict) -> None:
+        encoded = json.dumps(nft_data)
+
+        def write(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute(self.sql_save_nft, (card_id, encoded))
+                conn.execute(self.sql_set_nft_status, (encoded, card_id))
+                conn.executemany(self.sql_add_change, self.change_rows("nft", {card_id: 0}))
+
+        await self._run(write)
+
+    async def last_card_change_id(self) -> int:
+        row = await self._run(lambda conn: conn.execute(self.sql_last_change).fetchone())
+        return row[0]
+
+    async def list_card_changes(self, after_id: int, limit: int = 1000) -> List[dict]:
+        rows = await self._run(
+            lambda conn: conn.execute(self.sql_list_changes, (after_id, limit)).fetchall()
+        )
+        return [self.row_to_change(row) for row in rows]
+
+    async def prune_card_changes(self, before: datetime) -> None:
+        await self._write_many(self.sql_prune_changes, [(self.dump_datetime(before),)])
+
+    async def set_nft_status(self, card_id: str, nft_status: Optional[dict]) -> None:
+        encoded = json.dumps(nft_status) if nft_status is not None else None
+        await self._write_many(self.sql_set_nft_status, [(encoded, card_id)])
+
+    async def _update(self, sql: str, params: tuple) -> int:
+        def write(conn: sqlite3.Connection) -> int:
+            with conn:
+                return conn.execute(sql, params).rowcount
+
+        return await self._run(write)
+
+    async def _update_returning(self, sql: str, params: tuple) -> List[tuple]:
+        def write(conn: sqlite3.Connection) -> List[tuple]:
+            with conn:
+                return conn.execute(sql, params).fetchall()
+
+        return await self._run(write)
+
+    async def create_mint_job(self, job: dict, owner: str) -> bool:
+        try:
+            await self._update(self.sql_create_mint_job, self.mint_job_row(job, owner))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    async def save_mint_job(self, job: dict, owner: str) -> bool:
+        now = self.dump_datetime(datetime.now())
+        params = (job["status"], json.dumps(job), now, job["id"], owner)
+        return await self._update(self.sql_save_mint_job, params) == 1
+
+    async def get_mint_job(self, job_id: str) -> Optional[dict]:
+        row = await self._run(lambda conn: conn.execute(self.sql_get_mint_job, (job_id,)).fetchone())
+        return json.loads(row[0]) if row else None
+
+    async def find_mint_job(self, key: str) -> Optional[dict]:
+        row = await self._run(lambda conn: conn.execute(self.sql_find_mint_job, (key,)).fetchone())
+        return json.loads(row[0]) if row else None
+
+    async def claim_mint_jobs(self, owner: str, stale_before: datetime) -> List[dict]:
+        now = self.dump_datetime(datetime.now())
+        params = (owner, now, owner, self.dump_datetime(stale_before))
+        return [json.loads(row[0]) for row in await self._update_returning(self.sql_claim_mint_jobs, params)]
+
+    async def touch_mint_jobs(self, owner: str) -> None:
+        await self._update(self.sql_touch_mint_jobs, (self.dump_datetime(datetime.now()), owner))
+
+    async def release_mint_jobs(self, owner: str) -> None:
+        await self._update(self.sql_release_mint_jobs, (self.dump_datetime(datetime.min), owner))
+
+class PostgresRepository(SQLRepository):
+    """
+    PostgreSQL backend on psycopg's AsyncConnectionPool
+    Hot statements are sent with prepare=True and batched writes go through
+    executemany, which psycopg pipelines into a single round trip
+    """
+
+    placeholder = "%s"
+    timestamp_type = "TIMESTAMP"
+    serial_type = "BIGSERIAL PRIMARY KEY"
+
+    def __init__(self, conninfo: str, min_size: int = 2, max_size: int = 10):
+        super().__init__()
+        self.conninfo = conninfo
+        self.min_size = min_size
+        self.max_size = max_size
+        self.sql_get_cards = f"{self.sql_list_cards} WHERE id = ANY(%s)"
+        self._pool = None
+
+    async def connect(self) -> None:
+        if self._pool is not None:
+            return
+        try:
+            from psycopg_pool import AsyncConnectionPool
+        except ImportError as e:
+            raise RuntimeError("PostgreSQL storage requires psycopg[pool]") from e
+
+        pool = AsyncConnectionPool(
+            self.conninfo, min_size=self.min_size, max_size=self.max_size, open=False
+        )
+        await pool.open()
+        async with pool.connection() as conn:
+            for statement in self.schema():
+                await conn.execute(statement)
+        self._pool = pool
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _fetch(self, sql: str, params: tuple) -> List[tuple]:
+        await self.connect()
+        async with self._pool.connection() as conn:
+            cursor = await conn.execute(sql, params, prepare=True)
+            return await cursor.fetchall()
+
+    async def _write_many(self, sql: str, rows: List[tuple], *more: Tuple[str, List[tuple]]) -> None:
+        """
+        Runs each (sql, rows) batch with executemany in one transaction
+        """
+        if not rows:
+            return
+        await self.connect()
+        async with self._pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cursor:
+                    for statement, batch in ((sql, rows),) + more:
+                        await cursor.executemany(statement, batch)
+
+    async def get_user(self, user_id: str) -> Optional[dict]:
+        rows = await self._fetch(self.sql_get_user, (user_id,))
+        return self.row_to_user(rows[0]) if rows else None
+
+    async def save_user(self, user: dict) -> None:
+        await self._write_many(self.sql_save_user, [self.user_to_row(user)])
+
+    async def find_user_by_email(self, email: str) -> Optional[dict]:
+        rows = await self._fetch(self.sql_find_user_by_email, (email,))
+        return self.row_to_user(rows[0]) if rows else None
+
+    async def get_cards(self, card_ids: List[str]) -> List[dict]:
+        if not card_ids:
+            return []
+        rows = await self._fetch(self.sql_get_cards, (list(card_ids),))
+        return self.order_cards(card_ids, [self.row_to_card(row) for row in rows])
+
+    async def list_cards(self) -> List[dict]:
+        rows = await self._fetch(self.sql_list_cards, ())
+        return [self.row_to_card(row) for row in rows]
+
+    async def save_cards(self, cards: List[dict]) -> None:
+        await self._write_many(
+            self.sql_save_card, [self.card_to_row(card) for card in cards],
+            (self.sql_add_change, self.change_rows("card", {card["id"]: 0 for card in cards}))
+        )
+
+    async def increment_correct_counts(self, deltas: Dict[str, int]) -> None:
+        await self._write_many(
+            self.sql_increment, [(delta, card_id) for card_id, delta in deltas.items()],
+            (self.sql_add_change, self.change_rows("correct", deltas))
+        )
+
+    async def add_transactions(self, transactions: List[dict]) -> None:
+        from psycopg.errors import UniqueViolation
+
+        try:
+            await self._write_many(
+                self.sql_add_transaction, [self.transaction_to_row(t) for t in transactions]
+            )
+        except UniqueViolation as e:
+            raise ConflictError(str(e)) from e
+
+    async def list_transactions(self, user_id: str, after_seq: int = 0) -> List[dict]:
+        rows = await self._fetch(self.sql_list_transactions, (user_id, after_seq))
+        return [self.row_to_transaction(row) for row in rows]
+
+    async def get_balance_snapshot(self, user_id: str) -> Optional[Tuple[int, int]]:
+        rows = await self._fetch(self.sql_get_balance, (user_id,))
+        return (rows[0][0], rows[0][1]) if rows else None
+
+    async def save_balance_snapshots(self, snapshots: List[Tuple[str, int, int]]) -> None:
+        await self._write_many(self.sql_save_balance, list(snapshots))
+
+    async def save_nft(self, card_id: str, nft_data: dict) -> None:
+        encoded = json.dumps(nft_data)
+        await self.connect()
+        async with self._pool.connection() as conn:
+            async with conn.transaction():
+                await conn.execute(self.sql_save_nft, (card_id, encoded))
+                await conn.execute(self.sql_set_nft_status, (encoded, card_id))
+                await conn.execute(self.sql_add_change, self.change_rows("nft", {card_id: 0})[0])
+
+    async def last_card_change_id(self) -> int:
+        rows = await self._fetch(self.sql_last_change, ())
+        return rows[0][0]
+
+    async def list_card_changes(self, after_id: int, limit: int = 1000) -> List[dict]:
+        rows = await self._fetch(self.sql_list_changes, (after_id, limit))
+        return [self.row_to_change(row) for row in rows]
+
+    async def prune_card_changes(self, before: datetime) -> None:
+        await self._write_many(self.sql_prune_changes, [(before,)])
+
+    async def set_nft_status(self, card_id: str, nft_status: Optional[dict]) -> None:
+        encoded = json.dumps(nft_status) if nft_status is not None else None
+        await self._write_many(self.sql_set_nft_status, [(encoded, card_id)])
+
+    async def _update(self, sql: str, params: tuple) -> int:
+        await self.connect()
+        async with self._pool.connection() as conn:
+            cursor = await conn.execute(sql, params, prepare=True)
+            return cursor.rowcount
+
+    async def create_mint_job(self, job: dict, owner: str) -> bool:
+        from psycopg.errors import UniqueViolation
+
+        try:
+            await self._update(self.sql_create_mint_job, self.mint_job_row(job, owner))
+        except UniqueViolation:
+            return False
+        return True
+
+    async def save_mint_job(self, job: dict, owner: str) -> bool:
+        params = (job["status"], json.dumps(job), datetime.now(), job["id"], owner)
+        return await self._update(self.sql_save_mint_job, params) == 1
+
+    async def get_mint_job(self, job_id: str) -> Optional[dict]:
+        rows = await self._fetch(self.sql_get_mint_job, (job_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def find_mint_job(self, key: str) -> Optional[dict]:
+        rows = await self._fetch(self.sql_find_mint_job, (key,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def claim_mint_jobs(self, owner: str, stale_before: datetime) -> List[dict]:
+        rows = await self._fetch(self.sql_claim_mint_jobs, (owner, datetime.now(), owner, stale_before))
+        return [json.loads(row[0]) for row in rows]
+
+    async def touch_mint_jobs(self, owner: str) -> None:
+        await self._update(self.sql_touch_mint_jobs, (datetime.now(), owner))
+
+    async def release_mint_jobs(self, owner: str) -> None:
+        await self._update(self.sql_release_mint_jobs, (datetime.min, owner))
+
+def create_repository(url: Optional[str]) -> Repository:
+    if not url or url.startswith("memory://"):
+        return InMemoryRepository()
+    if url.startswith("sqlite:///"):
+        return SQLiteRepository(url[len("sqlite:///"):] or ":memory:")
+    if url.startswith(("postgresql://", "postgres://")):
+        return PostgresRepository(url)
+    raise ValueError(f"Unsupported DATABASE_URL: {url}")
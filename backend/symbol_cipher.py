@@ -0,0 +1,86 @@
+"""
+Symbol Cipher Module
+
+Caesar cipher used by KnowledgeCardToken for card payloads stored on Symbol.
+
+Only ASCII letters are shifted (by -3); everything else passes through
+unchanged. Decoding therefore works on the UTF-8 bytes with a precomputed
+256-entry bytes.translate table: multi-byte UTF-8 sequences never contain
+ASCII bytes, and the byte table stays on CPython's fast path even for the
+Japanese text where str.translate falls back to a dict lookup per character.
+surrogatepass keeps lone surrogates round-tripping exactly like the original
+per-character loop. The module has no other imports so process pool workers
+start quickly.
+"""
+
+import string
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+SHIFT = 3
+
+def _shifted(alphabet: str, shift: int) -> str:
+    return alphabet[shift:] + alphabet[:shift]
+
+def _table(shift: int) -> bytes:
+    return bytes.maketrans(
+        (string.ascii_uppercase + string.ascii_lowercase).encode("ascii"),
+        (_shifted(string.ascii_uppercase, shift) + _shifted(string.ascii_lowercase, shift)).encode("ascii")
+    )
+
+DECRYPT_TABLE = _table(-SHIFT)
+ENCRYPT_TABLE = _table(SHIFT)
+
+# Batches smaller than this are decoded in-process even when a pool is requested
+POOL_MIN_BATCH = 256
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+
+def decrypt_caesar_cipher(encrypted_data: str) -> str:
+    """
+    Decrypts data using Caesar cipher with a shift of -3
+    This mimics the encryption used in KnowledgeCardToken
+    """
+    return _translate(encrypted_data, DECRYPT_TABLE)
+
+def encrypt_caesar_cipher(data: str) -> str:
+    return _translate(data, ENCRYPT_TABLE)
+
+def _translate(data: str, table: bytes) -> str:
+    return data.encode("utf-8", "surrogatepass").translate(table).decode("utf-8", "surrogatepass")
+
+def _decrypt_chunk(payloads: List[str]) -> List[str]:
+    return [_translate(payload, DECRYPT_TABLE) for payload in payloads]
+
+def _get_pool(processes: int) -> ProcessPoolExecutor:
+    global _pool, _pool_size
+    if _pool is None or _pool_size != processes:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=processes)
+        _pool_size = processes
+    return _pool
+
+def decrypt_caesar_cipher_batch(payloads: Sequence[str], processes: int = 0) -> List[str]:
+    """
+    Decrypts many payloads in one call, in order
+    With processes > 1, large batches are split across a shared process pool.
+    Pickling the payloads both ways costs more than the table lookup itself,
+    so this only pays off when the calling process must stay free of the work
+    """
+    if processes <= 1 or len(payloads) < POOL_MIN_BATCH:
+        return _decrypt_chunk(list(payloads))
+    size = -(-len(payloads) // (processes * 4))
+    chunks = [list(payloads[i:i + size]) for i in range(0, len(payloads), size)]
+    results: List[str] = []
+    for decoded in _get_pool(processes).map(_decrypt_chunk, chunks):
+        results.extend(decoded)
+    return results
+
+def shutdown_pool() -> None:
+    global _pool, _pool_size
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+        _pool_size = 0
@@ -0,0 +1,196 @@
+"""
+Symbol Client Module
+
+Client for the Symbol API node used by symbol_integration.
+
+Every lookup goes through a read-through cache with a TTL per entity kind
+(the card list changes more often than a single card or a user). An entry
+past its TTL is still served for a grace period while one background refresh
+fetches the new value (stale-while-revalidate), so callers only wait on the
+node for data they have never seen. Concurrent misses for the same key share
+a single upstream call, and all calls go through one pooled httpx session.
+
+With SYMBOL_MOCK_NODE=1 (the default) the client talks in-process to the
+mock node in mock_symbol_node; set it to 0 to use SYMBOL_API_URL.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+SYMBOL_API_URL = os.getenv("SYMBOL_API_URL", "http://localhost:3000")
+USE_MOCK_NODE = os.getenv("SYMBOL_MOCK_NODE", "1") == "1"
+SYMBOL_TIMEOUT = float(os.getenv("SYMBOL_TIMEOUT", "10"))
+SYMBOL_MAX_CONNECTIONS = int(os.getenv("SYMBOL_MAX_CONNECTIONS", "20"))
+CACHE_MAX_ENTRIES = int(os.getenv("SYMBOL_CACHE_MAX_ENTRIES", "10000"))
+
+# Seconds an entry is fresh, per entity kind
+DEFAULT_TTLS = {
+    "cards": float(os.getenv("SYMBOL_TTL_CARDS", "30")),
+    "card": float(os.getenv("SYMBOL_TTL_CARD", "300")),
+    "user": float(os.getenv("SYMBOL_TTL_USER", "600")),
+    # Lookups the node answered with 404
+    "missing": float(os.getenv("SYMBOL_TTL_MISSING", "10")),
+}
+# Seconds past its TTL an entry may still be served while it is refreshed
+STALE_SECONDS = float(os.getenv("SYMBOL_STALE_SECONDS", "300"))
+
+class SymbolNodeError(Exception):
+    pass
+
+class CacheEntry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, ttl: float, stale_seconds: float):
+        now = time.monotonic()
+        self.value = value
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale_seconds
+
+class SymbolClient:
+    def __init__(
+        self,
+        base_url: str = SYMBOL_API_URL,
+        ttls: Optional[Dict[str, float]] = None,
+        stale_seconds: float = STALE_SECONDS,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        self._cache: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "upstream_calls": 0,
+            "upstream_errors": 0,
+        }
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=SYMBOL_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=SYMBOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=SYMBOL_MAX_CONNECTIONS
+                ),
+                transport=self.transport
+            )
+        return self._http
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def get_cards(self) -> List[dict]:
+        data = await self._cached("cards", "cards", "/cards")
+        return data.get("cards", []) if data else []
+
+    async def get_card(self, card_id: str) -> Optional[dict]:
+        return await self._cached(f"card:{card_id}", "card", f"/cards/{card_id}")
+
+    async def get_user(self, address: str) -> Optional[dict]:
+        return await self._cached(f"user:{address}", "user", f"/users/{address}")
+
+    async def get_chain_height(self) -> int:
+        data, found = await self._fetch("/chain/height")
+        if not found:
+            raise SymbolNodeError("Symbol node does not report its chain height")
+        return int(data["height"])
+
+    async def get_metadata_transactions(
+        self,
+        key: str,
+        from_height: int,
+        page_size: int = 100,
+        offset: int = 0
+    ) -> List[dict]:
+        """
+        Metadata transactions under key from from_height on, oldest first,
+        skipping the first offset of them; never cached
+        """
+        data, _ = await self._fetch(
+            "/metadata/transactions",
+            params={"key": key, "fromHeight": from_height, "pageSize": page_size, "offset": offset}
+        )
+        return data.get("transactions", []) if data else []
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    async def _cached(self, key: str, kind: str, path: str) -> Any:
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry is not None and now < entry.fresh_until:
+            self.stats["hits"] += 1
+            self._cache.move_to_end(key)
+            return entry.value
+        if entry is not None and now < entry.stale_until:
+            self.stats["stale_hits"] += 1
+            self._cache.move_to_end(key)
+            refresh = self._single_flight(key, kind, path)
+            # Errors are counted in _refresh; the stale value keeps being served
+            refresh.add_done_callback(lambda f: f.cancelled() or f.exception())
+            return entry.value
+        self.stats["misses"] += 1
+        return await asyncio.shield(self._single_flight(key, kind, path))
+
+    def _single_flight(self, key: str, kind: str, path: str) -> asyncio.Future:
+        job = self._inflight.get(key)
+        if job is not None:
+            self.stats["coalesced"] += 1
+            return job
+        job = asyncio.ensure_future(self._refresh(key, kind, path))
+        self._inflight[key] = job
+        job.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return job
+
+    async def _refresh(self, key: str, kind: str, path: str) -> Any:
+        value, found = await self._fetch(path)
+        ttl = self.ttls[kind] if found else self.ttls["missing"]
+        self._cache[key] = CacheEntry(value, ttl, self.stale_seconds)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return value
+
+    async def _fetch(self, path: str, params: Optional[dict] = None) -> Tuple[Any, bool]:
+        self.stats["upstream_calls"] += 1
+        try:
+            response = await self.http.get(path, params=params)
+            if response.status_code == 404:
+                return None, False
+            response.raise_for_status()
+            return response.json(), True
+        except httpx.HTTPError as e:
+            self.stats["upstream_errors"] += 1
+            raise SymbolNodeError(f"Symbol node request {path} failed: {e}") from e
+
+    def metrics(self) -> dict:
+        return {**self.stats, "entries": len(self._cache), "inflight": len(self._inflight)}
+
+def create_client() -> SymbolClient:
+    if USE_MOCK_NODE:
+        from mock_symbol_node import app as mock_app
+
+        return SymbolClient("http://mock-symbol-node", transport=httpx.ASGITransport(app=mock_app))
+    return SymbolClient(SYMBOL_API_URL)
+
+symbol_client = create_client()
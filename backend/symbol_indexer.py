@@ -0,0 +1,410 @@
+"""
+Symbol Indexer Module
+
+Background sync of knowledge cards published on Symbol as metadata
+transactions under SYMBOL_METADATA_KEY.
+
+The indexer tails the transaction stream from the block height of its last
+checkpoint, decrypts and decodes each value and upserts the card into a
+local index that /api/symbol/cards serves pages from, so listing cards never
+waits on a Symbol node. The checkpoint lets a restart resume where the
+previous process stopped: a snapshot of the height and indexed cards written
+atomically to SYMBOL_INDEX_PATH, plus a journal next to it that each sync
+appends its new cards and height to. Once the journal holds more cards than
+the index, the next checkpoint writes a fresh snapshot and starts a new
+journal. Without a checkpoint the first sync backfills from
+SYMBOL_INDEX_START_HEIGHT.
+"""
+
+import asyncio
+import base64
+import bisect
+import json
+import os
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from feed import InvalidCursor, DEFAULT_PAGE_SIZE
+from symbol_cipher import POOL_MIN_BATCH, decrypt_caesar_cipher_batch, shutdown_pool
+from symbol_client import SymbolClient
+
+INDEX_PATH = os.getenv("SYMBOL_INDEX_PATH", "symbol_index.json")
+SYNC_INTERVAL = float(os.getenv("SYMBOL_SYNC_INTERVAL", "15"))
+SYNC_PAGE_SIZE = int(os.getenv("SYMBOL_SYNC_PAGE_SIZE", "100"))
+# Largest pageSize a Symbol node serves; bigger requests come back short
+MAX_PAGE_SIZE = 100
+START_HEIGHT = int(os.getenv("SYMBOL_INDEX_START_HEIGHT", "0"))
+# Worker processes for decrypting large pages during backfills (0 = in-process)
+DECODE_PROCESSES = int(os.getenv("SYMBOL_DECODE_PROCESSES", "0"))
+# Minimum seconds between checkpoint writes while a long backfill is running
+CHECKPOINT_INTERVAL = float(os.getenv("SYMBOL_CHECKPOINT_INTERVAL", "5"))
+
+REQUIRED_FIELDS = ("id", "title", "content", "author", "createdAt")
+
+IndexKey = Tuple[str, str]
+
+def encode_cursor(key: IndexKey) -> str:
+    raw = f"{key[0]}|{key[1]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> IndexKey:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, card_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return created_at, card_id
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+def _remove(keys: List[IndexKey], key: IndexKey) -> None:
+    position = bisect.bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+class SymbolCardIndex:
+    """
+    Symbol cards ordered by (createdAt, id), with per-author and per-address key lists
+    createdAt values are ISO 8601 UTC strings, which sort chronologically as text
+    """
+
+    def __init__(self, on_change: Optional[Callable[[str], None]] = None):
+        self.on_change = on_change
+        self.cards: Dict[str, dict] = {}
+        self._keys: List[IndexKey] = []
+        self._by_author: Dict[str, List[IndexKey]] = {}
+        self._by_address: Dict[str, List[IndexKey]] = {}
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def get(self, card_id: str) -> Optional[dict]:
+        return self.cards.get(card_id)
+
+    def upsert(self, card: dict) -> None:
+        previous = self.cards.get(card["id"])
+        if previous is not None:
+            self._unlink(previous)
+        self.cards[card["id"]] = card
+        key = (card["createdAt"], card["id"])
+        bisect.insort(self._keys, key)
+        bisect.insort(self._by_author.setdefault(card["author"], []), key)
+        if card.get("symbolAddress"):
+            bisect.insort(self._by_address.setdefault(card["symbolAddress"], []), key)
+        if self.on_change is not None:
+            self.on_change(card["id"])
+
+    def _unlink(self, card: dict) -> None:
+        key = (card["createdAt"], card["id"])
+        _remove(self._keys, key)
+        for group, value in ((self._by_author, card["author"]), (self._by_address, card.get("symbolAddress"))):
+            keys = group.get(value)
+            if keys is not None:
+                _remove(keys, key)
+                if not keys:
+                    del group[value]
+
+    def page(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        author: Optional[str] = None,
+        address: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Returns one page of cards, newest first, and the cursor for the next page
+        """
+        if author is not None:
+            keys = self._by_author.get(author, [])
+        elif address is not None:
+            keys = self._by_address.get(address, [])
+        else:
+            keys = self._keys
+        end = len(keys) if cursor is None else bisect.bisect_left(keys, decode_cursor(cursor))
+
+        cards: List[dict] = []
+        position = end
+        while position > 0 and len(cards) < limit:
+            position -= 1
+            card = self.cards[keys[position][1]]
+            # Only needed when both filters are given; author picked the key list
+            if address is not None and card.get("symbolAddress") != address:
+                continue
+            cards.append(card)
+        more = position > 0 and len(cards) == limit
+        next_cursor = encode_cursor((cards[-1]["createdAt"], cards[-1]["id"])) if more else None
+        return cards, next_cursor
+
+class SymbolIndexer:
+    def __init__(
+        self,
+        client: SymbolClient,
+        metadata_key: str,
+        path: str = INDEX_PATH,
+        interval: float = SYNC_INTERVAL,
+        page_size: int = SYNC_PAGE_SIZE,
+        start_height: int = START_HEIGHT,
+        decode_processes: int = DECODE_PROCESSES,
+        on_change: Optional[Callable[[str], None]] = None
+    ):
+        self.client = client
+        self.metadata_key = metadata_key
+        self.path = path
+        self.interval = interval
+        self.page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        self.start_height = start_height
+        self.decode_processes = decode_processes
+        # Called with the id of every card added or replaced
+        self.on_change = on_change
+        self.index = SymbolCardIndex(on_change)
+        # Height of the last block whose transactions are all indexed
+        self.height = start_height - 1
+        self.chain_height: Optional[int] = None
+        self._sync_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_checkpoint = 0.0
+        # Cards changed since the last checkpoint
+        self._changed: Dict[str, dict] = {}
+        # Journal matching the current snapshot (None until a snapshot is written) and its size
+        self._journal_id: Optional[str] = None
+        self._journal_cards = 0
+        self._saved_height = self.height
+        self._stats = {
+            "syncs": 0,
+            "failed_syncs": 0,
+            "transactions_indexed": 0,
+            "transactions_skipped": 0,
+            "last_sync_at": None,
+        }
+
+    @property
+    def journal_path(self) -> str:
+        return f"{self.path}.journal"
+
+    def load_checkpoint(self) -> bool:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable Symbol index checkpoint {self.path}: {e}")
+            return False
+        index = SymbolCardIndex(self.on_change)
+        try:
+            height = int(checkpoint["height"])
+            for card in checkpoint.get("cards", []):
+                index.upsert(card)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            print(f"Ignoring malformed Symbol index checkpoint {self.path}: {e!r}")
+            return False
+        self.index = index
+        self.height = height
+        self._journal_id = checkpoint.get("journal")
+        self._journal_cards = self._replay_journal() if self._journal_id else 0
+        self._saved_height = self.height
+        self._changed.clear()
+        return True
+
+    def _replay_journal(self) -> int:
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return 0
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except ValueError:
+            header = {}
+        # A journal left over from before the latest snapshot is already part of it
+        if header.get("journal") != self._journal_id:
+            return 0
+        replayed = 0
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+                cards, height = record["cards"], int(record["height"])
+            except (ValueError, KeyError, TypeError):
+                # Torn write of the last record
+                break
+            for card in cards:
+                self.index.upsert(card)
+            self.height = max(self.height, height)
+            replayed += len(cards)
+        return replayed
+
+    def _write_snapshot(self, checkpoint: dict) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"journal": checkpoint["journal"]}) + "\n")
+
+    def _append_journal(self, record: dict) -> None:
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def save_checkpoint(self) -> None:
+        """
+        Appends the cards changed since the last checkpoint to the journal,
+        or writes a new snapshot once the journal has outgrown the index
+        """
+        if self._journal_id is not None and not self._changed and self.height == self._saved_height:
+            return
+        changed = list(self._changed.values())
+        self._changed.clear()
+        try:
+            if self._journal_id is None or self._journal_cards + len(changed) > len(self.index):
+                self._journal_id = uuid.uuid4().hex
+                self._journal_cards = 0
+                checkpoint = {"height": self.height, "journal": self._journal_id, "cards": list(self.index.cards.values())}
+                await asyncio.to_thread(self._write_snapshot, checkpoint)
+            else:
+                self._journal_cards += len(changed)
+                await asyncio.to_thread(self._append_journal, {"height": self.height, "cards": changed})
+        except BaseException:
+            # The journal may be incomplete now; the next checkpoint writes a snapshot
+            self._journal_id = None
+            raise
+        self._saved_height = self.height
+        self._last_checkpoint = time.monotonic()
+
+    def decode_card(self, transaction: dict, plaintext: str) -> Optional[dict]:
+        try:
+            card = json.loads(plaintext)
+        except ValueError:
+            return None
+        if not isinstance(card, dict) or any(not isinstance(card.get(field), str) for field in REQUIRED_FIELDS):
+            return None
+        card.setdefault("symbolAddress", transaction.get("signerAddress", ""))
+        return card
+
+    async def apply(self, transactions: List[dict]) -> None:
+        payloads = [tx.get("value") if isinstance(tx.get("value"), str) else "" for tx in transactions]
+        if self.decode_processes > 1 and len(payloads) >= POOL_MIN_BATCH:
+            plaintexts = await asyncio.to_thread(decrypt_caesar_cipher_batch, payloads, self.decode_processes)
+        else:
+            plaintexts = decrypt_caesar_cipher_batch(payloads)
+        for transaction, plaintext in zip(transactions, plaintexts):
+            card = self.decode_card(transaction, plaintext)
+            if card is None:
+                self._stats["transactions_skipped"] += 1
+                continue
+            self.index.upsert(card)
+            self._changed[card["id"]] = card
+            self._stats["transactions_indexed"] += 1
+
+    async def sync(self) -> int:
+        """
+        Indexes every transaction above the checkpoint; returns how many were read
+        """
+        async with self._sync_lock:
+            start_height = self.height
+            try:
+                processed = await self._sync()
+            except Exception as e:
+                # Node errors, malformed transactions and failed checkpoint writes alike;
+                # the next sync resumes from the last height indexed
+                print(f"Symbol index sync failed at height {self.height}: {e!r}")
+                self._stats["failed_syncs"] += 1
+                processed = 0
+            else:
+                self._stats["syncs"] += 1
+                self._stats["last_sync_at"] = time.time()
+            if self.height != start_height:
+                try:
+                    await self.save_checkpoint()
+                except OSError as e:
+                    print(f"Symbol index checkpoint failed at height {self.height}: {e}")
+            return processed
+
+    async def _sync(self) -> int:
+        # Blocks up to this height are final, whatever arrives while paging
+        chain_height = await self.client.get_chain_height()
+        self.chain_height = chain_height
+        processed = 0
+        from_height = self.height + 1
+        offset = 0
+        # Transactions read from the block at the end of the last page, which
+        # may continue on the next one and is only indexed once read completely
+        pending: List[dict] = []
+        while True:
+            page = await self.client.get_metadata_transactions(
+                self.metadata_key, from_height, self.page_size, offset
+            )
+            offset += len(page)
+            final = [tx for tx in page if tx["height"] <= chain_height]
+            pending.extend(final)
+            # Nodes may return short pages, so only an empty page or a block
+            # past the chain height ends the stream
+            if not page or len(final) < len(page):
+                await self.apply(pending)
+                processed += len(pending)
+                self.height = max(self.height, chain_height)
+                return processed
+
+            last_height = pending[-1]["height"]
+            complete = [tx for tx in pending if tx["height"] < last_height]
+            if not complete:
+                continue
+            await self.apply(complete)
+            processed += len(complete)
+            self.height = last_height - 1
+            # Resume from the unfinished block, skipping what was read of it
+            pending = pending[len(complete):]
+            from_height, offset = last_height, len(pending)
+            if time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+                await self.save_checkpoint()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Symbol index sync failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self._task is None:
+            await asyncio.to_thread(self.load_checkpoint)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.save_checkpoint()
+        if self.decode_processes > 1:
+            await asyncio.to_thread(shutdown_pool)
+
+    async def backfill(self, from_height: Optional[int] = None) -> int:
+        """
+        Rebuilds the index from from_height (the configured start height by default)
+        """
+        async with self._sync_lock:
+            self.index = SymbolCardIndex(self.on_change)
+            self.height = (self.start_height if from_height is None else from_height) - 1
+            # The rebuilt index replaces the old snapshot rather than extending its journal
+            self._changed.clear()
+            self._journal_id = None
+        return await self.sync()
+
+    def metrics(self) -> dict:
+        lag_blocks = None
+        if self.chain_height is not None:
+            lag_blocks = max(0, self.chain_height - self.height)
+        last_sync_at = self._stats["last_sync_at"]
+        return {
+            **self._stats,
+            "indexed_cards": len(self.index),
+            "checkpoint_height": self.height,
+            "chain_height": self.chain_height,
+            "lag_blocks": lag_blocks,
+            "lag_seconds": time.time() - last_sync_at if last_sync_at else None,
+        }
@@ -7,12 +7,19 @@ and bridge data between Symbol and Ethereum blockchains.
 
 import os
 import json
-import requests
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from web3 import Web3
 from dotenv import load_dotenv
 
+from feed import InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from symbol_cipher import decrypt_caesar_cipher
+from minting import mint_queue
+from symbol_client import symbol_client, SymbolNodeError
+from symbol_indexer import SymbolIndexer
+from response_cache import response_cache, dumps, join_array
+
 load_dotenv()
 
 router = APIRouter(prefix="/api/symbol", tags=["symbol"])
@@ -28,6 +35,10 @@ class SymbolCard(BaseModel):
     videoUrl: Optional[str] = None
     details: Optional[str] = None
 
+class SymbolCardPage(BaseModel):
+    cards: List[SymbolCard]
+    next_cursor: Optional[str] = None
+
 class SymbolUser(BaseModel):
     username: str
     symbolAddress: str
@@ -39,6 +50,8 @@ class ConvertToNFTRequest(BaseModel):
 class ConvertToNFTResponse(BaseModel):
     success: bool
     tokenId: Optional[str] = None
+    jobId: Optional[str] = None
+    status: Optional[str] = None
     error: Optional[str] = None
 
 SYMBOL_API_URL = os.getenv("SYMBOL_API_URL", "http://localhost:3000")
@@ -46,109 +59,105 @@ SYMBOL_NODE = os.getenv("SYMBOL_NODE", "https://sym-test.opening-line.jp:3001")
 SYMBOL_NETWORK = int(os.getenv("SYMBOL_NETWORK", "152"))
 SYMBOL_METADATA_KEY = os.getenv("SYMBOL_METADATA_KEY", "knowledge_card")
 
-symbol_cards_cache = {
-    "1": {
-        "id": "1",
-        "title": "Introduction to Blockchain",
-        "content": "Blockchain is a distributed ledger technology that enables secure, transparent transactions without central authorities.",
-        "author": "satoshi",
-        "symbolAddress": "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY",
-        "createdAt": "2025-05-01T12:00:00Z",
-        "imageUrl": "https://images.unsplash.com/photo-1639762681057-408e52192e55?q=80&w=2832&auto=format&fit=crop",
-        "details": "ブロックチェーンは、中央集権的な管理者なしで安全かつ透明性の高い取引を可能にする分散型台帳技術です。各ブロックには複数の取引記録が含まれ、暗号化されたハッシュによって前のブロックと連結されています。この技術は、仮想通貨、スマートコントラクト、サプライチェーン管理など、様々な分野で革新をもたらしています。"
-    },
-    "2": {
-        "id": "2",
-        "title": "Symbol Blockchain Overview",
-        "content": "Symbol is a secure and business-ready blockchain platform with advanced features for enterprise use.",
-        "author": "nemtech",
-        "symbolAddress": "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY",
-        "createdAt": "2025-05-02T14:30:00Z",
-        "imageUrl": "https://images.unsplash.com/photo-1642052502780-8ee67c2c714c?q=80&w=2787&auto=format&fit=crop",
-        "videoUrl": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
-        "details": "Symbolは、エンタープライズ向けの高度な機能を備えた安全なブロックチェーンプラットフォームです。高速なトランザクション処理、プラグイン可能なスマートコントラクト、マルチレベルのマルチシグ機能を提供します。また、エネルギー効率の高いPoS+アルゴリズムを採用し、環境に優しい設計となっています。"
-    },
-    "3": {
-        "id": "3",
-        "title": "NFTs and Digital Ownership",
-        "content": "Non-Fungible Tokens represent unique digital assets and enable verifiable ownership on blockchain.",
-        "author": "cryptoart",
-        "symbolAddress": "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY",
-        "createdAt": "2025-05-03T09:15:00Z",
-        "imageUrl": "https://images.unsplash.com/photo-1620641788421-7a1c342ea42e?q=80&w=2874&auto=format&fit=crop",
-        "details": "NFT（非代替性トークン）は、デジタルアートやコレクティブル、ゲーム内アイテムなどのユニークなデジタル資産を表現し、ブロックチェーン上で検証可能な所有権を可能にします。各NFTは固有の識別子を持ち、その真正性と希少性を保証します。"
-    }
-}
-
-symbol_users_cache = {
-    "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY": {
-        "username": "satoshi",
-        "symbolAddress": "TDPFWJT-XVPWMJ-WNVUNR-BYKJCZ-LTLOTM-DPCXPO-JJYY"
-    }
-}
-
-def decrypt_caesar_cipher(encrypted_data: str) -> str:
-    """
-    Decrypts data using Caesar cipher with a shift of -3
-    This mimics the encryption used in KnowledgeCardToken
-    """
-    result = ""
-    for char in encrypted_data:
-        code = ord(char)
-        if (65 <= code <= 90) or (97 <= code <= 122):
-            shift = 97 if code >= 97 else 65
-            result += chr(((code - shift - 3 + 26) % 26) + shift)
-        else:
-            result += char
-    return result
+# Cards published on chain, synced in the background (started from main)
+symbol_indexer = SymbolIndexer(
+    symbol_client,
+    SYMBOL_METADATA_KEY,
+    on_change=lambda card_id: response_cache.invalidate(f"symbol:{card_id}")
+)
+
+SYMBOL_CARD_FIELDS = list(SymbolCard.model_fields)
+
+def symbol_card_json(card: dict) -> bytes:
+    """
+    The card as SymbolCard serializes it, from the response cache for indexed cards
+    """
+    key = f"symbol:{card['id']}"
+    indexed = symbol_indexer.index.get(card["id"]) is card
+    data = response_cache.get(key) if indexed else None
+    if data is None:
+        data = dumps({name: card.get(name) for name in SYMBOL_CARD_FIELDS})
+        if indexed:
+            response_cache.put(key, response_cache.version(key), data)
+    return data
 
 async def fetch_from_symbol_api(endpoint: str) -> Dict[str, Any]:
     """
-    Fetches data from the Symbol API
-    In a real implementation, this would use Symbol SDK
-    For now, we'll use a mock implementation
+    Fetches data from the Symbol API through the cached, coalescing client
     """
     try:
-        
         if endpoint == "cards":
-            return {"cards": list(symbol_cards_cache.values()) if symbol_cards_cache else []}
+            return {"cards": await symbol_client.get_cards()}
         elif endpoint.startswith("cards/"):
             card_id = endpoint.split("/")[1]
-            return symbol_cards_cache.get(card_id, {})
+            return await symbol_client.get_card(card_id) or {}
         elif endpoint.startswith("users/"):
             address = endpoint.split("/")[1]
-            return symbol_users_cache.get(address, {})
+            return await symbol_client.get_user(address) or {}
         else:
             return {}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch from Symbol API: {str(e)}")
-
-@router.get("/cards", response_model=List[SymbolCard])
-async def get_symbol_cards():
+    except SymbolNodeError as e:
+        raise HTTPException(status_code=502, detail=f"Failed to fetch from Symbol API: {str(e)}")
+
+@router.get("/cards", response_model=SymbolCardPage)
+async def get_symbol_cards(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    author: Optional[str] = None,
+    address: Optional[str] = Query(None, description="Symbol address of the publishing account")
+):
     """
-    Fetches all knowledge cards from the Symbol blockchain
+    Lists knowledge cards from the Symbol blockchain, newest first
+    Served from the local index kept up to date by the background sync
     """
     try:
-        
-        pass
-        
-        return list(symbol_cards_cache.values())
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch Symbol cards: {str(e)}")
+        cards, next_cursor = symbol_indexer.index.page(limit, cursor=cursor, author=author, address=address)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    etag = response_cache.entity_etag([f"symbol:{card['id']}" for card in cards], next_cursor)
+    not_modified = response_cache.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    body = (
+        b'{"cards":' + join_array(symbol_card_json(card) for card in cards)
+        + b',"next_cursor":' + dumps(next_cursor) + b"}"
+    )
+    return response_cache.respond(body, etag)
+
+@router.get("/index/status")
+async def get_symbol_index_status():
+    """
+    Sync progress of the local Symbol card index, including its lag behind the chain
+    """
+    return symbol_indexer.metrics()
 
 @router.get("/cards/{card_id}", response_model=SymbolCard)
-async def get_symbol_card(card_id: str):
+async def get_symbol_card(card_id: str, request: Request):
     """
     Fetches a specific knowledge card from the Symbol blockchain
     """
     try:
+        card = symbol_indexer.index.get(card_id)
+        if card is not None:
+            etag = response_cache.entity_etag([f"symbol:{card_id}"])
+            not_modified = response_cache.not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
+            return response_cache.respond(symbol_card_json(card), etag)
         
-        if card_id not in symbol_cards_cache:
+        # Not indexed yet; read through the node client
+        card = await symbol_client.get_card(card_id)
+        if card is None:
             raise HTTPException(status_code=404, detail=f"Symbol card {card_id} not found")
         
-        return symbol_cards_cache[card_id]
+        data = symbol_card_json(card)
+        etag = response_cache.etag(data)
+        return response_cache.not_modified(request, etag) or response_cache.respond(data, etag)
     except HTTPException:
         raise
+    except SymbolNodeError as e:
+        raise HTTPException(status_code=502, detail=f"Failed to fetch Symbol card {card_id}: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch Symbol card {card_id}: {str(e)}")
 
@@ -158,30 +167,39 @@ async def get_symbol_user(symbol_address: str):
     Fetches user data from the Symbol blockchain
     """
     try:
-        
-        pass
-        
-        if symbol_address not in symbol_users_cache:
+        user = await symbol_client.get_user(symbol_address)
+        if user is None:
             raise HTTPException(status_code=404, detail=f"Symbol user {symbol_address} not found")
         
-        return symbol_users_cache[symbol_address]
+        return user
     except HTTPException:
         raise
+    except SymbolNodeError as e:
+        raise HTTPException(status_code=502, detail=f"Failed to fetch Symbol user {symbol_address}: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch Symbol user {symbol_address}: {str(e)}")
 
+@router.get("/cache-stats")
+async def get_symbol_cache_stats():
+    """
+    Hit, coalescing and upstream call counters of the Symbol client cache
+    """
+    return symbol_client.metrics()
+
 @router.post("/convert-to-nft", response_model=ConvertToNFTResponse)
 async def convert_to_nft(request: ConvertToNFTRequest):
     """
     Converts a Symbol card to an Ethereum NFT
     Only the title is stored on the Symbol blockchain as requested
+    The mint itself is queued; tokenId is set once the job is confirmed
     """
+    if not Web3.is_address(request.ethereumAddress):
+        raise HTTPException(status_code=400, detail="Invalid Ethereum address")
     try:
-        if request.cardId not in symbol_cards_cache:
+        card = symbol_indexer.index.get(request.cardId) or await symbol_client.get_card(request.cardId)
+        if card is None:
             raise HTTPException(status_code=404, detail=f"Symbol card {request.cardId} not found")
         
-        card = symbol_cards_cache[request.cardId]
-        
         # Only send the title to Symbol blockchain
         symbol_data = {
             "title": card["title"]
@@ -192,11 +210,26 @@ async def convert_to_nft(request: ConvertToNFTRequest):
         # In a real implementation, this would call the Symbol SDK
         # to store only the title on the Symbol blockchain
         
-        token_id = f"eth-{request.cardId}"
+        metadata = {
+            "title": card["title"],
+            "content": card["content"],
+            "author": card["author"],
+            "correctCount": 0,
+            "mediaUrls": [url for url in (card.get("imageUrl"), card.get("videoUrl")) if url],
+            "createdAt": card["createdAt"]
+        }
+        job, _ = await mint_queue.submit(
+            f"symbol:{request.cardId}",
+            request.ethereumAddress,
+            metadata,
+            publish=True
+        )
         
         return {
             "success": True,
-            "tokenId": token_id
+            "tokenId": job.token_id,
+            "jobId": job.id,
+            "status": job.status
         }
     except HTTPException:
         raise
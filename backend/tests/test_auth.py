@@ -0,0 +1,65 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from auth import InvalidToken, TokenSigner
+
+def test_tokens_carry_the_user_until_they_expire():
+    signer = TokenSigner(b"secret", ttl=60)
+    token = signer.issue("user-1", now=1000)
+    assert signer.verify(token, now=1059) == "user-1"
+    with pytest.raises(InvalidToken):
+        signer.verify(token, now=1061)
+
+@pytest.mark.parametrize("token", ["", "garbage", "a.b.c", "ü.ü"])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(InvalidToken):
+        TokenSigner(b"secret").verify(token)
+
+def test_forged_tokens_are_rejected():
+    token = TokenSigner(b"other").issue("user-1")
+    with pytest.raises(InvalidToken):
+        TokenSigner(b"secret").verify(token)
+    signature = TokenSigner(b"secret").issue("user-1").split(".")[1]
+    forged = TokenSigner(b"secret").issue("user-2").split(".")[0]
+    with pytest.raises(InvalidToken):
+        TokenSigner(b"secret").verify(f"{forged}.{signature}")
+
+def test_the_ledger_only_follows_bearer_tokens():
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            signup = await client.post("/api/auth/signup", json={
+                "email": "alice@example.com", "username": "alice", "password": "pw"
+            })
+            alice = signup.json()
+            auth = {"Authorization": f"Bearer {alice['access_token']}"}
+            card = (await client.post("/api/cards", json={"title": "t", "content": "c"})).json()
+            path = f"/api/cards/{card['id']}/interact"
+            swipe = {"interaction_type": "correct"}
+
+            # The header names a user but authenticates nobody, so nothing is charged
+            anonymous = await client.post(path, json=swipe, headers={"X-User-Id": alice["id"]})
+            assert anonymous.status_code == 200
+            assert anonymous.json()["token_change"] == 0
+            assert (await client.get("/api/tokens/balance", headers={"X-User-Id": alice["id"]})).status_code == 401
+
+            charged = (await client.post(path, json=swipe, headers=auth)).json()
+            balance = alice["token_balance"] - main.INTERACTION_TOKEN_COST
+            assert charged["token_change"] == -main.INTERACTION_TOKEN_COST and charged["balance"] == balance
+            assert (await client.get("/api/tokens/balance", headers=auth)).json() == {"balance": balance}
+
+            bad = await client.get("/api/tokens/balance", headers={"Authorization": "Bearer nope"})
+            assert bad.status_code == 401
+            mint = await client.post("/api/nft/mint", json={"card_id": card["id"], "user_address": "0x0"})
+            assert mint.status_code == 401
+
+            login = await client.post("/api/auth/login", json={"email": "alice@example.com", "password": "pw"})
+            assert login.json()["id"] == alice["id"]
+            assert login.json()["token_balance"] == balance
+            wrong = await client.post("/api/auth/login", json={"email": "alice@example.com", "password": "no"})
+            assert wrong.status_code == 401
+
+    asyncio.run(scenario())
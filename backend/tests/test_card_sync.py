@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime
+
+from card_sync import CardSync
+from storage import SQLiteRepository
+
+def make_card(card_id: str) -> dict:
+    return {
+        "id": card_id,
+        "title": f"Card {card_id}",
+        "content": "content",
+        "author_id": "author",
+        "media_urls": [],
+        "tags": [],
+        "correct_count": 0,
+        "created_at": datetime.now(),
+    }
+
+def test_follows_changes_of_other_workers(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "cards.db")
+        worker_a, worker_b = SQLiteRepository(path), SQLiteRepository(path)
+        applied = []
+
+        async def apply(changes):
+            applied.extend((change["card_id"], change["kind"], change["delta"]) for change in changes)
+
+        sync = CardSync(worker_a, apply)
+        await worker_a.connect()
+        await sync.reset()
+
+        await worker_b.save_card(make_card("b1"))
+        await worker_b.increment_correct_counts({"b1": 3})
+        await worker_b.save_nft("b1", {"token_id": 1})
+        # Own writes are already in this worker's indexes
+        await worker_a.save_card(make_card("a1"))
+
+        assert await sync.poll() == 3
+        assert applied == [("b1", "card", 0), ("b1", "correct", 3), ("b1", "nft", 0)]
+        # Unsettled changes are read again but applied once
+        assert await sync.poll() == 0
+        assert len(applied) == 3
+        await worker_a.close()
+        await worker_b.close()
+
+    asyncio.run(scenario())
+
+def test_reset_skips_existing_changes(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "cards.db")
+        writer, reader = SQLiteRepository(path), SQLiteRepository(path)
+        await writer.save_card(make_card("old"))
+        applied = []
+
+        async def apply(changes):
+            applied.extend(change["card_id"] for change in changes)
+
+        sync = CardSync(reader, apply)
+        await sync.reset()
+        await writer.save_card(make_card("new"))
+        await sync.poll()
+        assert applied == ["new"]
+        await writer.close()
+        await reader.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,60 @@
+import asyncio
+
+from counters import CounterAggregator
+
+def test_stop_completes_a_flush_in_progress():
+    async def scenario():
+        written = {}
+        started = asyncio.Event()
+
+        async def slow_flush(batch):
+            started.set()
+            await asyncio.sleep(0.05)
+            for key, delta in batch.items():
+                written[key] = written.get(key, 0) + delta
+
+        counters = CounterAggregator(slow_flush, interval=0.01)
+        counters.start()
+        counters.increment("card", 3)
+        await started.wait()
+        counters.increment("card", 2)
+        await counters.stop()
+        assert written == {"card": 5}
+        assert counters.pending("card") == 0
+
+    asyncio.run(scenario())
+
+def test_cancelled_flush_keeps_the_batch():
+    async def scenario():
+        async def hanging_flush(batch):
+            await asyncio.sleep(10)
+
+        counters = CounterAggregator(hanging_flush)
+        counters.increment("card", 4)
+        task = asyncio.create_task(counters.flush())
+        await asyncio.sleep(0)
+        assert counters.pending("card") == 4
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert counters.pending("card") == 4
+
+    asyncio.run(scenario())
+
+def test_failed_flush_is_retried():
+    async def scenario():
+        attempts = []
+
+        async def flaky_flush(batch):
+            attempts.append(dict(batch))
+            if len(attempts) == 1:
+                raise RuntimeError("database unavailable")
+
+        counters = CounterAggregator(flaky_flush)
+        counters.increment("card")
+        assert await counters.flush() == 0
+        counters.increment("card")
+        assert await counters.flush() == 1
+        assert attempts == [{"card": 1}, {"card": 2}]
+        assert counters.metrics()["failed_flushes"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from eligibility import EligibilityTracker
+
+def make_card(card_id: str, created_at: datetime, correct_count: int = 0, nft_status=None) -> dict:
+    return {"id": card_id, "created_at": created_at, "correct_count": correct_count, "nft_status": nft_status}
+
+def test_minted_cards_are_not_eligible():
+    tracker = EligibilityTracker(threshold=3)
+    yesterday = datetime.now() - timedelta(days=1)
+    tracker.card_created(make_card("popular", yesterday, correct_count=5))
+    tracker.card_created(make_card("first", datetime.now()))
+    tracker.card_created(make_card("done", yesterday, correct_count=5, nft_status={"token_id": "1"}))
+
+    assert tracker.evaluate("popular")["eligible"]
+    assert tracker.evaluate("first")["reasons"] == ["first_card_of_day"]
+    done = tracker.evaluate("done")
+    assert not done["eligible"] and done["minted"] and done["reasons"] == ["high_engagement"]
+
+    tracker.minted("popular")
+    tracker.minted("first")
+    assert not tracker.evaluate("popular")["eligible"]
+    assert not tracker.evaluate("first")["eligible"]
+    assert tracker.page()[0] == []
+    assert tracker.evaluate("unknown") is None
+
+def test_candidates_page_newest_first():
+    tracker = EligibilityTracker(threshold=2)
+    start = datetime.now() - timedelta(days=3)
+    for n in range(7):
+        tracker.card_created(make_card(f"card-{n}", start + timedelta(minutes=n), correct_count=2 if n % 2 else 0))
+    pages, cursor = [], None
+    while True:
+        cards, cursor = tracker.page(2, cursor=cursor)
+        pages.append([card["card_id"] for card in cards])
+        if cursor is None:
+            break
+    assert pages == [["card-5", "card-3"], ["card-1"]]
+
+    # A card crossing the threshold joins, a minted one leaves
+    tracker.interaction("card-4", correct=2)
+    tracker.minted("card-3")
+    cards, cursor = tracker.page(2)
+    assert [card["card_id"] for card in cards] == ["card-5", "card-4"]
+    assert [card["card_id"] for card in tracker.page(2, cursor=cursor)[0]] == ["card-1"]
+    assert tracker.metrics() == {"tracked_cards": 7, "candidates": 3}
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from feed import FeedIndex, InvalidCursor
+
+START = datetime(2024, 1, 1)
+
+def make_card(n: int, tags=()) -> dict:
+    return {"id": f"card-{n:02d}", "author_id": f"user-{n % 3}", "created_at": START + timedelta(minutes=n), "tags": list(tags)}
+
+def collect(index: FeedIndex, limit: int, **kwargs) -> list:
+    pages, cursor = [], None
+    while True:
+        ids, cursor = index.page(limit, cursor=cursor, **kwargs)
+        pages.append(ids)
+        if cursor is None:
+            return pages
+
+def test_pages_newest_first_without_gaps():
+    index = FeedIndex()
+    # Out of order arrival takes the insort path
+    for n in [3, 0, 4, 1, 2, 6, 5]:
+        index.add(make_card(n))
+    index.add(make_card(3))
+    assert len(index) == 7
+    pages = collect(index, 3)
+    assert pages == [["card-06", "card-05", "card-04"], ["card-03", "card-02", "card-01"], ["card-00"]]
+    assert index.author("card-04") == "user-1" and "card-04" in index
+
+def test_cards_added_after_a_cursor_do_not_shift_later_pages():
+    index = FeedIndex()
+    for n in range(1, 6):
+        index.add(make_card(n))
+    first, cursor = index.page(2)
+    index.add(make_card(9))
+    index.add(make_card(0))
+    second, cursor = index.page(2, cursor=cursor)
+    assert first == ["card-05", "card-04"]
+    assert second == ["card-03", "card-02"]
+    assert index.page(2, cursor=cursor)[0] == ["card-01", "card-00"]
+
+def test_tag_pages():
+    index = FeedIndex()
+    for n in range(6):
+        index.add(make_card(n, tags=["even"] if n % 2 == 0 else ["odd", "odd"]))
+    assert collect(index, 2, tag="odd") == [["card-05", "card-03"], ["card-01"]]
+    assert index.page(10, tag="missing") == ([], None)
+
+def test_invalid_cursor():
+    with pytest.raises(InvalidCursor):
+        FeedIndex().page(cursor="not a cursor")
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import httpx
+
+import ipfs
+import mock_ipfs_node
+from ipfs import IPFSClient, MetadataPublisher, PinCache, canonical_json, raw_cid
+
+def make_publisher(pins: PinCache) -> MetadataPublisher:
+    client = IPFSClient("http://mock-ipfs-node", transport=httpx.ASGITransport(app=mock_ipfs_node.app))
+    return MetadataPublisher(client, pins)
+
+def test_raw_cid_matches_the_node_for_single_block_content():
+    # Well-known CIDv1 (raw, sha2-256) of the empty string
+    assert raw_cid(b"") == "bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku"
+    assert canonical_json({"b": 1, "a": "é"}) == '{"a":"é","b":1}'.encode("utf-8")
+    assert raw_cid(canonical_json({"b": 1, "a": 2})) == raw_cid(canonical_json({"a": 2, "b": 1}))
+
+def test_publish_streams_media_and_skips_pinned_content(tmp_path, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(ipfs, "LEGACY_UPLOAD_ROOT", str(tmp_path))
+        media = bytes(range(256)) * 4096
+        (tmp_path / "photo.jpg").write_bytes(media)
+        publisher = make_publisher(PinCache(None))
+        metadata = {"title": "Card", "mediaUrls": ["/static/photo.jpg", "https://example.com/a.png"]}
+
+        uri, published = await publisher.publish(metadata)
+        assert published["mediaUrls"] == [f"ipfs://{raw_cid(media)}", "https://example.com/a.png"]
+        assert mock_ipfs_node.OBJECTS[raw_cid(media)] == media
+        assert uri == f"ipfs://{raw_cid(canonical_json(published))}"
+        assert publisher.stats["cid_mismatches"] == 0
+
+        again, _ = await publisher.publish(metadata)
+        assert again == uri
+        assert publisher.stats["uploads"] == 2 and publisher.stats["skipped"] == 2
+        await publisher.client.close()
+
+    asyncio.run(scenario())
+
+def test_pin_cache_batches_writes(tmp_path, monkeypatch):
+    async def scenario():
+        path = tmp_path / "ipfs_pins.json"
+        pins = PinCache(str(path), flush_delay=0.05)
+        writes = []
+        write = pins._write
+        monkeypatch.setattr(pins, "_write", lambda data: (writes.append(len(data)), write(data)))
+
+        for i in range(10):
+            await pins.add(f"key{i}", f"cid{i}")
+        await asyncio.sleep(0.2)
+        assert writes == [10]
+        await pins.add("key10", "cid10")
+        await pins.close()
+        assert writes == [10, 11]
+        assert json.loads(path.read_text())["key10"] == "cid10"
+        assert PinCache(str(path)).get("key3") == "cid3"
+
+    asyncio.run(scenario())
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from ledger import InsufficientTokens, TokenLedger
+from storage import InMemoryRepository, SQLiteRepository
+
+def test_unopened_accounts_read_as_zero_without_a_grant():
+    async def scenario():
+        repository = InMemoryRepository()
+        ledger = TokenLedger(repository, initial_balance=15)
+        assert await ledger.balance("stranger") == 0
+        assert not await ledger.exists("stranger")
+        assert await ledger.history("stranger") == []
+        assert ledger.metrics()["cached_accounts"] == 0
+
+    asyncio.run(scenario())
+
+def test_open_account_grants_once():
+    async def scenario():
+        ledger = TokenLedger(InMemoryRepository(), initial_balance=15)
+        assert await ledger.open_account("alice") == 15
+        assert await ledger.open_account("alice") == 15
+        assert await ledger.exists("alice")
+        assert [t["kind"] for t in await ledger.history("alice")] == ["initial_grant"]
+
+    asyncio.run(scenario())
+
+def test_debits_never_overdraw():
+    async def scenario():
+        ledger = TokenLedger(InMemoryRepository(), initial_balance=15)
+        await ledger.open_account("alice")
+        _, balance = await ledger.apply("alice", -15, "mint", "card-1")
+        assert balance == 0
+        with pytest.raises(InsufficientTokens):
+            await ledger.apply("alice", -2, "interaction", "card-2")
+        with pytest.raises(InsufficientTokens):
+            await ledger.apply("stranger", -2, "interaction", "card-2")
+        assert await ledger.balance("alice") == 0
+        assert ledger.metrics()["rejected"] == 2
+
+    asyncio.run(scenario())
+
+def test_concurrent_writers_retry_on_conflict(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "ledger.db")
+        worker_a, worker_b = SQLiteRepository(path), SQLiteRepository(path)
+        await worker_a.connect()
+        await worker_b.connect()
+        ledger_a = TokenLedger(worker_a, initial_balance=15)
+        ledger_b = TokenLedger(worker_b, initial_balance=15)
+
+        # Both workers see the signup race; only one grant is logged
+        assert await ledger_a.open_account("alice") == 15
+        assert await ledger_b.open_account("alice") == 15
+
+        await ledger_a.apply("alice", -2, "interaction", "card-1")
+        # B's cached account is one seq behind, so its append conflicts and is redone
+        _, balance = await ledger_b.apply("alice", -2, "interaction", "card-2")
+        assert balance == 11
+        assert ledger_b.metrics()["conflicts"] == 1
+
+        # The reloaded balance is checked again before the debit
+        with pytest.raises(InsufficientTokens):
+            await ledger_a.apply("alice", -12, "mint", "card-3")
+        history = await ledger_a.history("alice")
+        assert [t["seq"] for t in history] == [1, 2, 3]
+        assert sum(t["amount"] for t in history) == 11
+        await worker_a.close()
+        await worker_b.close()
+
+    asyncio.run(scenario())
+
+def test_recovers_from_snapshot_and_log_tail(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "ledger.db")
+        repository = SQLiteRepository(path)
+        await repository.connect()
+        ledger = TokenLedger(repository, initial_balance=15)
+        await ledger.open_account("alice")
+        await ledger.apply("alice", -2, "interaction", "card-1")
+        assert await ledger.snapshot() == 1
+        await ledger.apply("alice", 1, "author_reward", "card-2")
+        await repository.close()
+
+        repository = SQLiteRepository(path)
+        await repository.connect()
+        restarted = TokenLedger(repository, initial_balance=15)
+        assert await restarted.balance("alice") == 14
+        assert restarted.metrics()["replayed_transactions"] == 1
+        await repository.close()
+
+    asyncio.run(scenario())
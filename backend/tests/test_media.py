@@ -0,0 +1,75 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, UploadFile
+
+import media
+from media import MediaStore, UploadLimitMiddleware, parse_range, RangeNotSatisfiable
+
+def upload_app(max_bytes: int):
+    app = FastAPI()
+    calls = []
+
+    @app.post("/upload")
+    async def upload(files: list[UploadFile] = File(...)):
+        calls.append(len(files))
+        return {"files": len(files)}
+
+    app.add_middleware(UploadLimitMiddleware, paths=("/upload",), max_bytes=max_bytes)
+    return app, calls
+
+async def post(app, **kwargs) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.post("/upload", **kwargs)
+
+def test_declared_length_over_the_limit_is_rejected_before_parsing():
+    app, calls = upload_app(max_bytes=1024)
+    response = asyncio.run(post(app, files={"files": ("a.bin", b"x" * 4096)}))
+    assert response.status_code == 413
+    assert calls == []
+
+def test_streamed_body_over_the_limit_is_cut_off():
+    app, calls = upload_app(max_bytes=1024)
+
+    async def body():
+        # No Content-Length, so the size is only known as the chunks arrive
+        yield b'--b\r\nContent-Disposition: form-data; name="files"; filename="a.bin"\r\n\r\n'
+        for _ in range(8):
+            yield b"x" * 512
+        yield b"\r\n--b--\r\n"
+
+    response = asyncio.run(post(app, content=body(), headers={"content-type": "multipart/form-data; boundary=b"}))
+    assert response.status_code == 413
+    assert calls == []
+
+def test_upload_within_the_limit_reaches_the_handler():
+    app, calls = upload_app(max_bytes=1024 * 1024)
+    response = asyncio.run(post(app, files={"files": ("a.bin", b"x" * 4096)}))
+    assert response.status_code == 200
+    assert calls == [1]
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("items=0-1", 1000) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=1000-", 1000)
+
+@pytest.mark.skipif(media.Image is None, reason="Pillow is not installed")
+def test_decompression_bomb_is_served_as_the_original(tmp_path, monkeypatch):
+    async def scenario():
+        store = MediaStore(str(tmp_path / "uploads"))
+        image = io.BytesIO()
+        media.Image.new("RGB", (400, 400)).save(image, format="PNG")
+        upload = UploadFile(io.BytesIO(image.getvalue()), filename="big.png")
+        name = await store.save(upload)
+        # Pillow refuses images over twice MAX_IMAGE_PIXELS
+        monkeypatch.setattr(media.Image, "MAX_IMAGE_PIXELS", 1000)
+        failures = media.variant_failures.labels("decompression_bomb").value
+        assert await store.variant(name, 160) == store.path_for(name)
+        assert media.variant_failures.labels("decompression_bomb").value == failures + 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,146 @@
+import asyncio
+
+from minting import CONFIRMED, FAILED, QUEUED, SUBMITTED, MintQueue, StubMintProvider
+from storage import SQLiteRepository
+
+METADATA = {"title": "Card", "content": "Body", "createdAt": "2024-01-01T00:00:00"}
+
+def make_queue(provider=None, repository=None, **kwargs) -> MintQueue:
+    options = {"batch_size": 3, "poll_interval": 0.01, "receipt_timeout": 5.0, **kwargs}
+    return MintQueue(provider or StubMintProvider(block_time=0), repository, **options)
+
+async def wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_batches_take_consecutive_nonces():
+    async def scenario():
+        queue = make_queue()
+        jobs = [(await queue.submit(f"card:{i}", "0xabc", METADATA))[0] for i in range(5)]
+        assert await queue.process_batch() == 3
+        assert await queue.process_batch() == 2
+        assert [job.nonce for job in jobs] == [0, 1, 2, 3, 4]
+        await wait_for(lambda: all(job.status == CONFIRMED for job in jobs))
+        assert sorted(int(job.token_id) for job in jobs) == [1, 2, 3, 4, 5]
+        assert queue.metrics()["batches"] == 2
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_a_key_is_only_minted_once():
+    async def scenario():
+        queue = make_queue()
+        first, created = await queue.submit("card:1", "0xabc", METADATA)
+        again, created_again = await queue.submit("card:1", "0xabc", METADATA)
+        assert created and not created_again and again is first
+
+        # Another worker sharing the repository sees the job too
+        other = make_queue(repository=queue.repository)
+        other.repository.origin = "other"
+        job, created = await other.submit("card:1", "0xabc", METADATA)
+        assert not created and job.id == first.id
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_rejected_nonce_is_resynced_and_retried():
+    async def scenario():
+        provider = StubMintProvider(block_time=0)
+        queue = make_queue(provider)
+        job, _ = await queue.submit("card:1", "0xabc", METADATA)
+        # Another sender used the account's next nonce behind the queue's back
+        queue.nonces._next = 0
+        provider.next_nonce = 1
+        await queue.process_batch()
+        assert job.status == QUEUED and job.attempts == 1
+        assert queue.metrics()["nonce_resyncs"] == 1
+        await queue.process_batch()
+        assert job.status == SUBMITTED and job.nonce == 1
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_reverted_mint_fails_and_runs_the_failure_handler():
+    async def scenario():
+        provider = StubMintProvider(block_time=0)
+        queue = make_queue(provider)
+        failed = []
+
+        async def on_failed(job):
+            failed.append(job.id)
+
+        queue.on_result("card", failed=on_failed)
+        job, _ = await queue.submit("card:1", "0xabc", METADATA)
+        provider.reverting_jobs.add(job.id)
+        await queue.process_batch()
+        await wait_for(lambda: job.status == FAILED)
+        assert failed == [job.id]
+        assert "reverted" in job.error
+        # A failed job frees the key
+        retry, created = await queue.submit("card:1", "0xabc", METADATA)
+        assert created and retry.id != job.id
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_stuck_transaction_is_replaced_not_failed():
+    async def scenario():
+        provider = StubMintProvider(block_time=0)
+        # Nothing priced at the current network rate gets mined
+        provider.min_gas_price_wei = int(provider.gas_price_wei * 1.3)
+        queue = make_queue(provider, receipt_timeout=0.05)
+        failed = []
+
+        async def on_failed(job):
+            failed.append(job)
+
+        queue.on_result("card", failed=on_failed)
+        job, _ = await queue.submit("card:1", "0xabc", METADATA)
+        await queue.process_batch()
+        await wait_for(lambda: job.status == CONFIRMED)
+        assert failed == []
+        assert job.nonce == 0 and len(job.transactions) == 2
+        assert job.tx_hash == job.transactions[-1]["hash"]
+        assert queue.metrics()["replacements"] == 1
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_jobs_survive_a_restart(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "cardnote.db")
+        provider = StubMintProvider(block_time=0)
+        provider.min_gas_price_wei = 10 ** 18
+        repository = SQLiteRepository(path)
+        queue = make_queue(provider, repository)
+        submitted, _ = await queue.submit("card:1", "0xabc", METADATA)
+        queued, _ = await queue.submit("card:2", "0xabc", METADATA)
+        await queue.process_batch()
+        queue._pending.append(queued)
+        queued.update(QUEUED, nonce=None, transactions=[])
+        await queue.stop()
+        await repository.close()
+
+        # The chain kept the transaction; a new process picks both jobs up
+        provider.min_gas_price_wei = 0
+        confirmed = []
+
+        async def on_confirmed(job):
+            confirmed.append(job.key)
+
+        restarted = make_queue(provider, SQLiteRepository(path))
+        restarted.on_result("card", confirmed=on_confirmed)
+        await restarted.start()
+        assert restarted.metrics()["recovered"] == 2
+        await wait_for(lambda: len(confirmed) == 2)
+        assert sorted(confirmed) == ["card:1", "card:2"]
+        # Still the original transaction, not a second mint under a new nonce
+        assert (await restarted.get(submitted.id)).nonce == 0
+        assert (await restarted.get(queued.id)).nonce == 1
+        assert provider.next_nonce == 2
+        await restarted.stop()
+        await restarted.repository.close()
+
+    asyncio.run(scenario())
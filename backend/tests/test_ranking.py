@@ -0,0 +1,55 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from feed import InvalidCursor
+from ranking import HotRanking
+
+def make_card(card_id: str, created_at: datetime, correct_count: int = 0) -> dict:
+    return {"id": card_id, "created_at": created_at, "correct_count": correct_count}
+
+def test_newer_cards_rank_first_until_swiped():
+    ranking = HotRanking(half_life_hours=1)
+    now = datetime.now()
+    ranking.add(make_card("old", now - timedelta(hours=2)))
+    ranking.add(make_card("new", now))
+    assert [card_id for card_id, _ in ranking.page()[0]] == ["new", "old"]
+
+    # Two half-lives old needs four fresh swipes to draw level; five overtake
+    ranking.interaction("old", count=5)
+    ranked = ranking.page()[0]
+    assert [card_id for card_id, _ in ranked] == ["old", "new"]
+    assert ranked[0][1] == pytest.approx(ranking.score("old"), rel=1e-3)
+    assert ranking.score("missing") is None
+
+def test_scores_decay_by_half_life():
+    ranking = HotRanking(half_life_hours=1)
+    created = datetime.now()
+    ranking.add(make_card("card", created, correct_count=3))
+    later = created.timestamp() + 3600
+    assert ranking.score("card", now=created.timestamp()) == pytest.approx(4)
+    assert ranking.score("card", now=later) == pytest.approx(2)
+
+def test_pages_follow_the_top_list():
+    ranking = HotRanking(size=5, half_life_hours=1)
+    now = datetime.now()
+    for n in range(8):
+        ranking.add(make_card(f"card-{n}", now - timedelta(minutes=n)))
+    assert ranking.metrics() == {"ranked_cards": 8, "top_size": 5}
+
+    ids, cursor = ranking.page(2)
+    seen = list(ids)
+    while cursor is not None:
+        ids, cursor = ranking.page(2, cursor=cursor)
+        seen.extend(ids)
+    assert [card_id for card_id, _ in seen] == [f"card-{n}" for n in range(5)]
+
+    # A card outside the top list re-enters when swiped
+    ranking.interaction("card-7", count=10, timestamp=time.time())
+    assert ranking.page(1)[0][0][0] == "card-7"
+    assert ranking.metrics()["top_size"] == 5
+
+def test_invalid_cursor():
+    with pytest.raises(InvalidCursor):
+        HotRanking().page(cursor="@@")
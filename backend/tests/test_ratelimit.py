@@ -0,0 +1,77 @@
+import asyncio
+import ipaddress
+
+import fakeredis
+from starlette.requests import Request
+
+import ratelimit
+from ratelimit import InMemoryBackend, RateLimitService, RedisBackend, client_address, parse_networks
+
+def make_request(peer: str, forwarded: str = "", user_id: str = "") -> Request:
+    headers = []
+    if forwarded:
+        headers.append((b"x-forwarded-for", forwarded.encode()))
+    if user_id:
+        headers.append((b"x-user-id", user_id.encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (peer, 1234)})
+
+def test_redis_script_refills_and_rejects(monkeypatch):
+    async def scenario():
+        backend = RedisBackend(fakeredis.FakeAsyncRedis(decode_responses=True))
+        now = [1000.0]
+        monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+
+        results = [await backend.take("k", capacity=2, rate=1.0) for _ in range(3)]
+        assert [allowed for allowed, _ in results] == [True, True, False]
+        assert results[1][1] == 0
+
+        now[0] += 1.5
+        allowed, tokens = await backend.take("k", capacity=2, rate=1.0)
+        assert allowed and tokens == 0.5
+        # The key expires once a full bucket would have refilled
+        assert 0 < await backend.redis.pttl("k") <= 2000
+
+    asyncio.run(scenario())
+
+def test_in_memory_backend_limits_and_bounds_keys():
+    async def scenario():
+        backend = InMemoryBackend(max_keys=2)
+        assert (await backend.take("a", capacity=1, rate=0.001))[0]
+        assert not (await backend.take("a", capacity=1, rate=0.001))[0]
+        await backend.take("b", capacity=1, rate=0.001)
+        await backend.take("c", capacity=1, rate=0.001)
+        assert list(backend._buckets) == ["b", "c"]
+
+    asyncio.run(scenario())
+
+def test_service_falls_back_when_redis_fails():
+    class BrokenBackend:
+        async def take(self, *args):
+            raise ConnectionError("redis went away")
+
+    async def scenario():
+        service = RateLimitService()
+        service.backend = BrokenBackend()
+        first = await service.take("/chat", "ratelimit:/chat:ip:1", capacity=1, rate=0.001)
+        second = await service.take("/chat", "ratelimit:/chat:ip:1", capacity=1, rate=0.001)
+        assert first.allowed and not second.allowed
+        assert second.headers()["Retry-After"]
+        assert service.backend_errors == 2
+        assert service.metrics()["rejections"] == {"/chat": 1}
+
+    asyncio.run(scenario())
+
+def test_client_address_ignores_headers_from_untrusted_peers():
+    proxies = parse_networks("10.0.0.0/8")
+    request = make_request("203.0.113.9", forwarded="198.51.100.1", user_id="someone")
+    assert client_address(request, proxies) == "203.0.113.9"
+    assert ratelimit.default_identifier(request) == "ip:203.0.113.9"
+
+def test_client_address_follows_trusted_proxies():
+    proxies = parse_networks("10.0.0.0/8, 192.0.2.1")
+    # The client forged the first hop; the proxies appended the rest
+    request = make_request("10.0.0.2", forwarded="1.1.1.1, 198.51.100.7, 192.0.2.1")
+    assert client_address(request, proxies) == "198.51.100.7"
+    assert client_address(make_request("10.0.0.2"), proxies) == "10.0.0.2"
+    assert parse_networks("") == []
+    assert proxies[1] == ipaddress.ip_network("192.0.2.1/32")
@@ -0,0 +1,38 @@
+from starlette.requests import Request
+
+from response_cache import ResponseCache, dumps
+
+def make_request(if_none_match: str) -> Request:
+    return Request({"type": "http", "headers": [(b"if-none-match", if_none_match.encode("latin-1"))]})
+
+def test_entries_are_served_only_for_their_version():
+    cache = ResponseCache()
+    version = cache.version("card:1")
+    cache.put("card:1", version, dumps({"id": "1"}))
+    assert cache.get("card:1") == b'{"id":"1"}'
+
+    cache.invalidate("card:1")
+    assert cache.get("card:1") is None
+    # Bytes built before the change are dropped
+    cache.put("card:1", version, b"stale")
+    assert cache.get("card:1") is None
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_entries=2)
+    for key in ["a", "b"]:
+        cache.put(key, 0, key.encode())
+    cache.get("a")
+    cache.put("c", 0, b"c")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" and cache.get("c") == b"c"
+
+def test_etags_change_with_entity_versions():
+    cache = ResponseCache()
+    etag = cache.entity_etag(["card:1", "card:2"], "page")
+    assert cache.not_modified(make_request(f'W/{etag}, "other"'), etag).status_code == 304
+    cache.invalidate("card:2")
+    changed = cache.entity_etag(["card:1", "card:2"], "page")
+    assert changed != etag
+    assert cache.not_modified(make_request(etag), changed) is None
+    # Another process numbers versions from scratch
+    assert ResponseCache().entity_etag(["card:1"]) != ResponseCache().entity_etag(["card:1"])
@@ -0,0 +1,59 @@
+import pytest
+
+from feed import InvalidCursor
+from search import SearchIndex, tokenize
+
+def make_card(card_id: str, title: str, content: str = "", tags=()) -> dict:
+    return {"id": card_id, "title": title, "content": content, "tags": list(tags)}
+
+def ids(results) -> list:
+    return [card_id for card_id, _ in results]
+
+def test_tokenize_splits_words_and_japanese_bigrams():
+    assert tokenize("Ｈello, World_x") == ["hello", "world", "x"]
+    assert tokenize("東京タワー is tall") == ["東京", "京タ", "タワ", "ワー", "is", "tall"]
+    assert tokenize("猫") == ["猫"]
+
+def test_every_term_must_match_and_titles_weigh_more():
+    index = SearchIndex()
+    index.add(make_card("a", "python tips", "loops and lists"))
+    index.add(make_card("b", "cooking", "python recipes for lists"))
+    index.add(make_card("c", "gardening", "tomatoes"))
+    assert ids(index.search("python lists")[0]) == ["a", "b"]
+    assert index.search("python tomatoes") == ([], None)
+    assert index.search("") == ([], None)
+
+def test_prefix_queries_and_tags():
+    index = SearchIndex()
+    index.add(make_card("a", "programming", tags=["Dev"]))
+    index.add(make_card("b", "program notes"))
+    index.add(make_card("c", "東京の地下鉄"))
+    assert sorted(ids(index.search("progr", prefix=True)[0])) == ["a", "b"]
+    assert ids(index.search("progr*")[0]) == ids(index.search("progr", prefix=True)[0])
+    assert index.search("progr")[0] == []
+    assert ids(index.search("progr*", tag="dev")[0]) == ["a"]
+    # A lone kanji matches the bigrams it starts or ends
+    assert ids(index.search("地")[0]) == ["c"]
+    assert ids(index.search("東京")[0]) == ["c"]
+
+def test_cursor_pages_cover_every_match_once():
+    index = SearchIndex()
+    for n in range(7):
+        # Repeating the term gives every card a different score
+        index.add(make_card(f"card-{n}", "topic", " ".join(["topic"] * n) + " filler"))
+    pages, cursor = [], None
+    while True:
+        results, cursor = index.search("topic", limit=3, cursor=cursor)
+        pages.append(ids(results))
+        if cursor is None:
+            break
+    seen = [card_id for page in pages for card_id in page]
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sorted(seen) == sorted(f"card-{n}" for n in range(7))
+    assert seen == ids(index.search("topic", limit=10)[0])
+
+def test_invalid_cursor():
+    index = SearchIndex()
+    index.add(make_card("a", "topic"))
+    with pytest.raises(InvalidCursor):
+        index.search("topic", cursor="@@")
@@ -0,0 +1,15 @@
+import pytest
+
+from storage import InMemoryRepository, PostgresRepository, Repository, SQLiteRepository
+
+def test_backends_implement_the_whole_interface():
+    for repository in (InMemoryRepository(), SQLiteRepository(":memory:"), PostgresRepository("postgresql://localhost/test")):
+        assert isinstance(repository, Repository)
+
+def test_an_incomplete_backend_fails_when_instantiated():
+    class MissingMethods(Repository):
+        async def get_user(self, user_id):
+            return None
+
+    with pytest.raises(TypeError, match="save_user"):
+        MissingMethods()
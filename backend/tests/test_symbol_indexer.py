@@ -0,0 +1,173 @@
+import asyncio
+import json
+
+import pytest
+
+from feed import InvalidCursor
+from symbol_cipher import encrypt_caesar_cipher
+from symbol_indexer import SymbolCardIndex, SymbolIndexer
+
+def card(card_id: str, created_at: str, author: str = "alice") -> dict:
+    return {
+        "id": card_id,
+        "title": f"Card {card_id}",
+        "content": "Body",
+        "author": author,
+        "createdAt": created_at,
+        "symbolAddress": f"T{author.upper()}",
+    }
+
+class StubClient:
+    def __init__(self, max_page_size: int = 100):
+        self.transactions = []
+        self.max_page_size = max_page_size
+        self.requested_page_sizes = set()
+
+    def publish(self, height: int, payload: dict) -> None:
+        self.transactions.append({"height": height, "value": encrypt_caesar_cipher(json.dumps(payload))})
+
+    async def get_chain_height(self) -> int:
+        return max((tx["height"] for tx in self.transactions), default=0)
+
+    async def get_metadata_transactions(self, key, from_height, page_size, offset=0):
+        self.requested_page_sizes.add(page_size)
+        matching = [tx for tx in self.transactions if tx["height"] >= from_height]
+        return matching[offset:offset + min(page_size, self.max_page_size)]
+
+def test_index_pages_newest_first_with_cursors():
+    index = SymbolCardIndex()
+    for i in range(5):
+        index.upsert(card(str(i), f"2024-01-0{i + 1}T00:00:00Z", author="alice" if i % 2 else "bob"))
+
+    first, cursor = index.page(2)
+    second, cursor2 = index.page(2, cursor=cursor)
+    last, end = index.page(2, cursor=cursor2)
+    assert [c["id"] for c in first + second + last] == ["4", "3", "2", "1", "0"]
+    assert end is None
+    assert [c["id"] for c in index.page(10, author="alice")[0]] == ["3", "1"]
+    assert [c["id"] for c in index.page(10, address="TBOB")[0]] == ["4", "2", "0"]
+
+    # Replacing a card moves it rather than duplicating it
+    index.upsert(card("0", "2024-02-01T00:00:00Z", author="alice"))
+    assert [c["id"] for c in index.page(2)[0]] == ["0", "4"]
+    assert [c["id"] for c in index.page(10, author="bob")[0]] == ["4", "2"]
+    with pytest.raises(InvalidCursor):
+        index.page(2, cursor="!!!")
+
+def test_checkpoint_appends_to_journal_and_compacts(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "symbol_index.json")
+        client = StubClient()
+        indexer = SymbolIndexer(client, "key", path=path, start_height=1)
+        for i in range(4):
+            client.publish(i + 1, card(str(i), f"2024-01-0{i + 1}T00:00:00Z"))
+        await indexer.sync()
+        snapshot = (tmp_path / "symbol_index.json").read_text()
+        journal = (tmp_path / "symbol_index.json.journal").read_text().splitlines()
+
+        client.publish(5, card("4", "2024-01-05T00:00:00Z"))
+        await indexer.sync()
+        # Only the new card is written; the snapshot is untouched
+        assert (tmp_path / "symbol_index.json").read_text() == snapshot
+        appended = (tmp_path / "symbol_index.json.journal").read_text().splitlines()[len(journal):]
+        assert [[c["id"] for c in json.loads(line)["cards"]] for line in appended] == [["4"]]
+
+        restored = SymbolIndexer(StubClient(), "key", path=path)
+        assert restored.load_checkpoint()
+        assert len(restored.index) == 5 and restored.height == 5
+
+        # Edits of one card pile up in the journal until it outgrows the index
+        for height in range(6, 12):
+            client.publish(height, {**card("0", "2024-01-01T00:00:00Z"), "title": f"Edit {height}"})
+            await indexer.sync()
+        assert (tmp_path / "symbol_index.json").read_text() != snapshot
+        assert len((tmp_path / "symbol_index.json.journal").read_text().splitlines()) < 6
+        restored = SymbolIndexer(StubClient(), "key", path=path)
+        restored.load_checkpoint()
+        assert len(restored.index) == 5 and restored.height == 11
+        assert restored.index.get("0")["title"] == "Edit 11"
+
+    asyncio.run(scenario())
+
+def test_stale_or_torn_journal_is_not_replayed(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "symbol_index.json")
+        client = StubClient()
+        client.publish(1, card("0", "2024-01-01T00:00:00Z"))
+        indexer = SymbolIndexer(client, "key", path=path, start_height=1)
+        await indexer.sync()
+        client.publish(2, card("1", "2024-01-02T00:00:00Z"))
+        await indexer.sync()
+        with open(indexer.journal_path, "a", encoding="utf-8") as f:
+            f.write('{"height": 9, "ca')
+
+        restored = SymbolIndexer(StubClient(), "key", path=path)
+        restored.load_checkpoint()
+        assert len(restored.index) == 2 and restored.height == 2
+
+        with open(indexer.journal_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"journal": "older"}) + "\n")
+            f.write(json.dumps({"height": 9, "cards": [card("x", "2023-01-01T00:00:00Z")]}) + "\n")
+        restored = SymbolIndexer(StubClient(), "key", path=path)
+        restored.load_checkpoint()
+        assert restored.index.get("x") is None
+
+    asyncio.run(scenario())
+
+def test_backfill_keeps_the_change_hook(tmp_path):
+    async def scenario():
+        changed = []
+        client = StubClient()
+        client.publish(1, card("0", "2024-01-01T00:00:00Z"))
+        indexer = SymbolIndexer(
+            client, "key", path=str(tmp_path / "symbol_index.json"), start_height=1, on_change=changed.append
+        )
+        await indexer.backfill()
+        assert changed == ["0"]
+        assert indexer.index.on_change is not None
+
+    asyncio.run(scenario())
+
+def test_short_pages_from_a_capped_node_do_not_skip_blocks(tmp_path):
+    async def scenario():
+        # The node serves 3 per page whatever is asked for, and block 2 spans several pages
+        client = StubClient(max_page_size=3)
+        client.publish(1, card("a", "2024-01-01T00:00:00Z"))
+        for i in range(7):
+            client.publish(2, card(f"b{i}", "2024-01-02T00:00:00Z"))
+        client.publish(4, card("c", "2024-01-04T00:00:00Z"))
+        indexer = SymbolIndexer(client, "key", path=str(tmp_path / "symbol_index.json"), page_size=500, start_height=1)
+        assert await indexer.sync() == 9
+        assert len(indexer.index) == 9 and indexer.height == 4
+        assert client.requested_page_sizes == {100}
+
+        client.publish(5, card("d", "2024-01-05T00:00:00Z"))
+        assert await indexer.sync() == 1
+        assert indexer.index.get("d") is not None
+
+    asyncio.run(scenario())
+
+def test_sync_failures_do_not_stop_the_indexer(tmp_path):
+    async def scenario():
+        client = StubClient()
+        client.transactions.append({"value": "no height"})
+        indexer = SymbolIndexer(client, "key", path=str(tmp_path / "symbol_index.json"), interval=0.01, start_height=1)
+        await indexer.start()
+        while indexer.metrics()["failed_syncs"] < 2:
+            await asyncio.sleep(0.01)
+        # Once the node serves good data again the same task picks it up
+        client.transactions = []
+        client.publish(1, card("0", "2024-01-01T00:00:00Z"))
+        while indexer.index.get("0") is None:
+            await asyncio.sleep(0.01)
+        await indexer.stop()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+@pytest.mark.parametrize("checkpoint", ['{"cards": []}', '{"height": 3, "cards": [{"id": "x"}]}', '[1, 2]'])
+def test_malformed_checkpoint_is_ignored(tmp_path, checkpoint):
+    path = tmp_path / "symbol_index.json"
+    path.write_text(checkpoint)
+    indexer = SymbolIndexer(StubClient(), "key", path=str(path), start_height=1)
+    assert not indexer.load_checkpoint()
+    assert indexer.height == 0 and len(indexer.index) == 0
@@ -0,0 +1,29 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import symbol_integration
+from symbol_client import SymbolNodeError
+
+@pytest.fixture
+def client(monkeypatch):
+    async def unreachable(*args, **kwargs):
+        raise SymbolNodeError("node timed out")
+
+    monkeypatch.setattr(symbol_integration.symbol_client, "get_card", unreachable)
+    monkeypatch.setattr(symbol_integration.symbol_client, "get_user", unreachable)
+    app = FastAPI()
+    app.include_router(symbol_integration.router)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+@pytest.mark.parametrize("path", ["/api/symbol/cards/unindexed", "/api/symbol/users/TADDRESS"])
+def test_node_errors_are_bad_gateway(client, path):
+    async def scenario():
+        async with client:
+            return await client.get(path)
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 502
+    assert "node timed out" in response.json()["detail"]
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark for the request instrumentation in shared/cardnote_shared/metrics.py.
+
+Drives a bare ASGI endpoint directly (no HTTP client or server, so the
+numbers are the middleware's own cost) with the middleware absent, present
+but switched off (METRICS_ENABLED=0), recording, and recording with spans
+(METRICS_TRACE=1). Each mode runs in a fresh interpreter because the
+switches are read at import time.
+
+    python benchmarks/bench_metrics.py [--requests 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+SHARED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared")
+MODES = {
+    "none": {},
+    "off": {"METRICS_ENABLED": "0"},
+    "on": {"METRICS_ENABLED": "1", "METRICS_TRACE": "0"},
+    "trace": {"METRICS_ENABLED": "1", "METRICS_TRACE": "1"},
+}
+
+def run_mode(mode: str, requests: int) -> float:
+    sys.path.insert(0, SHARED)
+    from cardnote_shared.metrics import MetricsMiddleware, span
+
+    class Route:
+        path = "/cards/{card_id}"
+
+    async def endpoint(scope, receive, send):
+        scope["route"] = Route
+        with span("handler"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    async def drive() -> float:
+        app = endpoint if mode == "none" else MetricsMiddleware(endpoint)
+        for _ in range(1000):
+            await app({"type": "http", "method": "GET"}, receive, send)
+        started = time.perf_counter()
+        for _ in range(requests):
+            await app({"type": "http", "method": "GET"}, receive, send)
+        return (time.perf_counter() - started) / requests
+
+    return asyncio.run(drive())
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(run_mode(args.mode, args.requests))
+        return
+
+    results = {}
+    for mode, env in MODES.items():
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--requests", str(args.requests)],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True
+        ).stdout
+        results[mode] = float(output.strip().splitlines()[-1])
+    print(f"{'mode':>6} {'per request':>12} {'overhead':>10}")
+    for mode, seconds in results.items():
+        print(f"{mode:>6} {seconds * 1e6:>10.2f}us {(seconds - results['none']) * 1e6:>8.2f}us")
+
+if __name__ == "__main__":
+    main()
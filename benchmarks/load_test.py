@@ -0,0 +1,356 @@
+"""
+In-process load test for the card API (backend/main.py) and the discussion
+API (strategy-discussion-api/app/main.py).
+
+Each suite runs in a fresh interpreter, in a temporary working directory,
+with the LLM, Symbol node, IPFS node and minting stubbed and in-memory
+storage (override with --database-url). Requests go through the full ASGI
+stack with httpx's ASGITransport, so routing, validation, middleware and
+serialization are measured but no sockets are involved.
+
+The card suite seeds --cards cards and --users funded users, then drives
+create_card, interact_with_card, get_card_feed (new and hot),
+check_nft_eligibility and upload_media. The discussion suite drives
+/discussion/start, /next, /round and /stop. Every scenario sends
+--requests requests from --concurrency concurrent workers and reports
+p50/p95/p99 latency, throughput and the process's peak RSS so far.
+
+    python benchmarks/load_test.py [--suite cards|discussion|all] [--requests 2000] [--concurrency 16]
+    python benchmarks/load_test.py --save-baseline          # store benchmarks/baseline.json
+    python benchmarks/load_test.py --baseline benchmarks/baseline.json
+
+Against a baseline, a scenario regresses when it has more errors, or when p95
+grows or throughput drops by more than --tolerance (default 20%); the exit
+status is then 1. Baselines are
+machine specific, so record one on the machine that compares against it.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+DISCUSSION_API = os.path.join(ROOT, "strategy-discussion", "backend", "strategy-discussion-api")
+SHARED = os.path.join(ROOT, "shared")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+STUB_ENV = {
+    "LLM_BACKEND": "stub",
+    "LLM_CACHE": "0",
+    "SYMBOL_MOCK_NODE": "1",
+    "IPFS_MOCK_NODE": "1",
+    "MINT_PROVIDER": "stub",
+    # Nothing listens here, so rate limiting uses in-process buckets
+    "REDIS_URL": "redis://127.0.0.1:1",
+}
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+async def drive(
+    request: Callable[[int], Awaitable[int]],
+    total: int,
+    concurrency: int
+) -> dict:
+    """
+    Sends total requests from concurrency workers; request(i) returns the status
+    """
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            status = await request(i)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+async def cards_suite(args) -> Dict[str, dict]:
+    sys.path[:0] = [BACKEND, SHARED]
+    import httpx
+    import main
+
+    rng = random.Random(args.seed)
+    results: Dict[str, dict] = {}
+    transport = httpx.ASGITransport(app=main.app)
+    await main.startup()
+    await main.startup_storage()
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            user_ids = []
+            tokens = []
+            for i in range(args.users):
+                response = await client.post("/api/auth/signup", json={
+                    "email": f"user{i}@example.com", "username": f"user{i}", "password": "bench"
+                })
+                user_ids.append(response.json()["id"])
+                tokens.append(response.json()["access_token"])
+            for user_id in user_ids:
+                # Enough tokens that interactions never run out
+                await main.token_ledger.apply(user_id, 1_000_000, "benchmark_grant")
+
+            card_ids: List[str] = []
+
+            async def create_card(i: int) -> int:
+                response = await client.post("/api/cards", json={
+                    "title": f"Card {i} {rng.choice(['ブロックチェーン', 'Python', '分散システム', 'NFT'])}",
+                    "content": " ".join(rng.choice(["知識", "token", "ledger", "カード", "feed"]) for _ in range(40)),
+                    "tags": rng.sample(["crypto", "python", "systems", "nft", "japanese"], 2)
+                })
+                if response.status_code == 200:
+                    card_ids.append(response.json()["id"])
+                return response.status_code
+
+            results["create_card"] = await drive(create_card, args.cards, args.concurrency)
+
+            async def interact(i: int) -> int:
+                response = await client.post(
+                    f"/api/cards/{rng.choice(card_ids)}/interact",
+                    json={"interaction_type": "correct"},
+                    headers={"Authorization": f"Bearer {rng.choice(tokens)}"}
+                )
+                return response.status_code
+
+            results["interact_with_card"] = await drive(interact, args.requests, args.concurrency)
+
+            def feed(sort: str) -> Callable[[int], Awaitable[int]]:
+                cursors: List[str] = []
+
+                async def request(i: int) -> int:
+                    # Mostly first pages, some follow a cursor further down
+                    params = {"limit": 20, "sort": sort}
+                    if cursors and rng.random() < 0.3:
+                        params["cursor"] = rng.choice(cursors)
+                    response = await client.get("/api/cards/feed", params=params)
+                    if response.status_code == 200:
+                        next_cursor = response.json()["next_cursor"]
+                        if next_cursor and len(cursors) < 100:
+                            cursors.append(next_cursor)
+                    return response.status_code
+
+                return request
+
+            results["get_card_feed"] = await drive(feed("new"), args.requests, args.concurrency)
+            results["get_card_feed_hot"] = await drive(feed("hot"), args.requests, args.concurrency)
+
+            async def eligibility(i: int) -> int:
+                response = await client.get(f"/api/cards/{rng.choice(card_ids)}/nft-eligibility")
+                return response.status_code
+
+            results["check_nft_eligibility"] = await drive(eligibility, args.requests, args.concurrency)
+
+            payloads = [rng.randbytes(args.upload_bytes) for _ in range(16)]
+
+            async def upload(i: int) -> int:
+                response = await client.post(
+                    "/api/upload/media",
+                    files={"files": (f"bench{i}.bin", payloads[i % len(payloads)], "application/octet-stream")}
+                )
+                return response.status_code
+
+            results["upload_media"] = await drive(upload, max(1, args.requests // 4), args.concurrency)
+    finally:
+        await main.shutdown_storage()
+    return results
+
+async def discussion_suite(args) -> Dict[str, dict]:
+    sys.path[:0] = [DISCUSSION_API, SHARED]
+    import httpx
+    from app import main
+
+    rng = random.Random(args.seed)
+    results: Dict[str, dict] = {}
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            discussion_ids: List[str] = []
+
+            async def start(i: int) -> int:
+                response = await client.post("/discussion/start", json={
+                    "content": f"戦略案 {i}: " + "新規市場への参入と既存事業の効率化。" * rng.randint(5, 40)
+                })
+                if response.status_code == 200:
+                    discussion_ids.append(response.json()["discussion"]["id"])
+                return response.status_code
+
+            results["discussion_start"] = await drive(start, max(1, args.requests // 4), args.concurrency)
+
+            async def next_message(i: int) -> int:
+                response = await client.post(
+                    "/discussion/next", params={"discussion_id": rng.choice(discussion_ids)}
+                )
+                return response.status_code
+
+            results["discussion_next"] = await drive(next_message, args.requests, args.concurrency)
+
+            async def round_(i: int) -> int:
+                response = await client.post(
+                    "/discussion/round", params={"discussion_id": rng.choice(discussion_ids)}
+                )
+                return response.status_code
+
+            results["discussion_round"] = await drive(round_, max(1, args.requests // 4), args.concurrency)
+
+            pending = list(discussion_ids)
+
+            async def stop(i: int) -> int:
+                response = await client.post("/discussion/stop", params={"discussion_id": pending[i]})
+                return response.status_code
+
+            results["discussion_stop"] = await drive(stop, len(pending), args.concurrency)
+    finally:
+        await main.shutdown()
+    return results
+
+SUITES = {"cards": cards_suite, "discussion": discussion_suite}
+
+def run_suite(suite: str, args) -> Dict[str, dict]:
+    """
+    Runs one suite in a child interpreter and returns its results
+    """
+    command = [
+        sys.executable, os.path.abspath(__file__), "--child", suite,
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--cards", str(args.cards), "--users", str(args.users),
+        "--upload-bytes", str(args.upload_bytes), "--seed", str(args.seed),
+    ]
+    env = {**os.environ, **STUB_ENV}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "uploads"))
+        env.update({
+            "SYMBOL_INDEX_PATH": os.path.join(workdir, "symbol_index.json"),
+            "IPFS_PIN_CACHE_PATH": os.path.join(workdir, "ipfs_pins.json"),
+            "MEDIA_ROOT": os.path.join(workdir, "uploads"),
+        })
+        if args.database_url:
+            env["DATABASE_URL"] = args.database_url
+        else:
+            env.pop("DATABASE_URL", None)
+        env.pop("DISCUSSION_DATABASE_URL", None)
+        completed = subprocess.run(command, env=env, cwd=workdir, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit(f"{suite} suite failed")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {previous['throughput_rps']:.0f} -> {current['throughput_rps']:.0f} req/s"
+            )
+    return regressions
+
+def print_table(results: Dict[str, dict], baseline: Dict[str, dict]) -> None:
+    print(f"{'scenario':<24} {'reqs':>6} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'req/s':>9} {'rss MB':>8} {'vs base p95':>12}")
+    for name, r in results.items():
+        previous = baseline.get(name)
+        delta = f"{(r['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%" if previous and previous["p95_ms"] else ""
+        print(f"{name:<24} {r['requests']:>6} {r['errors']:>5} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['p99_ms']:>8.2f} {r['throughput_rps']:>9.0f} {r['peak_rss_mb']:>8.1f} {delta:>12}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", choices=list(SUITES) + ["all"], default="all")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cards", type=int, default=2000, help="cards created before the read scenarios")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--upload-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="storage for the card suite (default: in memory)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--child", choices=list(SUITES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(SUITES[args.child](args))))
+        return
+
+    suites = list(SUITES) if args.suite == "all" else [args.suite]
+    results: Dict[str, dict] = {}
+    for suite in suites:
+        results.update(run_suite(suite, args))
+
+    params = {
+        key: getattr(args, key)
+        for key in ("requests", "concurrency", "cards", "users", "upload_bytes", "seed", "database_url")
+    }
+    report = {
+        "params": params,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    baseline: Dict[str, dict] = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        baseline = stored["results"]
+        if stored.get("params") != params:
+            print(f"warning: baseline was recorded with {stored.get('params')}")
+
+    print_table(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
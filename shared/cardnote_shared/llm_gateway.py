@@ -0,0 +1,475 @@
+"""
+LLM Gateway Module
+
+Single access point for chat completions. Calls go through one pooled
+AsyncOpenAI client (tuned HTTP keep-alive, explicit timeouts), a bounded
+concurrency semaphore, and retries with jittered exponential backoff.
+Latency (with a histogram), token and error counts are recorded per model
+and label.
+
+LLM_BACKEND=stub swaps the OpenAI backend for a local one that answers
+without network access, for load tests and CI.
+
+Streams are read from upstream by a background task into a queue while it
+holds a concurrency slot, so a slow consumer (an SSE client) delays only
+itself and the slot is freed as soon as generation ends.
+
+LLM_CACHE=1 enables a completion cache keyed by a hash of the model,
+parameters and normalized messages: an in-memory LRU tier bounded by entry
+count, bytes and TTL, plus an optional on-disk tier (LLM_CACHE_DIR). Cached
+streams are replayed chunk by chunk.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+# Upper bounds in seconds of the call latency histogram
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0]
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    pass
+
+class LLMRetryableError(LLMError):
+    pass
+
+class Completion:
+    def __init__(self, text: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (LLMRetryableError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES
+
+class OpenAIBackend:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        timeout: float = 60.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0
+    ):
+        from openai import AsyncOpenAI
+
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(timeout, connect=5.0)
+        )
+        # Retries are handled by the gateway so they share its backoff and metrics
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            http_client=self.http_client,
+            max_retries=0,
+            timeout=timeout
+        )
+
+    async def complete(self, messages: List[dict], model: str, **params) -> Completion:
+        response = await self.client.chat.completions.create(
+            model=model, messages=messages, **params
+        )
+        usage = response.usage
+        return Completion(
+            response.choices[0].message.content or "",
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0
+        )
+
+    async def stream(self, messages: List[dict], model: str, **params) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=model, messages=messages, stream=True, **params
+        )
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing the response aborts generation upstream if the caller stops early
+            await response.response.aclose()
+
+    async def aclose(self) -> None:
+        await self.http_client.aclose()
+
+class StubBackend:
+    """
+    Deterministic offline backend: echoes the last message after a fixed delay
+    """
+
+    def __init__(self, latency: float = 0.0, chunk_size: int = 8):
+        self.latency = latency
+        self.chunk_size = chunk_size
+
+    def _reply(self, messages: List[dict], model: str, max_tokens: Optional[int] = None) -> str:
+        last = messages[-1]["content"] if messages else ""
+        reply = f"[{model}] {last}"
+        return reply[:max_tokens * 4] if max_tokens else reply
+
+    async def complete(self, messages: List[dict], model: str, **params) -> Completion:
+        await asyncio.sleep(self.latency)
+        text = self._reply(messages, model, params.get("max_tokens"))
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        return Completion(text, prompt_chars // 4, len(text) // 4)
+
+    async def stream(self, messages: List[dict], model: str, **params) -> AsyncIterator[str]:
+        text = self._reply(messages, model, params.get("max_tokens"))
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        delay = self.latency / max(1, len(chunks))
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+
+    async def aclose(self) -> None:
+        pass
+
+def cache_key(model: str, messages: List[dict], params: dict) -> str:
+    normalized = [
+        {"role": m["role"], "content": " ".join((m.get("content") or "").split())}
+        for m in messages
+    ]
+    payload = json.dumps(
+        {"model": model, "messages": normalized, "params": params},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class CompletionCache:
+    """
+    LRU/TTL cache of completion texts with an optional on-disk tier
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 8 * 1024 * 1024,
+        ttl_seconds: float = 3600.0,
+        disk_dir: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, created_at: float, text: str) -> None:
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key)[1].encode("utf-8"))
+        self._entries[key] = (created_at, text)
+        self._bytes += len(text.encode("utf-8"))
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.encode("utf-8"))
+            self.evictions += 1
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry["created_at"], entry["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key: str, created_at: float, text: str) -> None:
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": created_at, "text": text}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[0] > self.ttl_seconds:
+            self._bytes -= len(self._entries.pop(key)[1].encode("utf-8"))
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if self.disk_dir:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._remember(key, *entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry[1]
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, text: str) -> None:
+        created_at = time.time()
+        self._remember(key, created_at, text)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, created_at, text)
+            except OSError as e:
+                print(f"LLM cache write failed: {e}")
+
+    def metrics(self) -> dict:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+class _StreamEnd:
+    pass
+
+class _StreamFailure:
+    def __init__(self, error: Exception):
+        self.error = error
+
+class CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        # Streams the consumer closed before the end (also counted in calls)
+        self.cancelled = 0
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_buckets = LATENCY_BUCKETS
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency: float) -> None:
+        self.calls += 1
+        self.latency_seconds_total += latency
+        self.latency_seconds_max = max(self.latency_seconds_max, latency)
+        self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+class LLMGateway:
+    def __init__(
+        self,
+        backend,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        cache: Optional[CompletionCache] = None,
+        replay_chunk_size: int = 16
+    ):
+        self.backend = backend
+        self.cache = cache
+        self.replay_chunk_size = replay_chunk_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._stats: Dict[Tuple[str, str], CallStats] = {}
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        if os.getenv("LLM_BACKEND", "openai") == "stub":
+            backend = StubBackend(latency=float(os.getenv("LLM_STUB_LATENCY", "0")))
+        else:
+            backend = OpenAIBackend(timeout=float(os.getenv("LLM_TIMEOUT", "60")))
+        cache = None
+        if os.getenv("LLM_CACHE", "0") == "1":
+            cache = CompletionCache(
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+                ttl_seconds=float(os.getenv("LLM_CACHE_TTL", "3600")),
+                disk_dir=os.getenv("LLM_CACHE_DIR") or None
+            )
+        return cls(
+            backend,
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            cache=cache
+        )
+
+    def _stats_for(self, model: str, label: Optional[str]) -> CallStats:
+        key = (model, label or "")
+        if key not in self._stats:
+            self._stats[key] = CallStats()
+        return self._stats[key]
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retrying callers from synchronizing
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def complete(
+        self,
+        messages: List[dict],
+        model: str,
+        label: Optional[str] = None,
+        **params
+    ) -> str:
+        key = cache_key(model, messages, params) if self.cache else None
+        if key:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        stats = self._stats_for(model, label)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    completion = await self.backend.complete(messages, model, **params)
+            except Exception as e:
+                if attempt < self.max_retries and _is_retryable(e):
+                    stats.retries += 1
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                stats.errors += 1
+                raise
+            stats.observe(time.perf_counter() - started)
+            stats.prompt_tokens += completion.prompt_tokens
+            stats.completion_tokens += completion.completion_tokens
+            if key and completion.text:
+                await self.cache.put(key, completion.text)
+            return completion.text
+
+    async def stream(
+        self,
+        messages: List[dict],
+        model: str,
+        label: Optional[str] = None,
+        **params
+    ) -> AsyncIterator[str]:
+        """
+        Yields content deltas; retries only happen before the first delta
+        Stream completion_tokens count delivered chunks, roughly one token each
+        Streams closed early are counted with the time until they were closed
+        Only streams read to the end are cached
+        """
+        key = cache_key(model, messages, params) if self.cache else None
+        if key:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                for i in range(0, len(cached), self.replay_chunk_size):
+                    yield cached[i:i + self.replay_chunk_size]
+                return
+
+        stats = self._stats_for(model, label)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            delivered = 0
+            parts = []
+            queue: asyncio.Queue = asyncio.Queue()
+            producer = asyncio.ensure_future(self._read_upstream(messages, model, params, queue))
+            finished = False
+            try:
+                while True:
+                    item = await queue.get()
+                    if isinstance(item, _StreamEnd):
+                        break
+                    if isinstance(item, _StreamFailure):
+                        raise item.error
+                    delivered += 1
+                    if key:
+                        parts.append(item)
+                    yield item
+                finished = True
+            except Exception as e:
+                finished = True
+                if delivered == 0 and attempt < self.max_retries and _is_retryable(e):
+                    stats.retries += 1
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                stats.errors += 1
+                raise
+            finally:
+                # Aborts generation upstream if the consumer stopped early
+                producer.cancel()
+                stats.completion_tokens += delivered
+                if not finished:
+                    stats.cancelled += 1
+                    stats.observe(time.perf_counter() - started)
+            stats.observe(time.perf_counter() - started)
+            if key and parts:
+                await self.cache.put(key, "".join(parts))
+            return
+
+    async def _read_upstream(self, messages: List[dict], model: str, params: dict, queue: asyncio.Queue) -> None:
+        """
+        Moves upstream deltas into queue, holding a concurrency slot until upstream ends
+        """
+        try:
+            async with self._semaphore:
+                upstream = self.backend.stream(messages, model, **params)
+                try:
+                    async for delta in upstream:
+                        queue.put_nowait(delta)
+                finally:
+                    await upstream.aclose()
+        except Exception as e:
+            queue.put_nowait(_StreamFailure(e))
+        else:
+            queue.put_nowait(_StreamEnd())
+
+    def metrics(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "cache": self.cache.metrics() if self.cache else None,
+            "calls": [
+                {"model": model, "label": label, **vars(stats)}
+                for (model, label), stats in self._stats.items()
+            ]
+        }
+
+    async def aclose(self) -> None:
+        await self.backend.aclose()
+
+_gateway: Optional[LLMGateway] = None
+
+def get_gateway() -> LLMGateway:
+    """
+    Returns the process-wide gateway, created from the environment on first use
+    """
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway.from_env()
+    return _gateway
+
+async def close_gateway() -> None:
+    global _gateway
+    if _gateway is not None:
+        await _gateway.aclose()
+        _gateway = None
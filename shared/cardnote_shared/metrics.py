@@ -0,0 +1,363 @@
+"""
+Metrics Module
+
+Prometheus-style counters, gauges and histograms kept in process memory and
+rendered in the text exposition format at /metrics.
+
+MetricsMiddleware records per-route request counts, latency histograms and
+the number of requests in flight into the registry it is given (the module
+registry by default), as does span() within its requests. Routes are
+labelled with their path template, so label cardinality stays bounded.
+Components that already keep their own statistics (the LLM gateway) are
+exported by collectors that read them at scrape time. With METRICS_TRACE=1,
+code wrapped in span(name) is timed as well; the spans of a request are returned
+in its Server-Timing header and aggregated into a histogram.
+
+METRICS_ENABLED=0 switches recording off: the middleware passes requests
+straight through, metric updates return immediately and /metrics answers 404.
+"""
+
+import bisect
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi.responses import Response
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+TRACE_ENABLED = os.getenv("METRICS_TRACE", "0") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name, type, help and (name suffix, labels, value) samples of one metric family
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def _label_text(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in labels]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Registry:
+    def __init__(self, enabled: bool = METRICS_ENABLED, tracing: bool = TRACE_ENABLED):
+        self.enabled = enabled
+        self.tracing = enabled and tracing
+        self._metrics: Dict[str, "Metric"] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._request_metrics: Optional["RequestMetrics"] = None
+
+    def request_metrics(self) -> "RequestMetrics":
+        """
+        The HTTP request and span metrics of this registry, created on first use
+        """
+        if self._request_metrics is None:
+            self._request_metrics = RequestMetrics(self)
+        return self._request_metrics
+
+    def _register(self, metric: "Metric") -> "Metric":
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> "Counter":
+        return self._register(Counter(self, name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> "Gauge":
+        return self._register(Gauge(self, name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> "Histogram":
+        return self._register(Histogram(self, name, help, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, metric_type, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for suffix, labels, value in samples:
+                    lines.append(f"{name}{suffix}{_label_text(labels.items())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, registry: Registry, name: str, help: str, labels: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_text(self, values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        labels = list(zip(self.label_names, values))
+        if extra is not None:
+            labels.append(extra)
+        return _label_text(labels)
+
+class _Value:
+    __slots__ = ("registry", "value")
+
+    def __init__(self, registry: Registry):
+        self.registry = registry
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if self.registry.enabled:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        if self.registry.enabled:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        if self.registry.enabled:
+            self.value = value
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value(self.registry)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            yield f"{self.name}{self._label_text(values)} {_format_value(child.value)}"
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+class _Buckets:
+    __slots__ = ("registry", "bounds", "counts", "sum", "count")
+
+    def __init__(self, registry: Registry, bounds: Tuple[float, ...]):
+        self.registry = registry
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        if self.registry.enabled:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.sum += value
+            self.count += 1
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        registry: Registry,
+        name: str,
+        help: str,
+        labels: Sequence[str],
+        buckets: Sequence[float]
+    ):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _Buckets:
+        return _Buckets(self.registry, self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = self._label_text(values, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{self._label_text(values)} {_format_value(child.sum)}"
+            yield f"{self.name}_count{self._label_text(values)} {child.count}"
+
+class RequestMetrics:
+    def __init__(self, registry: Registry):
+        self.registry = registry
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+        )
+        self.request_seconds = registry.histogram(
+            "http_request_duration_seconds",
+            "Time to handle a request, including a streamed body",
+            ("method", "route")
+        )
+        self.in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled")
+        self.span_seconds = registry.histogram("span_duration_seconds", "Duration of traced spans", ("span",))
+
+registry = Registry()
+# Created up front so /metrics lists the request metrics before the first request
+registry.request_metrics()
+
+def dict_collector(
+    name: str,
+    help: str,
+    label: str,
+    read: Callable[[], Dict[str, float]]
+) -> Callable[[], Iterable[Family]]:
+    """
+    Exports a {label value: count} dict kept elsewhere as a counter
+    """
+    def collect() -> Iterator[Family]:
+        yield name, "counter", help, [("", {label: key}, value) for key, value in read().items()]
+
+    return collect
+
+def llm_collector(get_gateway: Callable[[], object]) -> Callable[[], Iterable[Family]]:
+    """
+    Exports the per model and persona (label) call statistics of an LLM gateway
+    """
+    def collect() -> Iterator[Family]:
+        calls = get_gateway().metrics()["calls"]
+        counters = [
+            ("llm_calls_total", "calls", "Successful LLM calls"),
+            ("llm_errors_total", "errors", "LLM calls that failed after retries"),
+            ("llm_retries_total", "retries", "LLM call attempts that were retried"),
+        ]
+        for name, field, help in counters:
+            yield name, "counter", help, [
+                ("", {"model": call["model"], "persona": call["label"]}, call[field]) for call in calls
+            ]
+        yield "llm_tokens_total", "counter", "LLM tokens by kind", [
+            ("", {"model": call["model"], "persona": call["label"], "kind": kind}, call[f"{kind}_tokens"])
+            for call in calls for kind in ("prompt", "completion")
+        ]
+        samples = []
+        for call in calls:
+            labels = {"model": call["model"], "persona": call["label"]}
+            cumulative = 0
+            for bound, count in zip(call["latency_buckets"] + [float("inf")], call["latency_counts"]):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, call["latency_seconds_total"]))
+            samples.append(("_count", labels, call["calls"]))
+        yield "llm_call_duration_seconds", "histogram", "Latency of successful LLM calls", samples
+
+    return collect
+
+# The request being handled: its metrics and, when tracing, the spans timed so far
+_trace: ContextVar[Optional[Tuple[RequestMetrics, Optional[List[Tuple[str, float]]]]]] = ContextVar(
+    "metrics_trace", default=None
+)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Times the enclosed block when tracing is on, into the registry of the
+    request being handled (the module registry outside requests)
+    """
+    trace = _trace.get()
+    metrics = trace[0] if trace is not None else registry.request_metrics()
+    if not metrics.registry.tracing:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.span_seconds.labels(name).observe(elapsed)
+        if trace is not None and trace[1] is not None:
+            trace[1].append((name, elapsed))
+
+def _server_timing(spans: List[Tuple[str, float]], total: float) -> bytes:
+    entries = [f"{name.replace(' ', '_')};dur={elapsed * 1000:.2f}" for name, elapsed in spans]
+    entries.append(f"app;dur={total * 1000:.2f}")
+    return ", ".join(entries).encode("latin-1", "replace")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request metrics (and spans when tracing)
+    """
+
+    def __init__(self, app, registry: Registry = registry):
+        self.app = app
+        self.registry = registry
+        self.metrics = registry.request_metrics()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        spans = [] if self.registry.tracing else None
+        token = _trace.set((self.metrics, spans))
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if spans is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(spans, time.perf_counter() - started)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            metrics.in_flight.dec()
+            _trace.reset(token)
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot inflate cardinality
+            path = route.path if route is not None and hasattr(route, "path") else "<unmatched>"
+            metrics.request_seconds.labels(scope["method"], path).observe(elapsed)
+            metrics.requests.labels(scope["method"], path, str(status)).inc()
+
+def metrics_response() -> Response:
+    if not registry.enabled:
+        return Response(status_code=404)
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from cardnote_shared.llm_gateway import CompletionCache, LLMGateway, LLMRetryableError, StubBackend
+
+class FlakyBackend(StubBackend):
+    """
+    Fails the first `failures` calls before answering
+    """
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def complete(self, messages, model, **params):
+        if self.failures:
+            self.failures -= 1
+            raise LLMRetryableError("upstream busy")
+        return await super().complete(messages, model, **params)
+
+    async def stream(self, messages, model, **params):
+        if self.failures:
+            self.failures -= 1
+            raise LLMRetryableError("upstream busy")
+        async for delta in super().stream(messages, model, **params):
+            yield delta
+
+MESSAGES = [{"role": "user", "content": "hello there, how are you today?"}]
+
+def calls(gateway: LLMGateway) -> dict:
+    return gateway.metrics()["calls"][0]
+
+def test_slow_stream_consumer_does_not_hold_a_concurrency_slot():
+    async def scenario():
+        gateway = LLMGateway(StubBackend(chunk_size=4), max_concurrency=1)
+        stream = gateway.stream(MESSAGES, model="m")
+        await anext(stream)
+        # The upstream has finished, so another call gets the only slot
+        await asyncio.wait_for(gateway.complete(MESSAGES, model="m"), timeout=1)
+        rest = [delta async for delta in stream]
+        assert rest
+
+    asyncio.run(scenario())
+
+def test_stream_closed_early_is_counted():
+    async def scenario():
+        gateway = LLMGateway(StubBackend(chunk_size=4))
+        stream = gateway.stream(MESSAGES, model="m", label="persona")
+        await anext(stream)
+        await anext(stream)
+        await stream.aclose()
+        stats = calls(gateway)
+        assert stats["calls"] == 1
+        assert stats["cancelled"] == 1
+        assert stats["completion_tokens"] == 2
+
+    asyncio.run(scenario())
+
+def test_stream_is_retried_before_the_first_delta():
+    async def scenario():
+        gateway = LLMGateway(FlakyBackend(failures=2), base_delay=0)
+        text = "".join([delta async for delta in gateway.stream(MESSAGES, model="m")])
+        assert text == "[m] hello there, how are you today?"
+        stats = calls(gateway)
+        assert (stats["calls"], stats["retries"], stats["errors"]) == (1, 2, 0)
+
+    asyncio.run(scenario())
+
+def test_errors_after_retries_are_raised():
+    async def scenario():
+        gateway = LLMGateway(FlakyBackend(failures=5), max_retries=1, base_delay=0)
+        with pytest.raises(LLMRetryableError):
+            await gateway.complete(MESSAGES, model="m")
+        assert calls(gateway)["errors"] == 1
+
+    asyncio.run(scenario())
+
+def test_cached_completion_is_replayed_for_streams():
+    async def scenario():
+        gateway = LLMGateway(StubBackend(), cache=CompletionCache())
+        first = await gateway.complete(MESSAGES, model="m")
+        # Whitespace differences normalize to the same key
+        spaced = [{"role": "user", "content": "hello  there, how are you\ttoday?"}]
+        assert await gateway.complete(spaced, model="m") == first
+        assert "".join([delta async for delta in gateway.stream(MESSAGES, model="m")]) == first
+        assert gateway.metrics()["cache"]["hits"] == 2
+
+    asyncio.run(scenario())
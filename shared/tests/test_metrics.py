@@ -0,0 +1,69 @@
+import asyncio
+
+from cardnote_shared.metrics import MetricsMiddleware, Registry, registry as default_registry, span
+
+def test_render_counters_gauges_and_histograms():
+    registry = Registry(enabled=True)
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    in_flight = registry.gauge("in_flight", "In flight")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    requests.labels("/cards").inc()
+    requests.labels("/cards").inc(2)
+    in_flight.set(3)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    text = registry.render()
+    assert 'requests_total{route="/cards"} 3' in text
+    assert "in_flight 3" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "latency_seconds_count 2" in text
+
+def test_disabled_registry_records_nothing():
+    registry = Registry(enabled=False)
+    counter = registry.counter("ignored_total", "Ignored")
+    counter.inc()
+    assert counter.labels().value == 0
+
+def test_middleware_labels_requests_with_the_route_template():
+    registry = Registry(enabled=True)
+
+    class Route:
+        path = "/cards/{card_id}"
+
+    async def app(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    middleware = MetricsMiddleware(app, registry=registry)
+    asyncio.run(middleware({"type": "http", "method": "POST", "path": "/cards/1"}, receive, send))
+    # Recorded in the middleware's own registry, labelled by template rather than path
+    text = registry.render()
+    assert 'http_requests_total{method="POST",route="/cards/{card_id}",status="201"} 1' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/cards/{card_id}"} 1' in text
+    assert "http_requests_in_flight 0" in text
+    assert 'route="/cards/{card_id}"' not in default_registry.render()
+
+def test_spans_are_timed_into_the_registry_of_the_request():
+    registry = Registry(enabled=True, tracing=True)
+    headers = []
+
+    async def app(scope, receive, send):
+        with span("db"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        headers.extend(message.get("headers", []))
+
+    middleware = MetricsMiddleware(app, registry=registry)
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/"}, None, send))
+    assert 'span_duration_seconds_count{span="db"} 1' in registry.render()
+    assert any(name == b"server-timing" and value.startswith(b"db;dur=") for name, value in headers)
@@ -88,7 +88,11 @@ export class SymbolBridge {
         cardId,
         ethereumAddress
       });
-      return response.data;
+      const { success, tokenId, jobId, error } = response.data;
+      if (!success || tokenId || !jobId) {
+        return { success, tokenId, error };
+      }
+      return await this.waitForMint(jobId);
     } catch (error) {
       console.error(`Failed to convert Symbol card ${cardId} to NFT:`, error);
       return {
@@ -98,6 +102,27 @@ export class SymbolBridge {
     }
   }
   
+  /**
+   * Polls a queued mint job until it is confirmed or fails
+   * @param jobId Mint job ID returned by convert-to-nft
+   * @param timeoutMs Give up after this many milliseconds
+   */
+  private async waitForMint(jobId: string, timeoutMs = 120000): Promise<{ success: boolean, tokenId?: string, error?: string }> {
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+      const response = await axios.get(`${this.config.apiUrl}/api/nft/jobs/${jobId}`);
+      const job = response.data;
+      if (job.status === 'confirmed') {
+        return { success: true, tokenId: job.token_id };
+      }
+      if (job.status === 'failed') {
+        return { success: false, error: job.error };
+      }
+      await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+    return { success: false, error: `Mint job ${jobId} is still pending` };
+  }
+  
   /**
    * Fetches user data from the Symbol blockchain
    * @param symbolAddress Symbol blockchain address
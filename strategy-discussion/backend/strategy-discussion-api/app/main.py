@@ -1,9 +1,18 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from datetime import datetime
-import psycopg
-from .models import PersonaConfig, Message, StrategyDocument, Discussion
-from .personas import PersonaManager
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+import asyncio
+import json
+import os
+import uuid
+from .models import PersonaConfig, Message, StrategyDocument, Discussion, RoundRequest
+from .personas import PersonaManager, PersonaStreamError
+from cardnote_shared.llm_gateway import get_gateway, close_gateway
+from .sessions import DiscussionSession, create_store, record_messages
+from cardnote_shared.metrics import MetricsMiddleware, registry, llm_collector, metrics_response, span
 
 app = FastAPI()
 
@@ -15,14 +24,32 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
 )
+# Outermost, so the latency covers CORS handling too
+app.add_middleware(MetricsMiddleware)
+registry.add_collector(llm_collector(get_gateway))
 
 persona_manager = PersonaManager()
-current_discussion: Discussion = None
+# Max persona replies generated in parallel within one round
+ROUND_CONCURRENCY = int(os.getenv("ROUND_CONCURRENCY", "4"))
+discussion_store = create_store()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await discussion_store.close()
+    await close_gateway()
 
 @app.get("/healthz")
 async def healthz():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+@app.get("/metrics/llm")
+async def llm_metrics():
+    return get_gateway().metrics()
+
 @app.get("/personas")
 async def get_personas():
     return {"personas": persona_manager.get_all_personas()}
@@ -40,57 +67,183 @@ async def remove_persona(name: str):
     except KeyError:
         raise HTTPException(status_code=404, detail="Persona not found")
 
+async def get_session(discussion_id: str) -> DiscussionSession:
+    session = await discussion_store.get(discussion_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Discussion not found")
+    return session
+
+@asynccontextmanager
+async def use_session(discussion_id: str) -> AsyncIterator[DiscussionSession]:
+    """
+    Holds the session for one turn: pinned against eviction and locked
+    """
+    async with discussion_store.checkout(discussion_id) as session:
+        if session is None:
+            raise HTTPException(status_code=404, detail="Discussion not found")
+        yield session
+
+def next_persona_for(discussion: Discussion) -> PersonaConfig:
+    personas = persona_manager.get_all_personas()
+    if not personas:
+        raise HTTPException(status_code=400, detail="No personas configured")
+    return personas[discussion.turn_count % len(personas)]
+
 @app.post("/discussion/start")
 async def start_discussion(document: StrategyDocument):
-    global current_discussion
-    current_discussion = Discussion(strategy_document=document)
-    
-    # Generate first response automatically
-    personas = persona_manager.get_all_personas()
-    next_persona = personas[0]
-    
-    response = await persona_manager.generate_response(
-        next_persona.name,
-        current_discussion.strategy_document.content,
-        []
-    )
-    
-    message = Message(
-        persona_name=next_persona.name,
-        content=response,
-        timestamp=datetime.now().isoformat()
-    )
-    current_discussion.messages.append(message)
+    async with discussion_store.create(document) as session:
+        discussion = session.discussion
+        # Generate first response automatically
+        next_persona = next_persona_for(discussion)
+        
+        response = await persona_manager.generate_response(
+            next_persona.name,
+            discussion.strategy_document.content,
+            [],
+            prompts=session.prompts
+        )
+        
+        message = Message(
+            persona_name=next_persona.name,
+            content=response,
+            timestamp=datetime.now().isoformat()
+        )
+        record_messages(session, [message])
+        with span("store.save"):
+            await discussion_store.save(session)
     
-    return {"status": "success", "discussion": current_discussion}
+    return {"status": "success", "discussion": discussion}
 
 @app.post("/discussion/next")
-async def next_message():
-    if not current_discussion or not current_discussion.is_active:
-        raise HTTPException(status_code=400, detail="No active discussion")
+async def next_message(discussion_id: str):
+    async with use_session(discussion_id) as session:
+        discussion = session.discussion
+        if not discussion.is_active:
+            raise HTTPException(status_code=400, detail="No active discussion")
 
-    personas = persona_manager.get_all_personas()
-    next_persona_index = len(current_discussion.messages) % len(personas)
-    next_persona = personas[next_persona_index]
+        next_persona = next_persona_for(discussion)
 
-    response = await persona_manager.generate_response(
-        next_persona.name,
-        current_discussion.strategy_document.content,
-        current_discussion.messages
-    )
+        response = await persona_manager.generate_response(
+            next_persona.name,
+            discussion.strategy_document.content,
+            discussion.messages,
+            prompts=session.prompts
+        )
 
-    message = Message(
-        persona_name=next_persona.name,
-        content=response,
-        timestamp=datetime.now().isoformat()
-    )
-    current_discussion.messages.append(message)
+        message = Message(
+            persona_name=next_persona.name,
+            content=response,
+            timestamp=datetime.now().isoformat()
+        )
+        record_messages(session, [message])
+        with span("store.save"):
+            await discussion_store.save(session)
     
     return {"message": message}
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/discussion/next/stream")
+async def stream_next_message(discussion_id: str):
+    session = await get_session(discussion_id)
+    discussion = session.discussion
+    if not discussion.is_active:
+        raise HTTPException(status_code=400, detail="No active discussion")
+    next_persona_for(discussion)
+
+    async def events():
+        # Checked out again for the turn itself, since the response may start long after this request
+        async with discussion_store.checkout(discussion_id) as session:
+            if session is None or not session.discussion.is_active:
+                yield sse_event("error", {"detail": "No active discussion"})
+                return
+
+            discussion = session.discussion
+            next_persona = next_persona_for(discussion)
+            tags = {"message_id": uuid.uuid4().hex, "persona_name": next_persona.name}
+            yield sse_event("start", tags)
+            parts = []
+            try:
+                async for delta in persona_manager.stream_response(
+                    next_persona.name,
+                    discussion.strategy_document.content,
+                    discussion.messages,
+                    prompts=session.prompts
+                ):
+                    parts.append(delta)
+                    yield sse_event("delta", {**tags, "delta": delta})
+            except PersonaStreamError as e:
+                # The partial reply is dropped rather than saved as a message
+                yield sse_event("error", {**tags, "detail": str(e)})
+                return
+
+            message = Message(
+                persona_name=next_persona.name,
+                content="".join(parts),
+                timestamp=datetime.now().isoformat()
+            )
+            record_messages(session, [message])
+            with span("store.save"):
+                await discussion_store.save(session)
+            yield sse_event("end", {**tags, "message": message.model_dump()})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/discussion/stop")
-async def stop_discussion():
-    global current_discussion
-    if current_discussion:
-        current_discussion.is_active = False
-    return {"status": "success", "message_count": len(current_discussion.messages) if current_discussion else 0}
+async def stop_discussion(discussion_id: str):
+    async with use_session(discussion_id) as session:
+        session.discussion.is_active = False
+        await discussion_store.save(session)
+    return {"status": "success", "message_count": session.discussion.turn_count}
+
+async def generate_round(session: DiscussionSession) -> List[Message]:
+    discussion = session.discussion
+    personas = persona_manager.get_all_personas()
+    start = discussion.turn_count % len(personas)
+    ordered = personas[start:] + personas[:start]
+    # Every persona in the round answers the discussion as it stood when the round began
+    history = list(discussion.messages)
+    semaphore = asyncio.Semaphore(ROUND_CONCURRENCY)
+
+    async def reply(persona: PersonaConfig) -> str:
+        async with semaphore:
+            return await persona_manager.generate_response(
+                persona.name,
+                discussion.strategy_document.content,
+                history,
+                prompts=session.prompts
+            )
+
+    responses = await asyncio.gather(*(reply(persona) for persona in ordered))
+    timestamp = datetime.now().isoformat()
+    messages = [
+        Message(persona_name=persona.name, content=response, timestamp=timestamp)
+        for persona, response in zip(ordered, responses)
+    ]
+    record_messages(session, messages)
+    return messages
+
+@app.post("/discussion/round")
+async def next_round(discussion_id: str, request: Optional[RoundRequest] = None):
+    async with use_session(discussion_id) as session:
+        discussion = session.discussion
+        if not discussion.is_active:
+            raise HTTPException(status_code=400, detail="No active discussion")
+        next_persona_for(discussion)
+
+        rounds = request.rounds if request else 1
+        messages = []
+        for _ in range(rounds):
+            if not discussion.is_active:
+                break
+            with span("discussion.round"):
+                messages.extend(await generate_round(session))
+        with span("store.save"):
+            await discussion_store.save(session)
+
+    return {"messages": messages}
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class PersonaConfig(BaseModel):
@@ -17,6 +17,11 @@ class StrategyDocument(BaseModel):
     content: str
 
 class Discussion(BaseModel):
+    id: str = ""
     strategy_document: StrategyDocument
     messages: List[Message] = []
     is_active: bool = True
+    turn_count: int = 0  # 発言の総数（古いメッセージが切り詰められても増え続ける）
+
+class RoundRequest(BaseModel):
+    rounds: int = Field(1, ge=1, le=5)  # 1ラウンド = 全ペルソナが1回ずつ発言
@@ -1,14 +1,26 @@
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional
 from .models import PersonaConfig, Message
-import os
-from datetime import datetime
-from openai import AsyncOpenAI
+from cardnote_shared.llm_gateway import get_gateway
+from .prompts import PromptBuilder, HISTORY_WINDOW, MAX_RESPONSE_CHARS
+from cardnote_shared.metrics import registry, span
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Initialize OpenAI client once for the module
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Replies replaced by the fallback message, by persona and reason (error or empty)
+persona_failures = registry.counter(
+    "persona_failures_total", "Persona replies replaced by the fallback message", ("persona", "reason")
+)
+
+class PersonaStreamError(Exception):
+    """
+    A streamed reply failed after part of it had been sent
+    """
+
+    def __init__(self, persona_name: str, emitted: int):
+        super().__init__(f"Persona {persona_name} reply was cut off after {emitted} chars")
+        self.persona_name = persona_name
+        self.emitted = emitted
 
 class PersonaManager:
     def __init__(self):
@@ -51,37 +63,87 @@ class PersonaManager:
     def get_all_personas(self) -> List[PersonaConfig]:
         return list(self.personas.values())
 
-    async def generate_response(self, persona_name: str, strategy_document: str, previous_messages: List[Message]) -> str:
+    async def _build_messages(
+        self,
+        persona_name: str,
+        strategy_document: str,
+        previous_messages: List[Message],
+        prompts: Optional[PromptBuilder]
+    ) -> List[dict]:
         persona = self.get_persona(persona_name)
         if not persona:
             raise ValueError(f"Persona {persona_name} not found")
 
-        context = f"""
-あなたは{persona.name}（{persona.role}）として、{persona.position}の立場から意見を述べてください。
-{persona.speaking_style}で発言してください。
-
-戦略文書:
-{strategy_document}
+        with span("prompts.build"):
+            if prompts is None:
+                prompts = PromptBuilder(strategy_document)
+                prompts.observe(previous_messages[-HISTORY_WINDOW:])
+            return await prompts.build(persona)
 
-これまでの議論:
-"""
-        for msg in previous_messages[-3:]:  # 直近3つのメッセージのみ参照
-            context += f"{msg.persona_name}: {msg.content}\n"
+    async def generate_response(
+        self,
+        persona_name: str,
+        strategy_document: str,
+        previous_messages: List[Message],
+        prompts: Optional[PromptBuilder] = None
+    ) -> str:
+        messages = await self._build_messages(persona_name, strategy_document, previous_messages, prompts)
 
         try:
-            response = await client.chat.completions.create(
+            content = await get_gateway().complete(
+                messages=messages,
                 model="gpt-4",
-                messages=[
-                    {"role": "system", "content": context},
-                    {"role": "user", "content": "この戦略について、あなたの立場からの意見を150文字以内で述べてください。"}
-                ],
+                label=persona_name,
                 max_tokens=200,
                 temperature=0.7
             )
             
-            if hasattr(response.choices[0].message, 'content'):
-                return response.choices[0].message.content[:150]  # 150文字制限を確実に守る
+            if content:
+                return content[:MAX_RESPONSE_CHARS]  # 150文字制限を確実に守る
+            persona_failures.labels(persona_name, "empty").inc()
             return "申し訳ありません。応答の生成に失敗しました。"
             
         except Exception as e:
+            print(f"Persona {persona_name} reply failed: {e!r}")
+            persona_failures.labels(persona_name, "error").inc()
             return f"申し訳ありません。応答の生成中にエラーが発生しました。: {str(e)}"
+
+    async def stream_response(
+        self,
+        persona_name: str,
+        strategy_document: str,
+        previous_messages: List[Message],
+        prompts: Optional[PromptBuilder] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yields the reply as it is generated, cut at MAX_RESPONSE_CHARS
+        The upstream request is closed as soon as the cap is reached. A failure
+        before any text yields the fallback message; after some text it raises
+        PersonaStreamError, since the reply is incomplete
+        """
+        messages = await self._build_messages(persona_name, strategy_document, previous_messages, prompts)
+        stream = get_gateway().stream(
+            messages=messages,
+            model="gpt-4",
+            label=persona_name,
+            max_tokens=200,
+            temperature=0.7
+        )
+        emitted = 0
+        try:
+            async for delta in stream:
+                delta = delta[:MAX_RESPONSE_CHARS - emitted]
+                if not delta:
+                    break
+                emitted += len(delta)
+                yield delta
+                if emitted >= MAX_RESPONSE_CHARS:
+                    break
+        except Exception as e:
+            print(f"Persona {persona_name} stream failed after {emitted} chars: {e!r}")
+            persona_failures.labels(persona_name, "error").inc()
+            if emitted:
+                raise PersonaStreamError(persona_name, emitted) from e
+            yield f"申し訳ありません。応答の生成中にエラーが発生しました。: {str(e)}"
+        finally:
+            await stream.aclose()
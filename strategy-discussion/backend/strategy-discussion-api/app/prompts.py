@@ -0,0 +1,105 @@
+"""
+Prompt assembly for persona replies.
+
+A PromptBuilder belongs to one discussion. The static part of the prompt is
+built once and reused for every turn: the strategy document comes first so
+every persona shares the longest possible identical prefix (which is what
+provider-side prompt caching keys on), followed by the persona's own
+instructions. Only the short history tail changes between turns, and it is
+maintained incrementally as messages are recorded.
+
+With PROMPT_COMPACTION=1, documents longer than PROMPT_DOCUMENT_BUDGET
+characters are summarized once per discussion and the summary is used in
+place of the full text, so context size stays bounded.
+"""
+
+import asyncio
+import os
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from cardnote_shared.llm_gateway import get_gateway
+from .models import Message, PersonaConfig
+
+MAX_RESPONSE_CHARS = 150
+HISTORY_WINDOW = 3  # 直近3つのメッセージのみ参照
+COMPACTION_ENABLED = os.getenv("PROMPT_COMPACTION", "0") == "1"
+DOCUMENT_BUDGET = int(os.getenv("PROMPT_DOCUMENT_BUDGET", "4000"))
+SUMMARY_MODEL = os.getenv("PROMPT_SUMMARY_MODEL", "gpt-4")
+
+INSTRUCTION = f"この戦略について、あなたの立場からの意見を{MAX_RESPONSE_CHARS}文字以内で述べてください。"
+
+def render_message(message: Message) -> str:
+    return f"{message.persona_name}: {message.content}\n"
+
+class PromptBuilder:
+    def __init__(
+        self,
+        strategy_document: str,
+        compaction: bool = COMPACTION_ENABLED,
+        document_budget: int = DOCUMENT_BUDGET
+    ):
+        self.strategy_document = strategy_document
+        self.compaction = compaction
+        self.document_budget = document_budget
+        self._document_message: Optional[dict] = None
+        self._persona_messages: Dict[tuple, dict] = {}
+        self._tail: deque = deque(maxlen=HISTORY_WINDOW)
+        self._summary_lock = asyncio.Lock()
+
+    def observe(self, messages: Iterable[Message]) -> None:
+        """
+        Appends newly recorded messages to the history tail
+        """
+        for message in messages:
+            self._tail.append(render_message(message))
+
+    async def _document(self) -> dict:
+        if self._document_message is not None:
+            return self._document_message
+        async with self._summary_lock:
+            if self._document_message is None:
+                content = self.strategy_document
+                if self.compaction and len(content) > self.document_budget:
+                    content = await self._summarize(content)
+                self._document_message = {"role": "system", "content": f"戦略文書:\n{content}"}
+        return self._document_message
+
+    async def _summarize(self, document: str) -> str:
+        try:
+            summary = await get_gateway().complete(
+                messages=[
+                    {"role": "system", "content": f"次の戦略文書を、重要な論点を残して{self.document_budget}文字以内に要約してください。"},
+                    {"role": "user", "content": document}
+                ],
+                model=SUMMARY_MODEL,
+                label="summary",
+                temperature=0
+            )
+        except Exception as e:
+            print(f"Strategy document summarization failed: {e}")
+            return document
+        return summary[:self.document_budget] if summary else document
+
+    def _persona(self, persona: PersonaConfig) -> dict:
+        # Keyed on the prompt fields so an edited persona gets a fresh prefix
+        key = (persona.name, persona.role, persona.position, persona.speaking_style)
+        message = self._persona_messages.get(key)
+        if message is None:
+            message = {
+                "role": "system",
+                "content": (
+                    f"あなたは{persona.name}（{persona.role}）として、{persona.position}の立場から意見を述べてください。\n"
+                    f"{persona.speaking_style}で発言してください。"
+                )
+            }
+            self._persona_messages[key] = message
+        return message
+
+    async def build(self, persona: PersonaConfig) -> List[dict]:
+        return [
+            await self._document(),
+            self._persona(persona),
+            {"role": "system", "content": "これまでの議論:\n" + "".join(self._tail)},
+            {"role": "user", "content": INSTRUCTION}
+        ]
@@ -0,0 +1,216 @@
+"""
+Discussion session store.
+
+Discussions are held in memory keyed by id, in LRU order with an idle TTL and
+a hard cap on the number of sessions, so memory stays bounded however many
+users are active. Each session carries an asyncio.Lock that serializes its
+turns. When DISCUSSION_DATABASE_URL is set, sessions are also written to
+PostgreSQL through a psycopg connection pool and reloaded after eviction or
+a restart.
+
+Turns take a session with checkout(), which pins it from lookup until the
+turn ends. Pinned sessions are skipped by eviction, so a session in use is
+never reloaded from PostgreSQL as a second copy with its own lock.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+from .models import Discussion, Message, StrategyDocument
+from .prompts import HISTORY_WINDOW, PromptBuilder
+
+MAX_SESSIONS = int(os.getenv("DISCUSSION_MAX_SESSIONS", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("DISCUSSION_TTL_SECONDS", "3600"))
+# Only the last few messages feed the prompts, older ones are kept for display
+MAX_MESSAGES_PER_SESSION = int(os.getenv("DISCUSSION_MAX_MESSAGES", "200"))
+DB_POOL_SIZE = int(os.getenv("DISCUSSION_DB_POOL_SIZE", "10"))
+
+class DiscussionSession:
+    __slots__ = ("discussion", "lock", "last_access", "prompts", "pins")
+
+    def __init__(self, discussion: Discussion):
+        self.discussion = discussion
+        self.lock = asyncio.Lock()
+        self.last_access = time.monotonic()
+        # Requests currently using the session; pinned sessions are not evicted
+        self.pins = 0
+        self.prompts = PromptBuilder(discussion.strategy_document.content)
+        self.prompts.observe(discussion.messages[-HISTORY_WINDOW:])
+
+def record_messages(session: DiscussionSession, messages: List[Message]) -> None:
+    discussion = session.discussion
+    session.prompts.observe(messages)
+    discussion.messages.extend(messages)
+    discussion.turn_count += len(messages)
+    if len(discussion.messages) > MAX_MESSAGES_PER_SESSION:
+        del discussion.messages[:-MAX_MESSAGES_PER_SESSION]
+
+class PostgresSessionBackend:
+    """
+    Sessions stored as JSON rows, read and written through a connection pool
+    so saves of different sessions do not queue behind one connection
+    """
+
+    def __init__(self, conninfo: str, max_size: int = DB_POOL_SIZE):
+        self.conninfo = conninfo
+        self.max_size = max_size
+        self._pool = None
+        self._connect_lock = asyncio.Lock()
+
+    async def _connection(self):
+        async with self._connect_lock:
+            if self._pool is None:
+                try:
+                    from psycopg_pool import AsyncConnectionPool
+                except ImportError as e:
+                    raise RuntimeError("Session persistence requires psycopg[pool]") from e
+
+                pool = AsyncConnectionPool(
+                    self.conninfo,
+                    min_size=1,
+                    max_size=self.max_size,
+                    kwargs={"autocommit": True},
+                    open=False
+                )
+                await pool.open()
+                async with pool.connection() as conn:
+                    await conn.execute(
+                        "CREATE TABLE IF NOT EXISTS discussions ("
+                        "id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+                    )
+                self._pool = pool
+        return self._pool.connection()
+
+    async def load(self, discussion_id: str) -> Optional[Discussion]:
+        async with await self._connection() as conn:
+            cursor = await conn.execute(
+                "SELECT data FROM discussions WHERE id = %s", (discussion_id,), prepare=True
+            )
+            row = await cursor.fetchone()
+        return Discussion.model_validate_json(row[0]) if row else None
+
+    async def save(self, discussion: Discussion) -> None:
+        async with await self._connection() as conn:
+            await conn.execute(
+                "INSERT INTO discussions (id, data, updated_at) VALUES (%s, %s, now()) "
+                "ON CONFLICT (id) DO UPDATE SET data = excluded.data, updated_at = now()",
+                (discussion.id, discussion.model_dump_json()),
+                prepare=True
+            )
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+class DiscussionStore:
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        backend: Optional[PostgresSessionBackend] = None
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._sessions: "OrderedDict[str, DiscussionSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        excess = len(self._sessions) - self.max_sessions
+        victims = []
+        for discussion_id, session in self._sessions.items():
+            expired = now - session.last_access > self.ttl_seconds
+            if not expired and excess <= 0:
+                break
+            if session.pins:
+                # In use; evicted on a later pass
+                continue
+            victims.append(discussion_id)
+            excess -= 1
+        for discussion_id in victims:
+            del self._sessions[discussion_id]
+
+    def _remember(self, discussion: Discussion) -> DiscussionSession:
+        session = DiscussionSession(discussion)
+        # Pinned while eviction runs, so the new session is never the one dropped
+        session.pins += 1
+        self._sessions[discussion.id] = session
+        self._evict()
+        session.pins -= 1
+        return session
+
+    def _touch(self, session: DiscussionSession) -> None:
+        session.last_access = time.monotonic()
+        if session.discussion.id in self._sessions:
+            self._sessions.move_to_end(session.discussion.id)
+
+    async def get(self, discussion_id: str) -> Optional[DiscussionSession]:
+        """
+        Looks a session up without pinning it; use checkout() for turns
+        """
+        self._evict()
+        session = self._sessions.get(discussion_id)
+        if session is None and self.backend is not None:
+            discussion = await self.backend.load(discussion_id)
+            # Another request may have loaded it while we were waiting
+            session = self._sessions.get(discussion_id)
+            if session is None and discussion is not None:
+                session = self._remember(discussion)
+        if session is not None:
+            self._touch(session)
+        return session
+
+    @asynccontextmanager
+    async def _hold(self, session: DiscussionSession) -> AsyncIterator[DiscussionSession]:
+        # The caller pinned the session before its last await
+        try:
+            async with session.lock:
+                yield session
+        finally:
+            session.pins -= 1
+            self._touch(session)
+
+    @asynccontextmanager
+    async def create(self, document: StrategyDocument) -> AsyncIterator[DiscussionSession]:
+        """
+        Creates a session and yields it pinned, with its lock held
+        """
+        session = self._remember(Discussion(id=uuid.uuid4().hex, strategy_document=document))
+        session.pins += 1
+        async with self._hold(session):
+            yield session
+
+    @asynccontextmanager
+    async def checkout(self, discussion_id: str) -> AsyncIterator[Optional[DiscussionSession]]:
+        """
+        Yields the session pinned, with its lock held, or None if it is unknown
+        """
+        session = await self.get(discussion_id)
+        if session is None:
+            yield None
+            return
+        # get() returned without awaiting after its lookup, so the session is still stored
+        session.pins += 1
+        async with self._hold(session):
+            yield session
+
+    async def save(self, session: DiscussionSession) -> None:
+        if self.backend is not None:
+            await self.backend.save(session.discussion)
+
+    async def close(self) -> None:
+        if self.backend is not None:
+            await self.backend.close()
+
+def create_store() -> DiscussionStore:
+    conninfo = os.getenv("DISCUSSION_DATABASE_URL")
+    return DiscussionStore(backend=PostgresSessionBackend(conninfo) if conninfo else None)
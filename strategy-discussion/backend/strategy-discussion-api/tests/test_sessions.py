@@ -0,0 +1,74 @@
+import asyncio
+
+from app.models import Discussion, StrategyDocument
+from app.sessions import DiscussionStore
+
+def document() -> StrategyDocument:
+    return StrategyDocument(content="Expand into the enterprise market")
+
+class MemoryBackend:
+    def __init__(self):
+        self.rows = {}
+
+    async def load(self, discussion_id):
+        await asyncio.sleep(0)
+        data = self.rows.get(discussion_id)
+        return Discussion.model_validate_json(data) if data else None
+
+    async def save(self, discussion):
+        self.rows[discussion.id] = discussion.model_dump_json()
+
+    async def close(self):
+        pass
+
+def test_eviction_skips_pinned_sessions_and_keeps_the_cap():
+    async def scenario():
+        store = DiscussionStore(max_sessions=2)
+        async with store.create(document()) as first:
+            # first is pinned at the LRU head; the others are evicted past it
+            for _ in range(3):
+                async with store.create(document()):
+                    pass
+            assert first.discussion.id in store._sessions
+            assert len(store._sessions) == 2
+        # Once released it is evictable again
+        async with store.create(document()) as last:
+            pass
+        assert set(store._sessions) == {first.discussion.id, last.discussion.id}
+
+    asyncio.run(scenario())
+
+def test_expired_sessions_are_evicted_but_not_while_pinned():
+    async def scenario():
+        store = DiscussionStore(ttl_seconds=0)
+        async with store.create(document()) as session:
+            assert await store.get(session.discussion.id) is session
+        session.last_access -= 1
+        assert await store.get(session.discussion.id) is None
+
+    asyncio.run(scenario())
+
+def test_pinned_session_is_not_reloaded_as_a_copy():
+    async def scenario():
+        backend = MemoryBackend()
+        store = DiscussionStore(max_sessions=1, backend=backend)
+        async with store.create(document()) as created:
+            await store.save(created)
+        discussion_id = created.discussion.id
+
+        async with store.checkout(discussion_id) as session:
+            # Pushing another session in would evict it if it were not pinned
+            async with store.create(document()):
+                pass
+            assert await store.get(discussion_id) is session
+            assert list(store._sessions) == [discussion_id]
+
+    asyncio.run(scenario())
+
+def test_checkout_of_unknown_discussion_yields_none():
+    async def scenario():
+        store = DiscussionStore(backend=MemoryBackend())
+        async with store.checkout("missing") as session:
+            assert session is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+
+from app import main, personas
+from app.models import StrategyDocument
+
+class FailingGateway:
+    def __init__(self, chunks_before_failure: int):
+        self.chunks_before_failure = chunks_before_failure
+
+    async def stream(self, messages, model, **params):
+        for i in range(self.chunks_before_failure):
+            yield f"part{i} "
+        raise RuntimeError("upstream reset")
+
+def stream_turn(discussion_id: str) -> str:
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/discussion/next/stream", params={"discussion_id": discussion_id})
+            return response.text
+
+    return asyncio.run(scenario())
+
+def start_discussion() -> str:
+    async def create():
+        async with main.discussion_store.create(StrategyDocument(content="Expand into Asia")) as session:
+            return session.discussion.id
+
+    return asyncio.run(create())
+
+def test_a_reply_cut_off_mid_stream_is_reported_and_not_saved(monkeypatch):
+    monkeypatch.setattr(personas, "get_gateway", lambda: FailingGateway(2))
+    discussion_id = start_discussion()
+    body = stream_turn(discussion_id)
+    assert "event: delta" in body
+    assert "event: error" in body and "cut off" in body
+    assert "event: end" not in body
+    session = asyncio.run(main.discussion_store.get(discussion_id))
+    assert session.discussion.messages == []
+
+def test_a_reply_failing_before_any_text_ends_with_the_fallback(monkeypatch):
+    monkeypatch.setattr(personas, "get_gateway", lambda: FailingGateway(0))
+    discussion_id = start_discussion()
+    body = stream_turn(discussion_id)
+    assert "event: end" in body and "event: error" not in body
+    session = asyncio.run(main.discussion_store.get(discussion_id))
+    assert len(session.discussion.messages) == 1
+    assert "upstream reset" in session.discussion.messages[0].content
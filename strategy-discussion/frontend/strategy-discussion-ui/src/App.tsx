@@ -63,7 +63,7 @@ function App() {
 
     setIsLoading(true);
     try {
-      const message = await api.getNextMessage();
+      const message = await api.getNextMessage(discussion.id);
       setDiscussion(prev => prev ? {
         ...prev,
         messages: [...prev.messages, message],
@@ -86,7 +86,8 @@ function App() {
 
   const stopDiscussion = async () => {
     try {
-      await api.stopDiscussion();
+      if (!discussion) return;
+      await api.stopDiscussion(discussion.id);
       setDiscussion(prev => prev ? { ...prev, is_active: false } : null);
     } catch (error) {
       if (error instanceof APIError) {
@@ -72,9 +72,9 @@ export const api = {
     }
   },
 
-  async getNextMessage(): Promise<Message> {
+  async getNextMessage(discussionId: string): Promise<Message> {
     try {
-      const response = await fetch(`${API_URL}/discussion/next`, {
+      const response = await fetch(`${API_URL}/discussion/next?discussion_id=${encodeURIComponent(discussionId)}`, {
         method: 'POST',
       });
       const data = await handleResponse<{ message: Message }>(response);
@@ -85,9 +85,59 @@ export const api = {
     }
   },
 
-  async stopDiscussion(): Promise<{ message_count: number }> {
+  async streamNextMessage(discussionId: string, onDelta: (delta: string) => void): Promise<Message> {
     try {
-      const response = await fetch(`${API_URL}/discussion/stop`, {
+      const response = await fetch(`${API_URL}/discussion/next/stream?discussion_id=${encodeURIComponent(discussionId)}`, {
+        method: 'POST',
+      });
+      if (!response.ok || !response.body) {
+        await handleResponse<unknown>(response);
+        throw new APIError('ストリームを開始できませんでした');
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          const event = block.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] ?? '{}');
+          if (event === 'delta') onDelta(data.delta);
+          if (event === 'end') return data.message;
+          if (event === 'error') throw new APIError(data.detail);
+        }
+      }
+      throw new APIError('ストリームが途中で終了しました');
+    } catch (error) {
+      console.error('Error streaming next message:', error);
+      throw new APIError('次のメッセージの取得に失敗しました');
+    }
+  },
+
+  async getNextRound(discussionId: string, rounds = 1): Promise<Message[]> {
+    try {
+      const response = await fetch(`${API_URL}/discussion/round?discussion_id=${encodeURIComponent(discussionId)}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ rounds }),
+      });
+      const data = await handleResponse<{ messages: Message[] }>(response);
+      return data.messages;
+    } catch (error) {
+      console.error('Error getting next round:', error);
+      throw new APIError('次のラウンドの取得に失敗しました');
+    }
+  },
+
+  async stopDiscussion(discussionId: string): Promise<{ message_count: number }> {
+    try {
+      const response = await fetch(`${API_URL}/discussion/stop?discussion_id=${encodeURIComponent(discussionId)}`, {
         method: 'POST',
       });
       return handleResponse<{ status: string; message_count: number }>(response);
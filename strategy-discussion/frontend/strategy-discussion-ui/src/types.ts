@@ -16,9 +16,11 @@ export interface Message {
 }
 
 export interface Discussion {
+  id: string;
   strategy_document: {
     content: string;
   };
   messages: Message[];
   is_active: boolean;
+  turn_count: number;
 }